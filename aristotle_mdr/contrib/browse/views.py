@@ -7,6 +7,7 @@ from django.http import HttpResponse, Http404, HttpResponseRedirect
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic import ListView, TemplateView
 from aristotle_mdr.utils import get_concepts_for_apps
+from aristotle_mdr.views.utils import CursorPaginationMixin
 
 
 class BrowseApps(TemplateView):
@@ -57,7 +58,7 @@ class BrowseModels(AppBrowser):
         return models
 
 
-class BrowseConcepts(AppBrowser):
+class BrowseConcepts(CursorPaginationMixin, AppBrowser):
     _model = None
     paginate_by = 25
 
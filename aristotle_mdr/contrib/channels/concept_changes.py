@@ -1,36 +1,68 @@
-from channels import Group
+from collections import OrderedDict
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
 from aristotle_mdr import models as MDR
 from aristotle_mdr import messages
 from aristotle_mdr.contrib.channels.utils import safe_object
 
 
+class Recipients(object):
+    """
+    Collects the notifications for a single change so each user is only sent
+    one, the first one that applies to them, then sends each notification to
+    all of its recipients at once.
+    """
+    def __init__(self):
+        self.notifications = OrderedDict()
+
+    def add(self, user_ids, notification):
+        for pk in user_ids:
+            self.notifications.setdefault(pk, notification)
+
+    def send(self, obj):
+        recipients = OrderedDict()
+        for pk, notification in self.notifications.items():
+            recipients.setdefault(notification, []).append(pk)
+        for notification, user_ids in recipients.items():
+            notification(recipient=user_ids, obj=obj)
+
+
 def concept_saved(message):
     instance = safe_object(message)
     if not instance:
         return
 
-    for p in instance.favourited_by.all():
-        if sorted(message['changed_fields']) == ['modified', 'superseded_by_id']:
-            messages.favourite_superseded(recipient=p.user, obj=instance)
+    superseded = sorted(message['changed_fields']) == ['modified', 'superseded_by_id']
+    recipients = Recipients()
+
+    favouriters = instance.favourited_by.values_list('user', flat=True)
+    if superseded:
+        recipients.add(favouriters, messages.favourite_superseded)
+    else:
+        recipients.add(favouriters, messages.favourite_updated)
+
+    if superseded:
+        ras = [s.registrationAuthority_id for s in instance.current_statuses()]
+        recipients.add(
+            User.objects.filter(registrar_in__in=ras).values_list('pk', flat=True).distinct(),
+            messages.registrar_item_superseded
+        )
+
+    if instance.workgroup_id:
+        viewers = instance.workgroup.viewers.values_list('pk', flat=True)
+        if message['created']:
+            recipients.add(viewers, messages.workgroup_item_new)
         else:
-            messages.favourite_updated(recipient=p.user, obj=instance)
-
-    for status in instance.current_statuses().all():
-        for registrar in status.registrationAuthority.registrars.all():
-            if sorted(message['changed_fields']) == ['modified', 'superseded_by_id']:
-                messages.registrar_item_superseded(recipient=registrar, obj=instance)
-
-    if instance.workgroup:
-        for user in instance.workgroup.viewers.all():
-            if message['created']:
-                messages.workgroup_item_new(recipient=user, obj=instance)
-            else:
-                messages.workgroup_item_updated(recipient=user, obj=instance)
+            recipients.add(viewers, messages.workgroup_item_updated)
+
+    recipients.send(instance)
+
     try:
         # This will fail during first load, and if admins delete aristotle.
         system = User.objects.get(username="aristotle")
         for post in instance.relatedDiscussions.all():
-            DiscussionComment.objects.create(
+            MDR.DiscussionComment.objects.create(
                 post=post,
                 body='The item "{name}" (id:{iid}) has been changed.\n\n\
                     <a href="{url}">View it on the main site.</a>.'.format(
@@ -40,7 +72,7 @@ def concept_saved(message):
                 ),
                 author=system,
             )
-    except:
+    except User.DoesNotExist:
         pass
 
 
@@ -54,19 +86,22 @@ def new_post_created(message, **kwargs):
     post = safe_object(message)
 
     if post:
-        for user in post.workgroup.members.all():
-            if user != post.author:
-                messages.new_post_created(post, user)
+        members = post.workgroup.members.exclude(pk=post.author_id).values_list('pk', flat=True).distinct()
+        messages.new_post_created(post, list(members))
 
 
 def status_changed(message, **kwargs):
     new_status = safe_object(message)
+    if not new_status:
+        return
     concept = new_status.concept
 
-    for status in concept.current_statuses().all():
-        for registrar in status.registrationAuthority.registrars.all():
-            if concept.statuses.filter(registrationAuthority=new_status.registrationAuthority).count() <= 1:
-                # 0 or 1 because the transaction may not be complete yet
-                messages.registrar_item_registered(recipient=registrar, obj=concept)
-            else:
-                messages.registrar_item_changed_status(recipient=registrar, obj=concept)
+    ras = [s.registrationAuthority_id for s in concept.current_statuses()]
+    registrars = User.objects.filter(registrar_in__in=ras).values_list('pk', flat=True).distinct()
+    recipients = Recipients()
+    if concept.statuses.filter(registrationAuthority=new_status.registrationAuthority).count() <= 1:
+        # 0 or 1 because the transaction may not be complete yet
+        recipients.add(registrars, messages.registrar_item_registered)
+    else:
+        recipients.add(registrars, messages.registrar_item_changed_status)
+    recipients.send(concept)
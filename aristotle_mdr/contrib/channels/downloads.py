@@ -0,0 +1,24 @@
+from django.conf import settings
+
+from aristotle_mdr.contrib.channels.utils import safe_object
+
+
+def prerender_pdf(message, **kwargs):
+    concept = safe_object(message)
+    if not concept:
+        return
+
+    from aristotle_mdr.downloader import cached_item_pdf
+    from aristotle_mdr.utils import get_download_template_path_for_item
+    item = concept.item
+    template = get_download_template_path_for_item(item, 'pdf')
+    cached_item_pdf(item, template, getattr(settings, 'PDF_PAGE_SIZE', "A4"))
+
+
+def run_download_job(message, **kwargs):
+    job = safe_object(message)
+    if not job:
+        return
+
+    from aristotle_mdr.downloader import build_download_job
+    build_download_job(job)
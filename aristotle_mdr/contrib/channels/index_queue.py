@@ -0,0 +1,135 @@
+"""
+A debounced queue of search index updates.
+
+Saving an item often triggers several updates for the same item in quick
+succession, such as when a cascade registration changes statuses and
+visibility, so updates are collected for a short window and de-duplicated,
+then written with one bulk update per search index.
+"""
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django import db
+
+import logging
+logger = logging.getLogger(__name__)
+
+CONCEPT = '_concept'
+
+
+def queue_delay():
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('INDEX_QUEUE_DELAY', 1)
+
+
+def model_label(model):
+    return "%s.%s" % (model._meta.app_label, model._meta.model_name)
+
+
+class IndexUpdateQueue(object):
+    def __init__(self, using='default', delay=None):
+        self.using = using
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.timer = None
+        # Maps a model label to a dictionary of primary keys and the last
+        # action for each, so an update followed by a delete only deletes.
+        self.pending = {}
+
+    def add(self, model, pk, action='update'):
+        from aristotle_mdr.models import _concept
+        if issubclass(model, _concept) and action == 'update':
+            # The concrete type of a concept is looked up once per batch
+            label = CONCEPT
+        else:
+            label = model_label(model)
+        with self.lock:
+            self.pending.setdefault(label, {})[pk] = action
+            if self.timer is None:
+                delay = self.delay if self.delay is not None else queue_delay()
+                self.timer = threading.Timer(delay, self.flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = None
+        if not pending:
+            return
+
+        message = {'using': self.using, 'update': {}, 'remove': {}}
+        for label, actions in pending.items():
+            for pk, action in actions.items():
+                message[action].setdefault(label, []).append(pk)
+
+        if getattr(settings, 'CHANNEL_LAYERS', None):
+            from channels import Channel
+            Channel("aristotle_mdr.contrib.channels.index_queue.process_batch").send(message)
+        else:
+            process_batch(message)
+
+    def flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to update the search index")
+        finally:
+            # The timer thread opens its own database connection
+            db.connection.close()
+
+
+def process_batch(message, **kwargs):
+    """
+    Writes a batch of queued updates to the search backend, with one query
+    and one bulk update for each search index.
+    """
+    from haystack import connections
+    from haystack.exceptions import NotHandled
+    from aristotle_mdr.signals import bump_search_index_generation
+    from aristotle_mdr.utils.spelling import spelling_dictionary
+
+    using = message.get('using', 'default')
+    connection = connections[using]
+    unified_index = connection.get_unified_index()
+    backend = connection.get_backend()
+
+    by_label = dict(message['update'])
+    concept_pks = by_label.pop(CONCEPT, [])
+    for label, pk in concept_types(concept_pks):
+        by_label.setdefault(label, []).append(pk)
+
+    for label, pks in by_label.items():
+        model = apps.get_model(label)
+        try:
+            index = unified_index.get_index(model)
+        except NotHandled:
+            continue
+        items = list(index.index_queryset(using=using).filter(pk__in=pks))
+        if items:
+            backend.update(index, items)
+
+    for label, pks in message['remove'].items():
+        for pk in pks:
+            backend.remove("%s.%s" % (label, pk))
+
+    bump_search_index_generation(using)
+    if using == spelling_dictionary.using:
+        # This is already out of the request, so the dictionary is built here
+        spelling_dictionary.refresh(force=False, wait=False)
+
+
+def concept_types(concept_pks):
+    """
+    Returns ``(model label, pk)`` pairs for the concrete type of each concept.
+    """
+    from aristotle_mdr.models import _concept
+    return [
+        (model_label(item.__class__), item.pk)
+        for item in _concept.objects.filter(pk__in=concept_pks).select_subclasses()
+    ]
+
+
+index_update_queue = IndexUpdateQueue()
@@ -10,5 +10,12 @@ channel_routing = [
     module_route("aristotle_mdr.contrib.channels.concept_changes.concept_saved"),
     module_route("aristotle_mdr.contrib.channels.concept_changes.new_comment_created"),
     module_route("aristotle_mdr.contrib.channels.concept_changes.new_post_created"),
+    module_route("aristotle_mdr.contrib.channels.concept_changes.status_changed"),
+    module_route("aristotle_mdr.contrib.channels.action_signals.review_request_created"),
+    module_route("aristotle_mdr.contrib.channels.action_signals.review_request_updated"),
+    module_route("aristotle_mdr.contrib.channels.index_queue.process_batch"),
+    module_route("aristotle_mdr.contrib.channels.downloads.prerender_pdf"),
+    module_route("aristotle_mdr.contrib.channels.downloads.run_download_job"),
+    module_route("aristotle_mdr.contrib.channels.sitemaps.refresh_sitemap"),
     include(haystack_routing)
 ]
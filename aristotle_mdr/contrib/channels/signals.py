@@ -2,6 +2,7 @@ from django.db.models.signals import post_save, post_delete, pre_delete, m2m_cha
 # from reversion.signals import post_revision_commit
 import haystack.signals as signals  # .RealtimeSignalProcessor as RealtimeSignalProcessor
 from haystack_channels.signals import ChannelsRealTimeAsyncSignalProcessor
+from aristotle_mdr.contrib.channels.index_queue import index_update_queue
 # Don't import aristotle_mdr.models directly, only pull in whats required,
 #  otherwise Haystack gets into a circular dependancy.
 
@@ -11,30 +12,57 @@ from haystack_channels.signals import ChannelsRealTimeAsyncSignalProcessor
 
 
 class AristotleChannelsSignalProcessor(ChannelsRealTimeAsyncSignalProcessor):
-    def setup(self):
-        super(AristotleChannelsSignalProcessor, self).setup()
+    """
+    Queues index updates, so that repeated updates to the same items within
+    a short window are sent to the search backend as one bulk update.
 
+    The haystack-channels handlers, which send each save as its own message,
+    are not connected.
+    """
+    def setup(self):
         from aristotle_mdr.models import ReviewRequest, concept_visibility_updated
 
+        post_save.connect(self.handle_save)
+        # Removals are queued before the delete, while the concrete type of
+        # a concept can still be looked up.
+        pre_delete.connect(self.handle_delete)
         post_save.connect(self.update_visibility_review_request, sender=ReviewRequest)
         m2m_changed.connect(self.update_visibility_review_request, sender=ReviewRequest.concepts.through)
         concept_visibility_updated.connect(self.handle_concept_recache)
 
-    def teardown(self):  # pragma: no cover
+    def teardown(self):
+        from aristotle_mdr.models import ReviewRequest, concept_visibility_updated
+        post_save.disconnect(self.handle_save)
+        pre_delete.disconnect(self.handle_delete)
+        post_save.disconnect(self.update_visibility_review_request, sender=ReviewRequest)
+        m2m_changed.disconnect(self.update_visibility_review_request, sender=ReviewRequest.concepts.through)
+        concept_visibility_updated.disconnect(self.handle_concept_recache)
+
+    def is_indexed(self, model):
         from aristotle_mdr.models import _concept
-        post_save.disconnect(self.handle_concept_save, sender=_concept)
-        # post_revision_commit.disconnect(self.handle_concept_revision)
-        pre_delete.disconnect(self.handle_concept_delete, sender=_concept)
-        super(AristotleSignalProcessor, self).teardown()
+        from haystack import connections
+        return issubclass(model, _concept) or model in connections['default'].get_unified_index().get_indexed_models()
 
-    def handle_concept_recache(self, concept, **kwargs):
+    def handle_save(self, sender, instance, **kwargs):
+        if self.is_indexed(sender):
+            index_update_queue.add(sender, instance.pk)
+
+    def handle_delete(self, sender, instance, **kwargs):
         from aristotle_mdr.models import _concept
-        instance = concept.item
-        self.handle_save(instance.__class__, instance)
+        if sender is _concept:
+            # Removing needs the concrete type, which won't exist after the delete
+            item = _concept.objects.filter(pk=instance.pk).select_subclasses().first()
+            if item is None:
+                return
+            sender = item.__class__
+        if self.is_indexed(sender):
+            index_update_queue.add(sender, instance.pk, action='remove')
+
+    def handle_concept_recache(self, concept, **kwargs):
+        index_update_queue.add(concept.__class__, concept.pk)
 
     def update_visibility_review_request(self, sender, instance, **kwargs):
-        from aristotle_mdr.models import ReviewRequest
+        from aristotle_mdr.models import ReviewRequest, _concept
         assert(sender in [ReviewRequest, ReviewRequest.concepts.through])
-        for concept in instance.concepts.all():
-            obj = concept.item
-            self.handle_save(obj.__class__, obj, **kwargs)
+        for pk in instance.concepts.values_list('pk', flat=True):
+            index_update_queue.add(_concept, pk)
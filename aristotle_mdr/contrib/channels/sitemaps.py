@@ -0,0 +1,3 @@
+def refresh_sitemap(message, **kwargs):
+    from aristotle_mdr.views.sitemaps import refresh_sitemap_page, sitemap_page_for_concept
+    refresh_sitemap_page(sitemap_page_for_concept(message['concept_id']))
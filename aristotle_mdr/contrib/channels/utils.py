@@ -1,22 +1,235 @@
-from channels import Channel
+"""
+Dispatches signal handlers, such as notification fan-out, outside of the
+request that triggered them.
+
+Messages refer to objects by ``(app_label, model_name, pk)`` so they can be
+sent to another process. The backend used is set with the ``SIGNAL_DISPATCHER``
+key of ``ARISTOTLE_SETTINGS``, and is one of:
+
+* ``'inline'`` - run the handler immediately, in the current thread.
+* ``'channels'`` - send the message to a channel layer consumer.
+* ``'threads'`` - run the handler in a pool of background threads.
+* ``'queue'`` - run the handler in a single background worker that drops
+  duplicate messages that are waiting to be run.
+* the python path to a subclass of ``Dispatcher``.
+
+If no backend is set, ``'channels'`` is used if ``CHANNEL_LAYERS`` is
+configured, otherwise handlers are run inline.
+
+Handlers run in background threads use their own database connection, so
+they can't see changes that haven't been committed. Messages fired inside a
+transaction are held until it is committed, and are dropped if it, or the
+savepoint they were fired in, is rolled back.
+"""
+import threading
+
+from django.apps import apps
 from django.conf import settings
+from django import db
+from django.utils import six
+from django.utils.module_loading import import_string
+from django.utils.six.moves import queue
+
+import logging
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "aristotle_mdr.contrib.channels.%s"
+
+
+def serialise_object(obj):
+    return {
+        'pk': obj.pk,
+        'app_label': obj._meta.app_label,
+        'model_name': obj._meta.model_name,
+    }
+
+
+def build_message(obj=None, **kwargs):
+    # Signal arguments like 'sender' and 'signal' can't be sent to another process
+    message = dict(
+        (key, value) for key, value in kwargs.items()
+        if isinstance(value, (six.string_types, six.integer_types, bool, float, list, tuple, type(None)))
+    )
+    if obj is not None:
+        message['__object__'] = serialise_object(obj)
+    return message
+
+
+def run_handler(channel, message):
+    import_string(CHANNEL_PREFIX % channel)(message)
+
+
+def hook_transaction_methods(connection):
+    """
+    Wraps the methods of a database connection that end transactions and
+    savepoints, so the functions passed to ``on_commit`` are run or dropped
+    along with the changes made before them.
+    """
+    connection.commit_hooks = []
+    commit = connection.commit
+    rollback = connection.rollback
+    savepoint_rollback = connection.savepoint_rollback
+    close = connection.close
+
+    def hooked_commit():
+        commit()
+        if not connection.in_atomic_block:
+            hooks, connection.commit_hooks = connection.commit_hooks, []
+            for savepoint_ids, func in hooks:
+                func()
+
+    def hooked_rollback():
+        rollback()
+        connection.commit_hooks = []
+
+    def hooked_savepoint_rollback(sid):
+        savepoint_rollback(sid)
+        connection.commit_hooks = [
+            (savepoint_ids, func) for savepoint_ids, func in connection.commit_hooks
+            if sid not in savepoint_ids
+        ]
+
+    def hooked_close():
+        # A connection closed in a transaction rolls it back
+        connection.commit_hooks = []
+        close()
+
+    connection.commit = hooked_commit
+    connection.rollback = hooked_rollback
+    connection.savepoint_rollback = hooked_savepoint_rollback
+    connection.close = hooked_close
+
+
+def on_commit(func):
+    """
+    Calls ``func`` once the current transaction has been committed, or straight
+    away outside a transaction, like ``transaction.on_commit`` from Django 1.9.
+    It is dropped if the transaction, or a savepoint it was called in, is
+    rolled back.
+    """
+    connection = db.connection
+    if not connection.in_atomic_block:
+        func()
+        return
+    if not hasattr(connection, 'commit_hooks'):
+        hook_transaction_methods(connection)
+    # Connections belong to a thread, so each thread holds its own functions
+    connection.commit_hooks.append((set(connection.savepoint_ids), func))
+
+
+class Dispatcher(object):
+    def dispatch(self, channel, message, obj=None):
+        raise NotImplementedError  # pragma: no cover
+
+
+class InlineDispatcher(Dispatcher):
+    def dispatch(self, channel, message, obj=None):
+        if obj is not None:
+            # Save looking the object up again
+            message['__object__']['object'] = obj
+        run_handler(channel, message)
+
+
+class ChannelsDispatcher(Dispatcher):
+    def dispatch(self, channel, message, obj=None):
+        from channels import Channel
+        Channel(CHANNEL_PREFIX % channel).send(message)
+
+
+def run_in_background(channel, message):
+    try:
+        run_handler(channel, message)
+    except Exception:
+        logger.exception("Failed to run %s in the background" % channel)
+    finally:
+        # Background threads open their own database connection
+        db.connection.close()
+
+
+class BackgroundDispatcher(Dispatcher):
+    """
+    A dispatcher that runs handlers in other threads. Messages fired inside a
+    transaction are held until it has been committed, so the handlers can
+    read what was saved.
+    """
+    def dispatch(self, channel, message, obj=None):
+        on_commit(lambda: self.send(channel, message))
+
+    def send(self, channel, message):
+        raise NotImplementedError  # pragma: no cover
+
+
+class ThreadPoolDispatcher(BackgroundDispatcher):
+    workers = 4
+
+    def __init__(self):
+        from multiprocessing.pool import ThreadPool
+        super(ThreadPoolDispatcher, self).__init__()
+        self.pool = ThreadPool(self.workers)
+
+    def send(self, channel, message):
+        self.pool.apply_async(run_in_background, (channel, message))
+
+
+class QueueDispatcher(BackgroundDispatcher):
+    """
+    Runs messages one at a time in a background thread. Identical messages
+    that are waiting to be run, such as several saves of the same item, are
+    only run once.
+    """
+    def __init__(self, start_worker=True):
+        super(QueueDispatcher, self).__init__()
+        self.queue = queue.Queue()
+        self.waiting = set()
+        self.lock = threading.Lock()
+        if start_worker:
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+
+    def message_key(self, channel, message):
+        return (channel, repr(sorted(message.items())))
+
+    def send(self, channel, message):
+        key = self.message_key(channel, message)
+        with self.lock:
+            if key in self.waiting:
+                return
+            self.waiting.add(key)
+        self.queue.put((key, channel, message))
+
+    def work(self):
+        while True:
+            key, channel, message = self.queue.get()
+            with self.lock:
+                self.waiting.discard(key)
+            run_in_background(channel, message)
+
+
+DISPATCHERS = {
+    'inline': InlineDispatcher,
+    'channels': ChannelsDispatcher,
+    'threads': ThreadPoolDispatcher,
+    'queue': QueueDispatcher,
+}
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_dispatcher():
+    name = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('SIGNAL_DISPATCHER', None)
+    if name is None:
+        name = 'channels' if getattr(settings, 'CHANNEL_LAYERS', None) else 'inline'
+    with _dispatchers_lock:
+        if name not in _dispatchers:
+            dispatcher_class = DISPATCHERS.get(name) or import_string(name)
+            _dispatchers[name] = dispatcher_class()
+        return _dispatchers[name]
 
 
 def fire(channel, obj=None, **kwargs):
-    from django.utils.module_loading import import_string
-    message = kwargs
-    if hasattr(settings, 'CHANNEL_LAYERS'):
-        message.update({
-            '__object___': {
-                'pk': instance.pk,
-                'app_label': instance._meta.app_label,
-                'model_name': instance._meta.model_name,
-            }
-        })
-        c = Channel("aristotle_mdr.contrib.channels.%s" % channel).send(message)
-    else:
-        message.update({'__object__': {'object': obj}})
-        import_string("aristotle_mdr.contrib.channels.%s" % channel)(message)
+    message = build_message(obj, **kwargs)
+    get_dispatcher().dispatch(channel, message, obj=obj)
 
 
 def safe_object(message):
@@ -7,12 +7,14 @@ These are based on the Identification metadamodel region in ISO/IEC 11179 Part 3
 
 from django.apps import apps
 from django.db import models
+from django.db.models.signals import post_save, post_delete
 from django.utils.encoding import python_2_unicode_compatible  # Python 2
 from django.utils.translation import ugettext_lazy as _
 
 from model_utils.models import TimeStampedModel
 
 from aristotle_mdr import models as MDR
+from aristotle_mdr import perms
 
 
 class Namespace(TimeStampedModel):
@@ -43,3 +45,10 @@ class ScopedIdentifier(TimeStampedModel):
 
     def __str__(self):
         return u"{0}:{1}:{2}".format(self.namespace.naming_authority.name, self.identifier, self.version)
+
+
+def identifier_changed(sender, instance, **kwargs):
+    # Invalidates the cached page of the item this is shown on
+    perms.bump_generations('concept', [instance.concept_id])
+post_save.connect(identifier_changed, sender=ScopedIdentifier)
+post_delete.connect(identifier_changed, sender=ScopedIdentifier)
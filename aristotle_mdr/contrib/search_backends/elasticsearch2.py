@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
-# This file is unchanged from the branch below and is excluded from pep8
-# If this file is changed, then now we own it and it will have to meet pep8
+# Based on the Elasticsearch 2 backend from the branch below. It has since been
+# changed to keep the index behind an alias so it can be rebuilt without
+# downtime, and it is maintained here and checked by pep8 like the rest of the code.
 # From: https://github.com/Terr/django-haystack/blob/es2-integration-branch/haystack/backends/elasticsearch2_backend.py
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import copy
 import datetime
 import re
 import warnings
+from collections import defaultdict
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
@@ -108,7 +111,11 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
             raise ImproperlyConfigured("You must specify a 'INDEX_NAME' in your settings for connection '%s'." % connection_alias)
 
         self.conn = elasticsearch.Elasticsearch(connection_options['URL'], timeout=self.timeout, **connection_options.get('KWARGS', {}))
+        # ``index_name`` is an alias that points to a timestamped index, so a
+        # full rebuild can load a new index and swap the alias over to it.
         self.index_name = connection_options['INDEX_NAME']
+        # The index being loaded by a rebuild, if any, that updates are written to.
+        self.rebuild_index_name = None
         self.log = logging.getLogger('haystack')
         self.setup_complete = False
         self.existing_mapping = {}
@@ -129,18 +136,14 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
             if not self.silently_fail:
                 raise
 
-        unified_index = haystack.connections[self.connection_alias].get_unified_index()
-        self.content_field_name, field_mapping = self.build_schema(unified_index.all_searchfields())
-        current_mapping = {
-            'modelresult': {
-                'properties': field_mapping,
-            }
-        }
+        current_mapping = self.build_mapping()
 
         if current_mapping != self.existing_mapping:
             try:
                 # Make sure the index is there first.
-                self.conn.indices.create(index=self.index_name, body=self.DEFAULT_SETTINGS, ignore=400)
+                if not self.conn.indices.exists(index=self.index_name):
+                    index_name = self.create_index(self.new_index_name())
+                    self.conn.indices.put_alias(index=index_name, name=self.index_name)
                 self.conn.indices.put_mapping(index=self.index_name, doc_type='modelresult', body=current_mapping)
                 self.existing_mapping = current_mapping
             except Exception:
@@ -149,6 +152,115 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
 
         self.setup_complete = True
 
+    def build_mapping(self):
+        unified_index = haystack.connections[self.connection_alias].get_unified_index()
+        self.content_field_name, field_mapping = self.build_schema(unified_index.all_searchfields())
+        return {
+            'modelresult': {
+                'properties': field_mapping,
+            }
+        }
+
+    def new_index_name(self):
+        return "%s_%s" % (self.index_name, datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S%f'))
+
+    def create_index(self, name, bulk_load=False):
+        body = copy.deepcopy(self.DEFAULT_SETTINGS)
+        if bulk_load:
+            # Replicas and refreshes only slow down a bulk load into an index
+            # that isn't searched yet, they are restored when it goes live.
+            body['settings']['number_of_replicas'] = 0
+            body['settings']['refresh_interval'] = '-1'
+        body['mappings'] = self.build_mapping()
+        self.conn.indices.create(index=name, body=body)
+        return name
+
+    def aliased_indices(self):
+        """
+        Returns the names of the indices currently behind the alias.
+        """
+        try:
+            return list(self.conn.indices.get_alias(name=self.index_name).keys())
+        except NotFoundError:
+            return []
+
+    def rebuilding_indices(self):
+        """
+        Returns the names of the indices being loaded by a rebuild in any
+        process, which are the timestamped indices the alias doesn't point to.
+        """
+        new_index = re.compile(r'^%s_\d{20}$' % re.escape(self.index_name))
+        names = self.conn.indices.get_settings(index='%s_*' % self.index_name).keys()
+        aliased = self.aliased_indices()
+        return [name for name in names if new_index.match(name) and name not in aliased]
+
+    def rebuild_document_ids(self):
+        """
+        Yields the id of every document in the index being rebuilt.
+        """
+        self.conn.indices.refresh(index=self.rebuild_index_name)
+        query = {'_source': False, 'query': {'match_all': {}}}
+        for doc in scan(self.conn, query=query, index=self.rebuild_index_name, doc_type='modelresult'):
+            yield doc['_id']
+
+    def start_rebuild(self):
+        """
+        Creates a new, empty index for a full rebuild and directs updates from
+        this backend to it. Searches keep using the live index until
+        ``finish_rebuild`` is called. Returns the name of the new index, which
+        can be passed to ``resume_rebuild`` by other processes loading it.
+
+        Other processes keep writing to the live index during the rebuild.
+        Items they delete are also removed from the new index, as ``remove``
+        deletes from every index being rebuilt.
+        """
+        self.rebuild_index_name = self.create_index(self.new_index_name(), bulk_load=True)
+        return self.rebuild_index_name
+
+    def resume_rebuild(self, name):
+        self.rebuild_index_name = name
+
+    def finish_rebuild(self):
+        """
+        Makes the rebuilt index live by atomically moving the alias to it,
+        then deletes the indices that the alias pointed to before.
+
+        An index from before aliases were used has the name the alias needs,
+        so it is deleted before the alias is created, and searches fail until
+        the alias is added. Later rebuilds don't have this gap.
+        """
+        new_index = self.rebuild_index_name
+        old_indices = self.aliased_indices()
+
+        replicas = 1
+        if old_indices:
+            old_settings = self.conn.indices.get_settings(index=old_indices[0])
+            replicas = old_settings[old_indices[0]]['settings']['index'].get('number_of_replicas', replicas)
+        elif self.conn.indices.exists(index=self.index_name):
+            self.conn.indices.delete(index=self.index_name)
+
+        self.conn.indices.put_settings(index=new_index, body={
+            'index': {'number_of_replicas': replicas, 'refresh_interval': '1s'}
+        })
+        self.conn.indices.refresh(index=new_index)
+
+        actions = [{'remove': {'index': old, 'alias': self.index_name}} for old in old_indices]
+        actions.append({'add': {'index': new_index, 'alias': self.index_name}})
+        self.conn.indices.update_aliases(body={'actions': actions})
+
+        for old in old_indices:
+            self.conn.indices.delete(index=old, ignore=404)
+        self.rebuild_index_name = None
+        self.setup_complete = False
+
+    def abort_rebuild(self):
+        """
+        Discards a rebuild, leaving the live index untouched.
+        """
+        if self.rebuild_index_name:
+            self.conn.indices.delete(index=self.rebuild_index_name, ignore=404)
+        self.rebuild_index_name = None
+
     def update(self, index, iterable, commit=True):
         """
         Updates the backend when given a SearchIndex and a collection of
@@ -194,6 +306,11 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
                                extra={"data": {"index": index,
                                                "object": get_identifier(obj)}})
 
+        if self.rebuild_index_name:
+            # The index is refreshed once the rebuild finishes
+            bulk(self.conn, prepped_docs, index=self.rebuild_index_name, doc_type='modelresult')
+            return
+
         bulk(self.conn, prepped_docs, index=self.index_name, doc_type='modelresult')
 
         if commit:
@@ -222,7 +339,9 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
                 return
 
         try:
-            self.conn.delete(index=self.index_name, doc_type='modelresult', id=doc_id, ignore=404)
+            # Deleted items mustn't come back when a rebuilt index goes live
+            for index_name in [self.index_name] + self.rebuilding_indices():
+                self.conn.delete(index=index_name, doc_type='modelresult', id=doc_id, ignore=404)
 
             if commit:
                 self.conn.indices.refresh(index=self.index_name)
@@ -244,7 +363,8 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
 
         try:
             if models is None:
-                self.conn.indices.delete(index=self.index_name, ignore=404)
+                for index_name in self.aliased_indices() or [self.index_name]:
+                    self.conn.indices.delete(index=index_name, ignore=404)
                 self.setup_complete = False
                 self.existing_mapping = {}
                 self.content_field_name = None
@@ -274,6 +394,24 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
             else:
                 self.log.error("Failed to clear Elasticsearch index: %s", e, exc_info=True)
 
+    def spelling_frequencies(self):
+        """
+        Returns the number of documents each word of the indexed text is in,
+        for the spelling dictionary. The text is stemmed as it is indexed, so
+        the words are counted from the stored text rather than the index terms.
+        """
+        from aristotle_mdr.utils.spelling import words
+
+        if not self.setup_complete:
+            self.setup()
+
+        counts = defaultdict(int)
+        query = {'_source': [self.content_field_name], 'query': {'match_all': {}}}
+        for doc in scan(self.conn, query=query, index=self.index_name, doc_type='modelresult'):
+            for word in set(words(doc['_source'].get(self.content_field_name))):
+                counts[word] += 1
+        return counts
+
     def build_search_kwargs(self, query_string, sort_by=None, start_offset=0, end_offset=None,
                             fields='', highlight=False, facets=None,
                             date_facets=None, query_facets=None,
@@ -487,9 +625,9 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
             #     incompatible change on the distance filter formating
             if elasticsearch.VERSION >= (1, 0, 0):
                 distance = "%(dist).6f%(unit)s" % {
-                        'dist': dwithin['distance'].km,
-                        'unit': "km"
-                    }
+                    'dist': dwithin['distance'].km,
+                    'unit': "km"
+                }
             else:
                 distance = dwithin['distance'].km
 
@@ -712,8 +850,8 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
                     else:
                         additional_fields[string_key] = self._to_python(value)
 
-                del(additional_fields[DJANGO_CT])
-                del(additional_fields[DJANGO_ID])
+                del additional_fields[DJANGO_CT]
+                del additional_fields[DJANGO_ID]
 
                 if 'highlight' in raw_result:
                     additional_fields['highlighted'] = raw_result['highlight'].get(content_field, '')
@@ -824,21 +962,22 @@ class Elasticsearch2SearchBackend(BaseSearchBackend):
 
         return value
 
+
 # DRL_FIXME: Perhaps move to something where, if none of these
 #            match, call a custom method on the form that returns, per-backend,
 #            the right type of storage?
 DEFAULT_FIELD_MAPPING = {'type': 'string', 'analyzer': 'snowball'}
 FIELD_MAPPINGS = {
     'edge_ngram': {'type': 'string', 'analyzer': 'edgengram_analyzer'},
-    'ngram':      {'type': 'string', 'analyzer': 'ngram_analyzer'},
-    'date':       {'type': 'date'},
-    'datetime':   {'type': 'date'},
-
-    'location':   {'type': 'geo_point'},
-    'boolean':    {'type': 'boolean'},
-    'float':      {'type': 'float'},
-    'long':       {'type': 'long'},
-    'integer':    {'type': 'long'},
+    'ngram': {'type': 'string', 'analyzer': 'ngram_analyzer'},
+    'date': {'type': 'date'},
+    'datetime': {'type': 'date'},
+
+    'location': {'type': 'geo_point'},
+    'boolean': {'type': 'boolean'},
+    'float': {'type': 'float'},
+    'long': {'type': 'long'},
+    'integer': {'type': 'long'},
 }
 
 
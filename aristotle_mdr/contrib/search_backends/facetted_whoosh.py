@@ -1,6 +1,8 @@
 # From https://github.com/aptivate/intranet-search/blob/master/whoosh_backend.py
-# This is an improved Whoosh backend that speeds up Whoosh spell checking dramatically!
-# It also provides facetting
+# This is an improved Whoosh backend that provides facetting.
+# Spelling suggestions for the search page come from aristotle_mdr.utils.spelling,
+# which is built from the terms of the index, so words aren't added to a Whoosh
+# spell checker as documents are written.
 # 2016-11-27 - Module inherited to add Python 3 functionality
 
 from collections import defaultdict
@@ -9,7 +11,6 @@ from haystack.backends import BaseEngine
 from whoosh import analysis, fields, highlight, query, scoring
 from whoosh.reading import TermNotFound
 from whoosh.support.levenshtein import distance
-from whoosh.writing import AsyncWriter
 
 
 def CUSTOM_MERGE_SMALL(writer, segments):
@@ -35,46 +36,9 @@ def CUSTOM_MERGE_SMALL(writer, segments):
     return unchanged_segments
 
 
-class WriterWithFasterSpellingUpdate(AsyncWriter):
-    def __init__(self, spelling_storage, spelling_checker, spelling_fields,
-                 index, delay=0.25, writerargs=None):
-        super(WriterWithFasterSpellingUpdate, self).__init__(
-            index, delay, writerargs
-        )
-        self.spelling_storage = spelling_storage
-        self.spelling_checker = spelling_checker
-        self.spelling_fields = spelling_fields
-
-    def update_document(self, **doc):
-        # remove every word previously found in the document from the
-        # spelling index
-        from haystack.constants import ID
-        super(WriterWithFasterSpellingUpdate, self).update_document(**doc)
-        document_schema = self.index.schema
-        for fieldname in self.spelling_fields:
-            field = document_schema[fieldname]
-            """
-            def generate_words():
-                for w, freq, weight, valuestring in field.index(doc[fieldname]):
-                    yield w
-            """
-            if fieldname in doc:
-                words = [w for w, freq, weight, valuestring
-                         in field.index(doc[fieldname])]
-                self.spelling_checker.add_words(words)
-
-
 class CustomWhooshBackend(original_backend.WhooshSearchBackend):
     silently_fail = False
 
-    def setup(self):
-        super(CustomWhooshBackend, self).setup()
-        self.spelling_fields = (self.content_field_name, 'job_title')
-
-    def get_writer(self, index):
-        return WriterWithFasterSpellingUpdate(
-            self.storage, self.get_spell_checker(), self.spelling_fields, index
-        )
     """
     def update(self, index, iterable, commit=True):
         import pdb; pdb.set_trace();
@@ -90,6 +54,30 @@ class CustomWhooshBackend(original_backend.WhooshSearchBackend):
         sp.add_field(self.index, 'job_title')
         """
 
+    def spelling_frequencies(self):
+        """
+        Returns the number of documents each term of the indexed text is in,
+        for the spelling dictionary.
+        """
+        if not self.setup_complete:
+            self.setup()
+
+        self.index = self.index.refresh()
+        with self.index.reader() as reader:
+            if not reader.has_deletions():
+                return dict(
+                    (term, info.doc_frequency())
+                    for term, info in reader.iter_field(self.content_field_name)
+                )
+            # Terms of deleted documents are kept until their segment is
+            # merged, so the stored text of the others is counted instead.
+            from aristotle_mdr.utils.spelling import words
+            counts = defaultdict(int)
+            for stored in reader.all_stored_fields():
+                for word in set(words(stored.get(self.content_field_name))):
+                    counts[word] += 1
+            return counts
+
     def search(self, query_string, sort_by=None, start_offset=0, end_offset=None,
                fields='', highlight=False, facets=None, date_facets=None, query_facets=None,
                narrow_queries=None, spelling_query=None, within=None,
@@ -350,6 +338,10 @@ class FixedWhooshSearchBackend(CustomWhooshBackend):
                 facet_term_counts = []
                 for term, term_results in facet_results.items():
                     facet_term_counts.append((term, len(term_results)))
+                # Order by count and keep the top terms, as Elasticsearch does
+                facet_term_counts.sort(key=lambda x: -x[1])
+                if extra_options.get('size'):
+                    facet_term_counts = facet_term_counts[:extra_options['size']]
                 facets_out['fields'][facet_fieldname] = facet_term_counts
             results['facets'] = facets_out
         return results
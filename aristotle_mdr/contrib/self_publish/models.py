@@ -49,5 +49,14 @@ def concept_visibility_query(user):
     return q
 
 
+def concept_next_visibility_change(concept_ids):
+    return dict(
+        PublicationRecord.objects.filter(
+            concept__in=concept_ids,
+            publication_date__gt=now()
+        ).values_list('concept', 'publication_date')
+    )
+
+
 post_save.connect(MDR.recache_concept_states, sender=PublicationRecord)
 post_delete.connect(MDR.recache_concept_states, sender=PublicationRecord)
@@ -9,6 +9,7 @@ import datetime
 
 from reversion import revisions as reversion
 
+from aristotle_mdr import perms
 from aristotle_mdr.contrib.self_publish import models as pub
 from aristotle_mdr.forms.search import PermissionSearchQuerySet
 from aristotle_mdr.models import ObjectClass, Workgroup
@@ -21,7 +22,8 @@ setup_test_environment()
         settings.ARISTOTLE_SETTINGS,
         EXTRA_CONCEPT_QUERYSETS={
             'visible': ['aristotle_mdr.contrib.self_publish.models.concept_visibility_query'],
-            'public': ['aristotle_mdr.contrib.self_publish.models.concept_public_query']
+            'public': ['aristotle_mdr.contrib.self_publish.models.concept_public_query'],
+            'next_change': ['aristotle_mdr.contrib.self_publish.models.concept_next_visibility_change'],
         }
     )
 )
@@ -123,6 +125,11 @@ class TestSelfPublishing(utils.LoggedInViewPages, TestCase):
 
         self.item = ObjectClass.objects.get(pk=self.item.pk)
         self.assertFalse(self.item._is_public)
+        # Cached permissions for the item are only kept until it is published
+        self.assertEqual(
+            perms.next_visibility_changes([self.item.pk]),
+            {self.item.pk: (now() + datetime.timedelta(days=100)).date()}
+        )
 
         self.logout()
         response = self.client.get(self.item.get_absolute_url())
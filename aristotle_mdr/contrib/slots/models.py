@@ -7,6 +7,7 @@ These are based on the Slots definition in ISO/IEC 11179 Part 3 - 7.2.2.4
 
 from django.apps import apps
 from django.db import models
+from django.db.models.signals import post_save, post_delete
 from django.contrib.contenttypes.models import ContentType
 from django.conf.global_settings import LANGUAGES
 from django.core.exceptions import ValidationError
@@ -18,6 +19,7 @@ from model_utils import Choices
 from model_utils.models import TimeStampedModel
 
 from aristotle_mdr import models as MDR
+from aristotle_mdr import perms
 
 
 @python_2_unicode_compatible  # Python 2
@@ -83,3 +85,10 @@ def concepts_with_similar_slots(user, _type=None, value=None, slot=None):
         slots = slots.exclude(id=slot.concept.id)
 
     return slots
+
+
+def slot_changed(sender, instance, **kwargs):
+    # Invalidates the cached page of the item this is shown on
+    perms.bump_generations('concept', [instance.concept_id])
+post_save.connect(slot_changed, sender=Slot)
+post_delete.connect(slot_changed, sender=Slot)
@@ -1,5 +1,7 @@
 from aristotle_mdr.utils import get_download_template_path_for_item
 import cgi
+import hashlib
+import os
 
 try:  # Python 2
     from cStringIO import StringIO as BytesIO
@@ -7,118 +9,311 @@ except:  # Python 3
     from io import BytesIO
 
 
-from django.http import HttpResponse, Http404
+from django.core.files.base import ContentFile
+from django.db.models import Max, Q
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 # from django.shortcuts import render
 from django.template.loader import select_template
 from django.template import Context
+from django.template.defaultfilters import slugify
+from django.utils import timezone, translation
 from django.utils.safestring import mark_safe
 
 import xhtml2pdf.pisa as pisa
 import csv
+import json
 from aristotle_mdr.contrib.help.models import ConceptHelp
+from aristotle_mdr.storage import private_storage
+
+import logging
+logger = logging.getLogger(__name__)
 
 
 item_register = {
-    'csv': {'aristotle_mdr': ['valuedomain']},
+    'csv-vd': {'aristotle_mdr': ['valuedomain']},
+    'tsv-vd': {'aristotle_mdr': ['valuedomain']},
+    'jsonl-vd': {'aristotle_mdr': ['valuedomain']},
+    'csv': '__all__',
+    'tsv': '__all__',
+    'jsonl': '__all__',
     'pdf': '__template__'
 }
 
+# Streamed formats: (content type, file extension)
+STREAMING_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'tsv': ('text/tab-separated-values', 'tsv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+DOWNLOAD_CHUNK_SIZE = 1000
+PDF_CACHE_DIRECTORY = 'aristotle_mdr/pdf_cache'
+BULK_PDF_TEMPLATE = 'aristotle_mdr/downloads/pdf/bulk_download.html'
 
-def render_to_pdf(template_src, context_dict, debug_as_html=False):
+VALUE_HEADER = ['value', 'meaning', 'start date', 'end date', 'role']
+ITEM_HEADER = ['id', 'type', 'name', 'version', 'definition', 'workgroup', 'modified']
+
+
+class Echo(object):
+    """A file-like object that returns what is written to it, for streaming csv rows"""
+    def write(self, value):
+        return value
+
+
+def iterate_in_chunks(queryset, order_field=None, chunk_size=None):
+    """
+    Yields every object in a queryset, reading ``chunk_size`` rows at a time
+    using keyset pagination, so memory use stays flat for any size of queryset.
+    Defaults to ``DOWNLOAD_CHUNK_SIZE`` rows.
+    """
+    chunk_size = chunk_size or DOWNLOAD_CHUNK_SIZE
+    ordering = [order_field, 'pk'] if order_field else ['pk']
+    queryset = queryset.order_by(*ordering)
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            if order_field:
+                value = getattr(last, order_field)
+                chunk = chunk.filter(
+                    Q(**{order_field + '__gt': value}) |
+                    Q(**{order_field: value, 'pk__gt': last.pk})
+                )
+            else:
+                chunk = chunk.filter(pk__gt=last.pk)
+        chunk = list(chunk[:chunk_size])
+        for obj in chunk:
+            yield obj
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+
+
+def stream_rows(file_format, header, rows):
+    if file_format == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(header, row)), default=str) + "\n"
+    else:
+        delimiter = '\t' if file_format == 'tsv' else ','
+        writer = csv.writer(Echo(), delimiter=delimiter)
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+
+def streaming_response(file_format, filename, header, rows):
+    content_type, extension = STREAMING_FORMATS[file_format]
+    response = StreamingHttpResponse(stream_rows(file_format, header, rows), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (filename, extension)
+    return response
+
+
+def value_rows(value_domain):
+    for role, values in [("permissible", value_domain.permissibleValues), ("supplementary", value_domain.supplementaryValues)]:
+        for v in iterate_in_chunks(values.all(), order_field='order'):
+            yield [v.value, v.meaning, v.start_date, v.end_date, role]
+
+
+def item_rows(querysets):
+    for qs in querysets:
+        for item in iterate_in_chunks(qs.select_related('workgroup')):
+            yield [
+                item.pk,
+                item._meta.verbose_name,
+                item.name,
+                item.version,
+                item.definition,
+                item.workgroup.name if item.workgroup else '',
+                item.modified,
+            ]
+
+
+def render_html(template_src, context_dict):
     # If the request template doesnt exist, we will give a default one.
     template = select_template([
         template_src,
         'aristotle_mdr/downloads/pdf/managedContent.html'
     ])
-    context = Context(context_dict)
-    html = template.render(context)
+    return template.render(Context(context_dict))
 
-    if debug_as_html:
-        return HttpResponse(html)
+
+def html_to_pdf(html):
+    """Converts rendered html to a PDF, returning None if it could not be created."""
     result = BytesIO()
     pdf = pisa.pisaDocument(
         BytesIO(html.encode("UTF-8")),
         result,
         encoding='UTF-8'
     )
-    if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
+    if pdf.err:
+        return None
+    return result.getvalue()
+
+
+def render_pdf(template_src, context_dict):
+    """
+    Renders a template to a PDF, returning the rendered html and the PDF
+    contents, or None for the PDF if it could not be created.
+    """
+    html = render_html(template_src, context_dict)
+    return html, html_to_pdf(html)
+
+
+def render_to_pdf(template_src, context_dict, debug_as_html=False):
+    if debug_as_html:
+        return HttpResponse(render_html(template_src, context_dict))
+
+    html, pdf = render_pdf(template_src, context_dict)
+    if pdf is not None:
+        return HttpResponse(pdf, content_type='application/pdf')
     return HttpResponse('We had some errors<pre>%s</pre>' % cgi.escape(html))
 
 
+def item_pdf_context(item, page_size, view=''):
+    subItems = item.get_download_items()
+    return {
+        'item': item,
+        'subitems': subItems,
+        'tableOfContents': len(subItems) > 0,
+        'view': view,
+        'pagesize': page_size,
+    }
+
+
+def item_pdf_cache_path(item, template, page_size, view=''):
+    """
+    Returns the path in private storage for the cached PDF of an item, which
+    may not be public. The path contains a hash of everything that goes into
+    the PDF, so it changes whenever the item, its registration statuses or any
+    of its download items change.
+    """
+    inputs = [
+        item.pk, item.modified,
+        item.statuses.aggregate(Max('modified'))['modified__max'],
+        template, page_size, view, translation.get_language(),
+    ]
+    for metadata_type, qs in item.get_download_items():
+        inputs.append(sorted(qs.values_list('pk', 'modified')))
+    digest = hashlib.sha256(json.dumps(inputs, default=str).encode('utf-8')).hexdigest()
+    return "%s/%s/%s.pdf" % (PDF_CACHE_DIRECTORY, item.pk, digest)
+
+
+def cached_item_pdf(item, template, page_size, view=''):
+    """
+    Returns the contents of the PDF for an item, from storage if nothing that
+    goes into it has changed since it was last rendered. Returns None if the
+    PDF could not be rendered.
+    """
+    path = item_pdf_cache_path(item, template, page_size, view)
+    if private_storage.exists(path):
+        with private_storage.open(path) as f:
+            return f.read()
+
+    html, pdf = render_pdf(template, item_pdf_context(item, page_size, view))
+    if pdf is None:
+        return None
+
+    # Anything else cached for this item is out of date
+    directory = os.path.dirname(path)
+    if private_storage.exists(directory):
+        for filename in private_storage.listdir(directory)[1]:
+            private_storage.delete("%s/%s" % (directory, filename))
+    private_storage.save(path, ContentFile(pdf))
+    return pdf
+
+
 def download(request, download_type, item):
     """Built in download method"""
     template = get_download_template_path_for_item(item, download_type)
     from django.conf import settings
     page_size = getattr(settings, 'PDF_PAGE_SIZE', "A4")
     if download_type == "pdf":
-        subItems = item.get_download_items()
-        return render_to_pdf(
-            template,
-            {
-                'item': item,
-                'subitems': subItems,
-                'tableOfContents': len(subItems) > 0,
-                'view': request.GET.get('view', '').lower(),
-                'pagesize': request.GET.get('pagesize', page_size),
-            }
-        )
+        page_size = request.GET.get('pagesize', page_size)
+        view = request.GET.get('view', '').lower()
+        pdf = cached_item_pdf(item, template, page_size, view)
+        if pdf is not None:
+            return HttpResponse(pdf, content_type='application/pdf')
+        return render_to_pdf(template, item_pdf_context(item, page_size, view))
 
-    elif download_type == "csv-vd":
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="%s.csv"' % (
-            item.name
-        )
-
-        writer = csv.writer(response)
-        writer.writerow(['value', 'meaning', 'start date', 'end date', 'role'])
-        for v in item.permissibleValues.all():
-            writer.writerow(
-                [v.value, v.meaning, v.start_date, v.end_date, "permissible"]
-            )
-        for v in item.supplementaryValues.all():
-            writer.writerow(
-                [v.value, v.meaning, v.start_date, v.end_date, "supplementary"]
-            )
+    elif download_type.endswith("-vd"):
+        from aristotle_mdr.models import ValueDomain
+        if not isinstance(item, ValueDomain):
+            # Only value domains have values to download
+            raise Http404
+        return streaming_response(download_type[:-3], item.name, VALUE_HEADER, value_rows(item))
 
-        return response
+    elif download_type in STREAMING_FORMATS:
+        querysets = [item.__class__.objects.filter(pk=item.pk)]
+        querysets += [qs.visible(request.user) for metadata_type, qs in item.get_download_items()]
+        return streaming_response(download_type, item.name, ITEM_HEADER, item_rows(querysets))
 
 
 def items_for_bulk_download(items, request):
-    iids = {}
-    item_querysets = {}  # {PythonClass:{help:ConceptHelp,qs:Queryset}}
+    return user_items_for_bulk_download(items, request.user)
+
+
+def user_items_for_bulk_download(items, user):
+    """
+    Returns the items, and the extra items they include, that a user can
+    download, grouped by type as ``{PythonClass: {'help': ConceptHelp, 'qs': Queryset}}``.
+    """
+    from aristotle_mdr.models import _concept
+    items = [item for item in items if item]
+    visible = set(
+        _concept.objects.filter(pk__in=[item.pk for item in items]).visible(user).values_list('pk', flat=True)
+    )
+    items_by_type = {}
     for item in items:
-        if item and item.can_view(request.user):
-            if item.__class__ not in iids.keys():
-                iids[item.__class__] = []
-            iids[item.__class__].append(item.pk)
-
-            for metadata_type, qs in item.get_download_items():
-                if metadata_type not in item_querysets.keys():
-                    item_querysets[metadata_type] = {'help': None, 'qs': qs}
-                else:
-                    item_querysets[metadata_type]['qs'] |= qs
-
-    for metadata_type, ids_set in iids.items():
-        query = metadata_type.objects.filter(pk__in=ids_set)
-        if metadata_type not in item_querysets.keys():
-            item_querysets[metadata_type] = {'help': None, 'qs': query}
+        if item.pk in visible:
+            items_by_type.setdefault(item.__class__, []).append(item)
+
+    item_querysets = {}
+
+    def include(metadata_type, qs):
+        if metadata_type in item_querysets:
+            item_querysets[metadata_type]['qs'] |= qs
         else:
-            item_querysets[metadata_type]['qs'] |= query
+            item_querysets[metadata_type] = {'help': None, 'qs': qs}
+
+    for metadata_type, typed_items in items_by_type.items():
+        include(metadata_type, metadata_type.objects.filter(pk__in=[item.pk for item in typed_items]))
+        for included_type, qs in metadata_type.get_bulk_download_items(typed_items):
+            include(included_type, qs)
 
-    for metadata_type in item_querysets.keys():
-        item_querysets[metadata_type]['qs'] = item_querysets[metadata_type]['qs'].distinct().visible(request.user)
-        item_querysets[metadata_type]['help'] = ConceptHelp.objects.filter(
-            app_label=metadata_type._meta.app_label,
-            concept_type=metadata_type._meta.model_name
-        ).first()
+    help_pages = {}
+    for help_page in ConceptHelp.objects.filter(
+        app_label__in=set(t._meta.app_label for t in item_querysets.keys()),
+        concept_type__in=set(t._meta.model_name for t in item_querysets.keys()),
+    ):
+        help_pages.setdefault((help_page.app_label, help_page.concept_type), help_page)
+
+    for metadata_type, included in item_querysets.items():
+        included['qs'] = included['qs'].distinct().visible(user)
+        included['help'] = help_pages.get((metadata_type._meta.app_label, metadata_type._meta.model_name))
 
     return item_querysets
 
 
+def default_bulk_subtitle(items):
+    _list = "<li>" + "</li><li>".join([item.name for item in items if item]) + "</li>"
+    return mark_safe("Generated from the following metadata items:<ul>%s<ul>" % _list)
+
+
+def bulk_pdf_context(items, item_querysets, title, subtitle, page_size):
+    return {
+        'title': title,
+        'subtitle': subtitle,
+        'items': items,
+        'included_items': sorted(
+            [(k, v) for k, v in item_querysets.items()],
+            key=lambda k_v: k_v[0]._meta.model_name
+        ),
+        'pagesize': page_size,
+    }
+
+
 def bulk_download(request, download_type, items, title=None, subtitle=None):
     """Built in download method"""
-    template = 'aristotle_mdr/downloads/pdf/bulk_download.html'  # %(download_type)
+    template = BULK_PDF_TEMPLATE
     from django.conf import settings
     page_size = getattr(settings, 'PDF_PAGE_SIZE', "A4")
 
@@ -134,25 +329,76 @@ def bulk_download(request, download_type, items, title=None, subtitle=None):
         if request.GET.get('subtitle', None):
             subtitle = request.GET.get('subtitle')
         else:
-            _list = "<li>" + "</li><li>".join([item.name for item in items if item]) + "</li>"
-            subtitle = mark_safe("Generated from the following metadata items:<ul>%s<ul>" % _list)
+            subtitle = default_bulk_subtitle(items)
 
     if download_type == "pdf":
-        subItems = []
-
         debug_as_html = bool(request.GET.get('html', ''))
 
         return render_to_pdf(
             template,
-            {
-                'title': title,
-                'subtitle': subtitle,
-                'items': items,
-                'included_items': sorted(
-                    [(k, v) for k, v in item_querysets.items()],
-                    key=lambda k_v: k_v[0]._meta.model_name
-                ),
-                'pagesize': request.GET.get('pagesize', page_size),
-            },
+            bulk_pdf_context(items, item_querysets, title, subtitle, request.GET.get('pagesize', page_size)),
             debug_as_html=debug_as_html
         )
+
+    elif download_type.endswith("-vd"):
+        from aristotle_mdr.models import ValueDomain
+
+        def rows():
+            for value_domain in item_querysets.get(ValueDomain, {}).get('qs', ValueDomain.objects.none()):
+                for row in value_rows(value_domain):
+                    yield [value_domain.pk, value_domain.name] + row
+        return streaming_response(
+            download_type[:-3], title, ['value domain id', 'value domain'] + VALUE_HEADER, rows()
+        )
+
+    elif download_type in STREAMING_FORMATS:
+        querysets = [
+            v['qs'] for k, v in sorted(item_querysets.items(), key=lambda k_v: k_v[0]._meta.model_name)
+        ]
+        return streaming_response(download_type, title, ITEM_HEADER, item_rows(querysets))
+
+
+def build_download_job(job):
+    """
+    Builds the file for a queued ``DownloadJob``, recording its progress on the
+    job as it goes. Returns False if the job had already been started elsewhere.
+    """
+    from django.conf import settings
+    from aristotle_mdr.models import DownloadJob, DOWNLOAD_JOB_STATES
+
+    # Claim the job, so it is only built once if it is queued more than once
+    claimed = DownloadJob.objects.filter(pk=job.pk, status=DOWNLOAD_JOB_STATES.queued).update(
+        status=DOWNLOAD_JOB_STATES.running, progress=0, modified=timezone.now()
+    )
+    if not claimed:
+        return False
+    job.status = DOWNLOAD_JOB_STATES.running
+
+    try:
+        items = list(job.items.all().select_subclasses())
+        item_querysets = user_items_for_bulk_download(items, job.user)
+        job.set_progress(10)
+
+        title = job.title or "Auto-generated document"
+        page_size = getattr(settings, 'PDF_PAGE_SIZE', "A4")
+        html = render_html(
+            BULK_PDF_TEMPLATE,
+            bulk_pdf_context(items, item_querysets, title, default_bulk_subtitle(items), page_size)
+        )
+        job.set_progress(40)
+
+        pdf = html_to_pdf(html)
+        if pdf is None:
+            raise ValueError("The PDF could not be rendered")
+        job.set_progress(90)
+
+        job.output.save("%s.pdf" % (slugify(title) or job.pk), ContentFile(pdf), save=False)
+        job.status = DOWNLOAD_JOB_STATES.complete
+        job.progress = 100
+        job.save()
+    except Exception as e:
+        logger.exception("Failed to build download job %s" % job.pk)
+        job.status = DOWNLOAD_JOB_STATES.failed
+        job.error = str(e)
+        job.save()
+    return True
@@ -13,6 +13,7 @@ import aristotle_mdr.models as MDR
 from aristotle_mdr.forms import ChangeStatusForm
 from aristotle_mdr.perms import (
     user_can_view,
+    user_can_view_many,
     user_is_registrar,
     user_is_workgroup_manager,
     user_can_move_any_workgroup
@@ -164,7 +165,8 @@ class AddFavouriteForm(LoggedInBulkActionForm):
 
     def make_changes(self):
         items = self.items_to_change
-        bad_items = [str(i.id) for i in items if not user_can_view(self.user, i)]
+        can_view = user_can_view_many(self.user, items)
+        bad_items = [str(i.id) for i in items if not can_view[i.id]]
         items = items.visible(self.user)
         self.user.profile.favourites.add(*items)
         return _(
@@ -303,8 +305,9 @@ class RequestReviewForm(LoggedInBulkActionForm):
             )
             failed = []
             success = []
+            can_view = user_can_view_many(self.user, items)
             for item in items:
-                if item.can_view(self.user):
+                if can_view[item.id]:
                     success.append(item)
                 else:
                     failed.append(item)
@@ -398,9 +401,31 @@ class ChangeWorkgroupForm(BulkActionForm):
 
 
 class DownloadActionForm(BulkActionForm):
+    # Download types that can be built by a background job
+    background_download_types = ['pdf']
+
+    def run_in_background(self, items):
+        threshold = settings.ARISTOTLE_SETTINGS.get('BULK_DOWNLOAD_ASYNC_THRESHOLD', 50)
+        return (
+            threshold is not None and
+            MDR.bulk_download_queue() is not None and
+            self.download_type in self.background_download_types and
+            self.user.is_authenticated() and
+            items.count() > threshold
+        )
+
     def make_changes(self):
         items = self.items_to_change
         from aristotle_mdr.contrib.redirect.exceptions import Redirect
+        if self.run_in_background(items):
+            job = MDR.DownloadJob.objects.create(
+                user=self.user,
+                download_type=self.download_type,
+                title=(self.title or "")[:MDR.DownloadJob._meta.get_field('title').max_length],
+            )
+            job.items.add(*items)
+            job.start()
+            raise Redirect(url=job.get_absolute_url())
         raise Redirect(url=reverse('aristotle:bulk_download', kwargs={'download_type': self.download_type}) + ('?title=%s&' % self.title) + "&".join(['items=%s' % i.id for i in items]))
 
 
@@ -1,5 +1,8 @@
 import datetime
+import hashlib
 from django import forms
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
@@ -13,9 +16,13 @@ from haystack.query import EmptySearchQuerySet, SearchQuerySet, SQ
 from bootstrap3_datetime.widgets import DateTimePicker
 
 import aristotle_mdr.models as MDR
+from aristotle_mdr.utils.spelling import spelling_dictionary
 from aristotle_mdr.widgets import BootstrapDropdownSelectMultiple, BootstrapDropdownIntelligentDate, BootstrapDropdownSelect
 
 
+# The number of values shown for each facet on the search page
+SEARCH_FACET_SIZE = 10
+
 QUICK_DATES = Choices(
     ('', 'anytime', _('Any time')),
     ('h', 'hour', _('Last hour')),
@@ -101,6 +108,59 @@ def first_letter(j):
     return j[0]
 
 
+SEARCH_CACHE_HITS_KEY = 'search_cache_hits'
+SEARCH_CACHE_MISSES_KEY = 'search_cache_misses'
+
+
+def search_cache_seconds():
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('SEARCH_CACHE_SECONDS', 300)
+
+
+def search_cache_key(sqs, start, end):
+    """
+    Builds the cache key for a page of search results. The query built by the
+    backend already holds the normalised search terms, the filters and the
+    permission principals of the user, so users with the same memberships
+    share keys.
+    """
+    from haystack.utils import get_model_ct
+    from aristotle_mdr.signals import search_index_generation
+
+    query = sqs.query
+    parts = [
+        search_index_generation(query._using or DEFAULT_ALIAS),
+        query.build_query(),
+        sorted(query.narrow_queries),
+        sorted((facet, sorted(options.items())) for facet, options in query.facets.items()),
+        list(query.order_by),
+        sorted(get_model_ct(model) for model in query.models),
+        sqs._load_all,
+        start, end,
+    ]
+    return 'search_results_%s' % hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _count_search_cache(key):
+    if cache.add(key, 1, None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def search_cache_stats():
+    """
+    Returns the number of searches that were answered from the search result
+    cache, and the number that had to be sent to the search backend.
+    """
+    counts = cache.get_many([SEARCH_CACHE_HITS_KEY, SEARCH_CACHE_MISSES_KEY])
+    return {
+        'hits': counts.get(SEARCH_CACHE_HITS_KEY, 0),
+        'misses': counts.get(SEARCH_CACHE_MISSES_KEY, 0),
+    }
+
+
 class EmptyPermissionSearchQuerySet(EmptySearchQuerySet):
     # Just like a Haystack EmptySearchQuerySet, this behaves like a PermissionsSearchQuerySet
     # But returns nothing all the time.
@@ -110,6 +170,9 @@ class EmptyPermissionSearchQuerySet(EmptySearchQuerySet):
     def apply_registration_status_filters(self, *args, **kwargs):
         return self
 
+    def fetch_page(self, start, end):
+        return self[start:end]
+
 
 class PermissionSearchQuerySet(SearchQuerySet):
     def models(self, *mods):
@@ -126,19 +189,20 @@ class PermissionSearchQuerySet(SearchQuerySet):
             sqs = sqs.filter(q)
             return sqs
 
-        q = SQ(submitter_id=user.pk)  # users can see items they create
         if user.is_superuser:
             q = SQ()  # Super-users can see everything
         else:
-            # Non-registrars can only see public things or things in their workgroup
-            # if they have no workgroups they won't see anything extra
-            if user.profile.workgroups.count() > 0:
-                # for w in user.profile.workgroups.all():
-                #    q |= SQ(workgroup=str(w.id))
-                q |= SQ(workgroup__in=[int(w.id) for w in user.profile.workgroups.all()])
-            if user.profile.is_registrar:
-                # if registrar, also filter through items in the registered in their authorities
-                q |= SQ(registrationAuthorities__in=[str(r.id) for r in user.profile.registrarAuthorities])
+            # Each item is indexed with the principals that can see it, so
+            # users can see public items and anything they hold a principal for:
+            # items they made, items in their workgroups, and items registered
+            # in or sent for review to their registration authorities.
+            # The users principals are cached, so this needs no queries.
+            # They are sorted so the same access always builds the same query.
+            own = MDR.user_principal(user.pk)
+            principals = [MDR.PUBLIC_PRINCIPAL] + [p for p in MDR.user_principals(user) if p != own]
+            if not search_cache_seconds() or self.has_own_items(user, principals):
+                principals.append(own)
+            q = SQ(access__in=sorted(principals))
         if public_only:
             q &= SQ(is_public=True)
         if user_workgroups_only:
@@ -148,6 +212,65 @@ class PermissionSearchQuerySet(SearchQuerySet):
             sqs = sqs.filter(q)
         return sqs
 
+    def has_own_items(self, user, principals):
+        """
+        Returns whether the user can see any items through their own principal
+        that none of their other ``principals`` give access to, such as items
+        they made outside their workgroups. Most users have none, so their
+        searches leave their own principal out and share cached results with
+        everyone with the same memberships. This is checked with one search,
+        which is cached until the index or the users memberships change.
+        """
+        from aristotle_mdr import perms
+        from aristotle_mdr.signals import search_index_generation
+
+        using = self.query._using or DEFAULT_ALIAS
+        key = 'search_own_items_%s_%s_%s' % (
+            user.pk, perms.get_generation('user', user.pk), search_index_generation(using)
+        )
+        found = cache.get(key)
+        if found is None:
+            found = SearchQuerySet(using=using).filter(
+                access=MDR.user_principal(user.pk)
+            ).exclude(access__in=sorted(principals)).count() > 0
+            cache.set(key, found, search_cache_seconds())
+        return found
+
+    def fetch_page(self, start, end):
+        """
+        Fills the result cache with the results from ``start`` to ``end``, along
+        with the number of hits and the facet counts. The response is cached
+        until the search index changes, and shared by everyone who runs the same
+        search with the same access.
+        """
+        timeout = search_cache_seconds()
+        if not timeout:
+            return self[start:end]
+
+        key = search_cache_key(self, start, end)
+        cached = cache.get(key)
+        if cached is None:
+            _count_search_cache(SEARCH_CACHE_MISSES_KEY)
+            results = self[start:end]
+            cache.set(key, {
+                'hits': self.query.get_count(),
+                'count': len(self),
+                'facets': self.query.get_facet_counts(),
+                'results': list(results),
+            }, timeout)
+            return results
+
+        _count_search_cache(SEARCH_CACHE_HITS_KEY)
+        query = self.query
+        query._hit_count = cached['hits']
+        query._facet_counts = cached['facets']
+        query._results = cached['results']
+        self._result_count = cached['count']
+        self._ignored_result_count = cached['hits'] - cached['count']
+        self._result_cache = [None] * cached['hits']
+        self._result_cache[start:start + len(cached['results'])] = cached['results']
+        return cached['results']
+
     def apply_registration_status_filters(self, states=[], ras=[]):
         sqs = self
         if states and not ras:
@@ -394,12 +517,16 @@ class PermissionSearchForm(TokenSearchForm):
 
         self.has_spelling_suggestions = False
         if not self.repeat_search:
+            sqs = self.apply_facets(self.apply_sorting(sqs))
+            # The page of results, the number of hits and the facet counts all
+            # come back from this one request, so the counts below are free.
+            self.fetch_results_page(sqs)
 
             if sqs.count() < 5:
                 self.check_spelling(sqs)
 
             if sqs.count() == 0:
-                if sqs.count() == 0 and self.has_spelling_suggestions:
+                if self.has_spelling_suggestions:
                     self.auto_correct_spell_search = True
                     self.cleaned_data['q'] = self.suggested_query
                 elif has_filter and self.cleaned_data['q']:
@@ -409,12 +536,26 @@ class PermissionSearchForm(TokenSearchForm):
                     for f in self.filters:
                         self.cleaned_data[f] = None
                     self.auto_broaden_search = True
-                # Re run the query with the updated details
-                sqs = self.search(repeat_search=True)
-            # Only apply sorting on the first pass through
-            sqs = self.apply_sorting(sqs)
+                # Re run the query with the updated details, but only count the
+                # results, and only fetch them and their facets if there are any.
+                retry_sqs = self.search(repeat_search=True)
+                if retry_sqs.count() > 0:
+                    sqs = self.apply_facets(self.apply_sorting(retry_sqs))
+                    self.fetch_results_page(sqs)
+
+            self.facets = sqs.facet_counts()
+            if 'fields' in self.facets:
+                self.extra_facet_fields = [
+                    (k, {'values': v, 'details': self.extra_facets_details[k]})
+                    for k, v in self.facets['fields'].items()
+                    if k in self.extra_facets
+                ]
 
+        return sqs
+
+    def apply_facets(self, sqs):
         # Don't applying sorting on the facet as ElasticSearch2 doesn't like this.
+        # The backend returns only the top terms for each facet, ordered by count.
         filters_to_facets = {
             'ra': 'registrationAuthorities',
             'models': 'facet_model_ct',
@@ -423,7 +564,7 @@ class PermissionSearchForm(TokenSearchForm):
         for _filter, facet in filters_to_facets.items():
             if _filter not in self.applied_filters:
                 # Don't do this: sqs = sqs.facet(facet, sort='count')
-                sqs = sqs.facet(facet)
+                sqs = sqs.facet(facet, size=SEARCH_FACET_SIZE)
 
         logged_in_facets = {
             'wg': 'workgroup',
@@ -433,40 +574,40 @@ class PermissionSearchForm(TokenSearchForm):
             for _filter, facet in logged_in_facets.items():
                 if _filter not in self.applied_filters:
                     # Don't do this: sqs = sqs.facet(facet, sort='count')
-                    sqs = sqs.facet(facet)
+                    sqs = sqs.facet(facet, size=SEARCH_FACET_SIZE)
 
-        extra_facets = []
-        extra_facets_details = {}
+        self.extra_facets = []
+        self.extra_facets_details = {}
         from aristotle_mdr.search_indexes import registered_indexes
         for model_index in registered_indexes:
             for name, field in model_index.fields.items():
                 if field.faceted:
                     if name not in (list(filters_to_facets.values()) + list(logged_in_facets.values())):
-                        extra_facets.append(name)
+                        self.extra_facets.append(name)
 
-                        x = extra_facets_details.get(name, {})
+                        x = self.extra_facets_details.get(name, {})
                         x.update(**{
                             'title': getattr(field, 'title', name),
                             'display': getattr(field, 'display', None),
                         })
-                        extra_facets_details[name]= x
+                        self.extra_facets_details[name] = x
                         # Don't do this: sqs = sqs.facet(facet, sort='count')
-                        sqs = sqs.facet(name)
-
-        self.facets = sqs.facet_counts()
-
-        if 'fields' in self.facets:
-            self.extra_facet_fields = [
-                (k, {'values': sorted(v, key=lambda x: -x[1])[:10], 'details': extra_facets_details[k]})
-                for k, v in self.facets['fields'].items()
-                if k in extra_facets
-            ]
-            for facet, counts in self.facets['fields'].items():
-                # Return the 5 top results for each facet in order of number of results.
-                self.facets['fields'][facet] = sorted(counts, key=lambda x: -x[1])[:10]
-
+                        sqs = sqs.facet(name, size=SEARCH_FACET_SIZE)
         return sqs
 
+    def fetch_results_page(self, sqs):
+        """
+        Fetches the page of results the search view will show into the cache of
+        ``sqs``, so the view can page through it without searching again.
+        """
+        per_page = getattr(settings, 'HAYSTACK_SEARCH_RESULTS_PER_PAGE', 20)
+        try:
+            page = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        start = (page - 1) * per_page
+        return sqs.fetch_page(start, start + per_page)
+
     def check_spelling(self, sqs):
         if self.query_text:
             original_query = self.cleaned_data.get('q', "")
@@ -485,18 +626,13 @@ class PermissionSearchForm(TokenSearchForm):
             optimal_query = original_query
             for token in self.cleaned_data.get('q', "").split(" "):
                 if token:  # remove blanks
-                    suggestion = self.searchqueryset.spelling_suggestion(token)
+                    # Suggestions are words that have been indexed, so unlike the
+                    # backend suggestions they don't need a search to check them.
+                    suggestion = spelling_dictionary.suggest(token)
                     if suggestion:
-                        test_query = optimal_query.replace(token, suggestion)
-                        # Haystack can *over correct* so we'll do a quick search with the
-                        # suggested spelling to compare words against
-                        try:
-                            PermissionSearchQuerySet().auto_query(test_query)[0]
-                            suggested_query.append(suggestion)
-                            has_suggestions = True
-                            optimal_query = test_query
-                        except:
-                            suggestion = None
+                        optimal_query = optimal_query.replace(token, suggestion)
+                        suggested_query.append(suggestion)
+                        has_suggestions = True
                     else:
                         suggested_query.append(token)
                     suggestions.append((token, suggestion))
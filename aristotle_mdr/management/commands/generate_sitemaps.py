@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from aristotle_mdr.views.sitemaps import generate_sitemaps, sitemap_base_url
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates every sitemap page and the sitemap index into storage. '
+        'Afterwards, only the pages with changed items are rebuilt. '
+        'Needs the SITEMAP_BASE_URL setting, as sitemaps are only stored when it is set.'
+    )
+
+    def handle(self, *args, **options):
+        base_url = sitemap_base_url()
+        if base_url is None:
+            raise CommandError('Sitemaps are only stored when the SITEMAP_BASE_URL setting is set')
+        generate_sitemaps(base_url)
+        self.stdout.write('Generated sitemaps for %s' % base_url)
@@ -0,0 +1,76 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from aristotle_mdr.downloader import build_download_job
+from aristotle_mdr.models import DownloadJob, DOWNLOAD_JOB_STATES
+
+
+class Command(BaseCommand):
+    help = (
+        'Builds queued bulk downloads. Run this as a long running worker when '
+        'the BULK_DOWNLOAD_QUEUE setting is "database". Finished downloads older '
+        'than the expiry time are removed along with their files, and jobs that have '
+        'been running without progress for too long are queued again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', dest='once', default=False,
+            help='Build the jobs that are currently queued, then exit.'
+        )
+        parser.add_argument(
+            '--poll', action='store', dest='poll', type=float, default=5,
+            help='Seconds to wait between checks for new jobs.'
+        )
+        parser.add_argument(
+            '--expire-days', action='store', dest='expire_days', type=int, default=7,
+            help='Number of days finished downloads are kept for.'
+        )
+        parser.add_argument(
+            '--stale-minutes', action='store', dest='stale_minutes', type=int, default=60,
+            help='Minutes a running job can go without progress before it is queued again.'
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options.get('verbosity', 1)
+        while True:
+            self.expire(options.get('expire_days', 7))
+            self.reclaim(options.get('stale_minutes', 60))
+            built = self.process_queued()
+            if options.get('once'):
+                break
+            if not built:
+                time.sleep(options.get('poll', 5))
+
+    def process_queued(self):
+        built = 0
+        for job in DownloadJob.objects.filter(status=DOWNLOAD_JOB_STATES.queued).order_by('created'):
+            if build_download_job(job):
+                built += 1
+                if self.verbosity > 0:
+                    self.stdout.write('Built download job %s: %s' % (job.pk, job.get_status_display()))
+        return built
+
+    def reclaim(self, minutes):
+        # Jobs record their progress as they go, so a running job that hasn't
+        # changed for this long was left behind by a worker that stopped.
+        cutoff = timezone.now() - datetime.timedelta(minutes=minutes)
+        reclaimed = DownloadJob.objects.filter(
+            status=DOWNLOAD_JOB_STATES.running,
+            modified__lt=cutoff,
+        ).update(status=DOWNLOAD_JOB_STATES.queued, progress=0, modified=timezone.now())
+        if reclaimed and self.verbosity > 0:
+            self.stdout.write('Queued %s stalled download jobs again' % reclaimed)
+
+    def expire(self, days):
+        cutoff = timezone.now() - datetime.timedelta(days=days)
+        expired = DownloadJob.objects.filter(
+            status__in=[DOWNLOAD_JOB_STATES.complete, DOWNLOAD_JOB_STATES.failed],
+            modified__lt=cutoff,
+        )
+        # Deleted one at a time so the files are removed too
+        for job in expired:
+            job.delete()
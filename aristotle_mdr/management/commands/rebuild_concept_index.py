@@ -0,0 +1,212 @@
+from __future__ import division
+
+import datetime
+import json
+import multiprocessing
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django import db
+from django.utils import timezone
+
+from aristotle_mdr.signals import bump_search_index_generation
+from aristotle_mdr.utils.spelling import spelling_dictionary
+
+
+def index_range(args):
+    """
+    Indexes every item of a model with a primary key in the given range.
+    This is run in the worker processes, so it only takes picklable arguments.
+    """
+    using, rebuild_index_name, label, start, end = args
+    from haystack import connections
+    began = time.time()
+    model = apps.get_model(label)
+    connection = connections[using]
+    index = connection.get_unified_index().get_index(model)
+    items = list(index.index_queryset(using=using).filter(pk__gte=start, pk__lt=end))
+    if items:
+        backend = connection.get_backend()
+        if rebuild_index_name:
+            backend.resume_rebuild(rebuild_index_name)
+        backend.update(index, items)
+    return (os.getpid(), label, start, end, len(items), time.time() - began)
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the search index for all indexed types, splitting each type into '
+        'ranges of primary keys that are indexed in parallel. Completed ranges are '
+        'recorded in a checkpoint file so an interrupted rebuild resumes where it stopped. '
+        'Using more than one worker needs a search backend that supports concurrent writes, '
+        'such as Elasticsearch. Backends that can build a new index behind an alias do so, '
+        'and only switch searches over to it once the rebuild is complete.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--using', action='store', dest='using', default='default',
+            help='The search connection to update.'
+        )
+        parser.add_argument(
+            '--workers', action='store', dest='workers', type=int, default=1,
+            help='Number of processes to index with.'
+        )
+        parser.add_argument(
+            '--batch-size', action='store', dest='batch_size', type=int, default=500,
+            help='Size of the primary key ranges each worker indexes at a time.'
+        )
+        parser.add_argument(
+            '--checkpoint', action='store', dest='checkpoint', default='aristotle_reindex_checkpoint.json',
+            help='File used to record completed ranges.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true', dest='restart', default=False,
+            help='Ignore any existing checkpoint and rebuild everything.'
+        )
+        parser.add_argument(
+            '--clear', action='store_true', dest='clear', default=False,
+            help='Clear the search index before starting a new (not resumed) rebuild, '
+                 'for backends that rebuild in place.'
+        )
+
+    def handle(self, *args, **options):
+        from haystack import connections
+
+        using = options.get('using', 'default')
+        batch_size = options.get('batch_size', 500)
+        workers = max(1, options.get('workers', 1))
+        checkpoint = options['checkpoint']
+        self.verbosity = options.get('verbosity', 1)
+
+        backend = connections[using].get_backend()
+        swap_index = hasattr(backend, 'start_rebuild')
+
+        if not options.get('restart') and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            self.stdout.write('Resuming rebuild, %s ranges already completed' % len(state['done']))
+        else:
+            state = {'index': None, 'done': [], 'started': time.time()}
+            if swap_index:
+                state['index'] = backend.start_rebuild()
+            elif options.get('clear'):
+                backend.clear()
+        if state['index']:
+            backend.resume_rebuild(state['index'])
+        done = set(state['done'])
+        self.save_checkpoint(checkpoint, state, done)
+
+        unified_index = connections[using].get_unified_index()
+        ranges = []
+        for model in unified_index.get_indexed_models():
+            # Other indexes, such as help pages, are included so that a new
+            # index built behind an alias is complete when it goes live.
+            index = unified_index.get_index(model)
+            label = '%s.%s' % (model._meta.app_label, model._meta.model_name)
+            # Ranges are buckets of primary key values so they are the same on
+            # every run, even if items have been added since the last one.
+            buckets = set(
+                pk // batch_size
+                for pk in index.index_queryset(using=using).values_list('pk', flat=True)
+            )
+            for bucket in sorted(buckets):
+                start, end = bucket * batch_size, (bucket + 1) * batch_size
+                if self.range_key(label, start, end) not in done:
+                    ranges.append((using, state['index'], label, start, end))
+
+        self.stdout.write('Indexing %s ranges with %s workers' % (len(ranges), workers))
+
+        stats = {}
+        began = time.time()
+        if workers == 1:
+            results = (index_range(r) for r in ranges)
+        else:
+            # Don't share database connections with the forked workers
+            db.connections.close_all()
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap_unordered(index_range, ranges)
+
+        try:
+            for pid, label, start, end, count, seconds in results:
+                done.add(self.range_key(label, start, end))
+                self.save_checkpoint(checkpoint, state, done)
+                worker = stats.setdefault(pid, [0, 0.0])
+                worker[0] += count
+                worker[1] += seconds
+                if self.verbosity > 1:
+                    self.stdout.write('  worker %s indexed %s %s items (pk %s to %s) in %.2fs' % (
+                        pid, count, label, start, end - 1, seconds
+                    ))
+        finally:
+            if workers > 1:
+                pool.terminate()
+                pool.join()
+
+        total = sum(count for count, seconds in stats.values())
+        for pid, (count, seconds) in sorted(stats.items()):
+            self.stdout.write('  worker %s: %s documents, %.1f docs/sec' % (pid, count, count / max(seconds, 0.001)))
+        self.stdout.write('Indexed %s documents in %.1fs' % (total, time.time() - began))
+
+        if state['index']:
+            self.update_changed_since(using, backend, state['started'])
+            self.remove_deleted(backend, batch_size)
+            backend.finish_rebuild()
+            self.stdout.write('Search index %s is now live' % state['index'])
+
+        # The rebuild has finished, so there is nothing to resume.
+        os.remove(checkpoint)
+        bump_search_index_generation(using)
+        if using == spelling_dictionary.using:
+            spelling_dictionary.refresh()
+
+    def update_changed_since(self, using, backend, started):
+        """
+        Items saved while the new index was loading only updated the live
+        index, so they are indexed again before the new index goes live.
+        """
+        from haystack import connections
+        since = datetime.datetime.fromtimestamp(started, tz=timezone.utc)
+        unified_index = connections[using].get_unified_index()
+        for model in unified_index.get_indexed_models():
+            index = unified_index.get_index(model)
+            if 'modified' in index.fields:
+                items = list(index.index_queryset(using=using).filter(modified__gte=since))
+                if items:
+                    backend.update(index, items)
+
+    def remove_deleted(self, backend, batch_size):
+        """
+        An item deleted while a worker was loading it can be written to the new
+        index after it was removed from it, so documents for items that no
+        longer exist are removed before the new index goes live.
+        """
+        doc_ids = []
+        for doc_id in backend.rebuild_document_ids():
+            doc_ids.append(doc_id)
+            if len(doc_ids) >= batch_size:
+                self.remove_missing(backend, doc_ids)
+                doc_ids = []
+        self.remove_missing(backend, doc_ids)
+
+    def remove_missing(self, backend, doc_ids):
+        by_label = {}
+        for doc_id in doc_ids:
+            label, pk = doc_id.rsplit('.', 1)
+            by_label.setdefault(label, set()).add(pk)
+        for label, pks in by_label.items():
+            existing = apps.get_model(label).objects.filter(pk__in=pks).values_list('pk', flat=True)
+            for pk in pks - set(str(pk) for pk in existing):
+                backend.remove('%s.%s' % (label, pk), commit=False)
+
+    def range_key(self, label, start, end):
+        return '%s:%s:%s' % (label, start, end)
+
+    def save_checkpoint(self, checkpoint, state, done):
+        # Write then rename, so an interruption never leaves a partial file
+        state['done'] = sorted(done)
+        with open(checkpoint + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.rename(checkpoint + '.tmp', checkpoint)
@@ -1,13 +1,25 @@
 from django.core.management.base import BaseCommand, CommandError
-from aristotle_mdr.models import RegistrationAuthority, _concept
+from aristotle_mdr.models import RegistrationAuthority, _concept, bulk_recache_states
+from django.utils import timezone
 
 
 class Command(BaseCommand):
-    args = '<workgroup_id workgroup_id ...>'
-    help = 'Recomputes and caches the public and locked statuses for the given workgroup(s). This is useful if the registration authorities associated with a workgroup change.'
+    args = '<ra_id ra_id ...>'
+    help = 'Recomputes and caches the public and locked statuses for items registered by the given registration authorities. This is useful if the public or locked state of a registration authority changes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ra', nargs='*', help='Ids of the registration authorities to update')
+        parser.add_argument(
+            '--chunk-size', action='store', dest='chunk_size', type=int,
+            default=500, help='Number of items to recompute at a time.'
+        )
+        parser.add_argument(
+            '--noindex', action='store_false', dest='reindex', default=True,
+            help="Don't update the search index for items whose visibility changed."
+        )
 
     def handle(self, *args, **options):
-        from haystack import connections
+        chunk_size = options.get('chunk_size', 500)
         for ra_id in options['ra']:
             try:
                 ra = RegistrationAuthority.objects.get(pk=int(ra_id))
@@ -15,8 +27,36 @@ class Command(BaseCommand):
                 raise CommandError('Registration Authority "%s" does not exist' % ra_id)
             self.stdout.write('Beginning update for items in Registration Authority "%s" (id:%s)' % (ra.name, ra_id))
 
-            for item in _concept.objects.filter(statuses__registrationAuthority=ra):
-                item.recache_states()
-                connections['default'].get_unified_index().get_index(item.item.__class__).update_object(item.item)
+            ids = list(
+                _concept.objects.filter(statuses__registrationAuthority=ra).order_by('pk').values_list('pk', flat=True).distinct()
+            )
+            when = timezone.now()
+            changed = []
+            for i in range(0, len(ids), chunk_size):
+                chunk_changed = bulk_recache_states(ids[i:i + chunk_size], when)
+                if options.get('reindex', True):
+                    self.reindex(chunk_changed)
+                changed += chunk_changed
+                if options.get('verbosity', 1) > 0:
+                    self.stdout.write('  %s of %s items checked, %s changed' % (min(i + chunk_size, len(ids)), len(ids), len(changed)))
+
+            self.stdout.write('Successfully updated %s of %s items in Registration Authority "%s" (id:%s)' % (len(changed), len(ids), ra.name, ra_id))
 
-            self.stdout.write('Successfully updated items in Registration Authority "%s" (id:%s)' % (ra.name, ra_id))
+    def reindex(self, concept_ids):
+        if not concept_ids:
+            return
+        from haystack import connections
+        from haystack.exceptions import NotHandled
+        connection = connections['default']
+        unified_index = connection.get_unified_index()
+        backend = connection.get_backend()
+
+        by_model = {}
+        for item in _concept.objects.filter(pk__in=concept_ids).select_subclasses():
+            by_model.setdefault(item.__class__, []).append(item)
+        for model, items in by_model.items():
+            try:
+                index = unified_index.get_index(model)
+            except NotHandled:  # pragma: no cover
+                continue
+            backend.update(index, items)
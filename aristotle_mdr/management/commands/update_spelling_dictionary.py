@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from aristotle_mdr.utils.spelling import spelling_dictionary
+
+
+class Command(BaseCommand):
+    help = (
+        'Builds the spelling dictionary used for "did you mean" suggestions on the '
+        'search page from the words in the search index. It is also built again '
+        'in the background once the index changes, so this is only needed to '
+        'build it straight away.'
+    )
+
+    def handle(self, *args, **options):
+        spelling_dictionary.refresh()
+        if options.get('verbosity', 1) > 0:
+            self.stdout.write('Updated the spelling dictionary at %s' % spelling_dictionary.path)
@@ -2,37 +2,82 @@ from __future__ import unicode_literals
 from __future__ import print_function
 from __future__ import absolute_import
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
+from django.db.models.query import QuerySet
+from django.utils import six, timezone
 from django.utils.translation import ugettext_lazy as _
 from notifications.signals import notify
 
+NOTIFICATION_CHUNK_SIZE = 500
+
+
+def recipient_ids(recipient):
+    """
+    Takes a user, a list of users or user ids, or a queryset of users, and
+    returns the ids of the recipients.
+    """
+    if isinstance(recipient, QuerySet):
+        return list(recipient.values_list('pk', flat=True))
+    if isinstance(recipient, (list, tuple, set)):
+        return [getattr(r, 'pk', r) for r in recipient]
+    return [recipient.pk]
+
+
+def notify_many(actor, recipient, verb, target=None, action_object=None):
+    """
+    Bulk version of ``notify.send``, that writes the notification for every
+    recipient with a few batched inserts instead of one per recipient.
+    As the notifications are bulk inserted, no ``post_save`` signals are sent.
+    """
+    from notifications.models import Notification
+
+    fields = {
+        'actor_content_type': ContentType.objects.get_for_model(actor),
+        'actor_object_id': actor.pk,
+        'verb': six.text_type(verb),
+        'public': True,
+        'timestamp': timezone.now(),
+    }
+    for name, obj in [('target', target), ('action_object', action_object)]:
+        if obj is not None:
+            fields['%s_content_type' % name] = ContentType.objects.get_for_model(obj)
+            fields['%s_object_id' % name] = obj.pk
+
+    Notification.objects.bulk_create(
+        [Notification(recipient_id=pk, **fields) for pk in set(recipient_ids(recipient))],
+        batch_size=NOTIFICATION_CHUNK_SIZE
+    )
+
+
+# Each of the below take a single recipient, or many as accepted by recipient_ids
 
 def favourite_updated(recipient, obj):
-    notify.send(obj, recipient=recipient, verb="A favourited item has been changed:", target=obj)
+    notify_many(obj, recipient, verb="A favourited item has been changed:", target=obj)
 
 
 def favourite_superseded(recipient, obj):
-    notify.send(obj, recipient=recipient, verb="A favourited item has been superseded:", target=obj)
+    notify_many(obj, recipient, verb="A favourited item has been superseded:", target=obj)
 
 
 def registrar_item_superseded(recipient, obj):
-    notify.send(obj, recipient=recipient, verb="A item registered by your registration authority has been superseded:", target=obj)
+    notify_many(obj, recipient, verb="A item registered by your registration authority has been superseded:", target=obj)
 
 
 def registrar_item_registered(recipient, obj):
-    notify.send(obj, recipient=recipient, verb="A item has been registered by your registration authority:", target=obj)
+    notify_many(obj, recipient, verb="A item has been registered by your registration authority:", target=obj)
 
 
 def registrar_item_changed_status(recipient, obj):
-    notify.send(obj, recipient=recipient, verb="A item registered by your registration authority has changed status:", target=obj)
+    notify_many(obj, recipient, verb="A item registered by your registration authority has changed status:", target=obj)
 
 
 def workgroup_item_updated(recipient, obj):
-    notify.send(obj, recipient=recipient, verb="was modified in the workgroup", target=obj.workgroup)
+    notify_many(obj, recipient, verb="was modified in the workgroup", target=obj.workgroup)
 
 
 def workgroup_item_new(recipient, obj):
-    notify.send(obj, recipient=recipient, verb="was modified in the workgroup", target=obj.workgroup)
+    notify_many(obj, recipient, verb="was modified in the workgroup", target=obj.workgroup)
 
 
 def new_comment_created(comment):
@@ -43,11 +88,11 @@ def new_comment_created(comment):
 
 def new_post_created(post, recipient):
     op_name = post.author.get_full_name() or post.author
-    notify.send(post.author, recipient=recipient, verb="made a new post", target=post, action_object=post.workgroup)
+    notify_many(post.author, recipient, verb="made a new post", target=post, action_object=post.workgroup)
 
 
 def review_request_created(review_request, requester, registrar):
-    notify.send(requester, recipient=registrar, verb="requested concept review", target=review_request)
+    notify_many(requester, registrar, verb="requested concept review", target=review_request)
 
 
 def review_request_updated(review_request, requester, reviewer):
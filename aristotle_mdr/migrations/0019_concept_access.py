@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_concept_access(apps, schema_editor):
+    """
+    Build the initial access index for existing content.
+    This mirrors ``aristotle_mdr.models.recache_concept_access``, but uses the
+    historical models.
+    """
+    _concept = apps.get_model('aristotle_mdr', '_concept')
+    Status = apps.get_model('aristotle_mdr', 'Status')
+    ReviewRequest = apps.get_model('aristotle_mdr', 'ReviewRequest')
+    ConceptAccess = apps.get_model('aristotle_mdr', 'ConceptAccess')
+    cancelled = 5  # REVIEW_STATES.cancelled
+
+    access = set()
+    for pk, submitter, workgroup in _concept.objects.values_list('pk', 'submitter', 'workgroup').iterator():
+        if submitter is not None:
+            access.add((pk, "user_%s" % submitter))
+        if workgroup is not None:
+            access.add((pk, "wg_%s" % workgroup))
+
+    statuses = Status.objects.values_list('concept', 'registrationAuthority').distinct()
+    reviews = ReviewRequest.concepts.through.objects.exclude(
+        reviewrequest__status=cancelled
+    ).values_list('_concept', 'reviewrequest__registration_authority').distinct()
+    for pk, ra in list(statuses) + list(reviews):
+        access.add((pk, "ra_%s" % ra))
+
+    ConceptAccess.objects.bulk_create(
+        [ConceptAccess(concept_id=pk, principal=principal) for pk, principal in access],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aristotle_mdr', '0018_improve_request_reviews'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConceptAccess',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('principal', models.CharField(max_length=64)),
+                ('concept', models.ForeignKey(related_name='access_principals', to='aristotle_mdr._concept')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='conceptaccess',
+            unique_together=set([('principal', 'concept')]),
+        ),
+        migrations.RunPython(populate_concept_access, migrations.RunPython.noop),
+    ]
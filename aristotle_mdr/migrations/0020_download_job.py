@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('aristotle_mdr', '0019_concept_access'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('download_type', models.CharField(max_length=32)),
+                ('title', models.CharField(max_length=512, blank=True)),
+                ('status', models.IntegerField(default=0, choices=[(0, 'Queued'), (5, 'Running'), (10, 'Complete'), (15, 'Failed')])),
+                ('progress', models.IntegerField(default=0, help_text='How much of the download has been built, as a percentage')),
+                ('output', models.FileField(null=True, upload_to='aristotle_mdr/bulk_downloads', blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('items', models.ManyToManyField(related_name='+', to='aristotle_mdr._concept', blank=True)),
+                ('user', models.ForeignKey(related_name='download_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
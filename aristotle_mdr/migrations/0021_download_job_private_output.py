@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import aristotle_mdr.models
+import aristotle_mdr.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aristotle_mdr', '0020_download_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='downloadjob',
+            name='output',
+            field=models.FileField(storage=aristotle_mdr.storage.PrivateStorage(), null=True, upload_to=aristotle_mdr.models.download_job_path, blank=True),
+        ),
+    ]
@@ -2,11 +2,13 @@ from __future__ import unicode_literals
 from __future__ import print_function
 from __future__ import absolute_import
 
+from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from django.db.models.signals import post_save, m2m_changed, post_delete
 from django.dispatch import receiver, Signal
 from django.utils import timezone
@@ -17,15 +19,17 @@ from django.utils.translation import ugettext_lazy as _
 from model_utils.managers import InheritanceManager, InheritanceQuerySet
 from model_utils.models import TimeStampedModel
 from model_utils import Choices, FieldTracker
-from aristotle_mdr.contrib.channels.utils import fire
+from aristotle_mdr.contrib.channels.utils import fire, get_dispatcher, InlineDispatcher
 
 from django.utils.encoding import python_2_unicode_compatible  # Python 2
 
 import reversion  # import revisions
 
 import datetime
+import uuid
 from ckeditor_uploader.fields import RichTextUploadingField as RichTextField
 from aristotle_mdr import perms
+from aristotle_mdr.storage import private_storage
 from aristotle_mdr import messages
 from aristotle_mdr.utils import (
     url_slugify_concept,
@@ -374,7 +378,8 @@ def update_registration_authority_states(sender, instance, created, **kwargs):
             message = (
                 "Registration '{ra}' changed its public or locked status "
                 "level, items registered by this authority may have stale "
-                "visiblity states and need to be manually updated."
+                "visiblity states and need to be manually updated with "
+                "the 'recache_registration_authority_item_visibility' command."
             ).format(ra=instance.name)
             logger.critical(message)
 
@@ -535,21 +540,14 @@ class ConceptQuerySet(InheritanceQuerySet):
         q = Q(_is_public=True)
 
         if user.is_active:
-            # User can see everything they've made.
-            q |= Q(submitter=user)
-            if user.profile.workgroups:
-                # User can see everything in their workgroups.
-                q |= Q(workgroup__in=user.profile.workgroups)
-                # q |= Q(workgroup__user__profile=user)
-            if user.profile.is_registrar:
-                # Registars can see items they have been asked to review
-                q |= Q(
-                    Q(review_requests__registration_authority__registrars__profile__user=user) & ~Q(review_requests__status=REVIEW_STATES.cancelled)
-                )
-                # Registars can see items that have been registered in their registration authority
-                q |= Q(
-                    Q(statuses__registrationAuthority__registrars__profile__user=user)
-                )
+            # Users can see everything they've made, everything in their
+            # workgroups, and registrars can see items they have been asked
+            # to review or that have been registered in their registration
+            # authority. These are all precomputed in ``ConceptAccess``, so
+            # this is a single indexed lookup against the users principals.
+            q |= Q(pk__in=ConceptAccess.objects.filter(
+                principal__in=user_principals(user)
+            ).values('concept'))
         extra_q = settings.ARISTOTLE_SETTINGS.get('EXTRA_CONCEPT_QUERYSETS', {}).get('visible', None)
         if extra_q:
             for func in extra_q:
@@ -597,6 +595,24 @@ class ConceptQuerySet(InheritanceQuerySet):
         """
         return self.filter(_is_public=True)
 
+    def recache_states(self, when=None):
+        """
+        Recomputes and stores the cached public and locked flags for every item
+        in the queryset, in chunks, using one query for the current statuses of
+        each chunk and a bulk ``update`` for the items whose flags changed.
+
+        Unlike ``_concept.recache_states`` this does not save each item or send
+        ``concept_visibility_updated``, so callers are responsible for updating
+        the search index. Returns the ids of the items that changed.
+        """
+        if when is None:
+            when = timezone.now()
+        ids = list(self.order_by('pk').values_list('pk', flat=True))
+        changed = []
+        for i in range(0, len(ids), RECACHE_STATES_CHUNK_SIZE):
+            changed += bulk_recache_states(ids[i:i + RECACHE_STATES_CHUNK_SIZE], when)
+        return changed
+
 
 class ConceptManager(InheritanceManager):
     """
@@ -611,7 +627,7 @@ class ConceptManager(InheritanceManager):
         return ConceptQuerySet(self.model)
 
     def __getattr__(self, attr, *args):
-        if attr in ['editable', 'visible', 'public']:
+        if attr in ['editable', 'visible', 'public', 'recache_states']:
             return getattr(self.get_queryset(), attr, *args)
         else:
             return getattr(self.__class__, attr, *args)
@@ -669,6 +685,14 @@ class _concept(baseAristotleObject):
     edit_page_excludes = None
     admin_page_excludes = None
 
+    # Related objects shown on the page for an item, which are loaded with
+    # the item by ``get_detail_queryset``. Types that show more of their
+    # related items should extend these lists. ``detail_related_statuses``
+    # lists the related items whose current statuses are shown on the page.
+    detail_select_related = ['workgroup', 'submitter']
+    detail_prefetch_related = ['statuses', 'relatedDiscussions']
+    detail_related_statuses = []
+
     class Meta:
         # So the url_name works for items we can't determine.
         verbose_name = "item"
@@ -685,7 +709,7 @@ class _concept(baseAristotleObject):
         changed = self.tracker.changed()
         public_changed = changed.pop('_is_public', False)
         locked_changed = changed.pop('_is_locked', False)
-        return changed.keys()
+        return list(changed.keys())
 
     def can_edit(self, user):
         return _concept.objects.filter(pk=self.pk).editable(user).exists()
@@ -751,12 +775,12 @@ class _concept(baseAristotleObject):
             STATES.retired == status.state for status in self.statuses.all()
         ) and self.statuses.count() > 0
 
-    def check_is_public(self, when=timezone.now()):
+    def check_is_public(self, when=None):
         """
             A concept is public if any registration authority
             has advanced it to a public state in that RA.
         """
-        statuses = self.statuses.all()
+        statuses = self.statuses.select_related('registrationAuthority')
         statuses = self.current_statuses(qs=statuses, when=when)
         pub_state = True in [
             s.state >= s.registrationAuthority.public_state for s in statuses
@@ -776,12 +800,12 @@ class _concept(baseAristotleObject):
     is_public.boolean = True
     is_public.short_description = 'Public'
 
-    def check_is_locked(self, when=timezone.now()):
+    def check_is_locked(self, when=None):
         """
         A concept is locked if any registration authority
         has advanced it to a locked state in that RA.
         """
-        statuses = self.statuses.all()
+        statuses = self.statuses.select_related('registrationAuthority')
         statuses = self.current_statuses(qs=statuses, when=when)
         return True in [
             s.state >= s.registrationAuthority.locked_state for s in statuses
@@ -799,35 +823,13 @@ class _concept(baseAristotleObject):
         self.save()
         concept_visibility_updated.send(sender=self.__class__, concept=self)
 
-    def current_statuses(self, qs=None, when=timezone.now()):
+    def current_statuses(self, qs=None, when=None):
+        if qs is None and when is None and hasattr(self, '_prefetched_current_statuses'):
+            # Already loaded by prefetch_current_statuses
+            return self._prefetched_current_statuses
         if qs is None:
             qs = self.statuses.all()
-        if hasattr(when, 'date'):
-            when = when.date()
-        registered_before_now = Q(registrationDate__lte=when)
-        registation_still_valid = (
-            Q(until_date__gte=when) |
-            Q(until_date__isnull=True)
-        )
-
-        states = qs.filter(
-            registered_before_now & registation_still_valid
-        ).order_by("registrationAuthority", "-registrationDate", "-created")
-
-        from django.db import connection
-        if connection.vendor == 'postgresql':
-            states = states.distinct('registrationAuthority')
-        else:
-            current_ids = []
-            seen_ras = []
-            for s in states:
-                ra = s.registrationAuthority
-                if ra not in seen_ras:
-                    current_ids.append(s.pk)
-                    seen_ras.append(ra)
-            # We hit again so we can return this as a queryset
-            states = states.filter(pk__in=current_ids)
-        return states
+        return qs.current(when).order_by("registrationAuthority", "-registrationDate", "-created")
 
     def get_download_items(self):
         """
@@ -842,6 +844,47 @@ class _concept(baseAristotleObject):
         """
         return []
 
+    @classmethod
+    def get_bulk_download_items(cls, items):
+        """
+        Returns the extra items included when downloading many items of this
+        type at once, in the same form as ``get_download_items``.
+
+        By default this merges the ``get_download_items`` of each item. Types
+        that override ``get_download_items`` should override this too, so the
+        extra items for any number of items are found with one queryset per type.
+        """
+        download_items = {}
+        for item in items:
+            for metadata_type, qs in item.get_download_items():
+                if metadata_type in download_items:
+                    download_items[metadata_type] |= qs
+                else:
+                    download_items[metadata_type] = qs
+        return list(download_items.items())
+
+    @classmethod
+    def get_detail_queryset(cls):
+        """
+        Returns a queryset of items of this type that loads everything in
+        ``detail_select_related`` and ``detail_prefetch_related``, so that
+        the page for an item takes the same number of queries however many
+        statuses, values or related items it has.
+        """
+        qs = cls.objects.select_related(
+            *cls.detail_select_related
+        ).prefetch_related(
+            *cls.detail_prefetch_related
+        ).prefetch_related(*[
+            prefetch_current_statuses(lookup)
+            for lookup in ['statuses'] + [
+                '%s__statuses' % related for related in cls.detail_related_statuses
+            ]
+        ])
+        if apps.is_installed('aristotle_mdr.contrib.slots'):
+            qs = qs.prefetch_related('slots__type')
+        return qs
+
 
 class concept(_concept):
     """
@@ -853,6 +896,9 @@ class concept(_concept):
     """
     objects = ConceptManager()
 
+    detail_select_related = _concept.detail_select_related + ['superseded_by']
+    detail_prefetch_related = _concept.detail_prefetch_related + ['supersedes']
+
     class Meta:
         abstract = True
 
@@ -957,6 +1003,96 @@ class ReviewRequest(TimeStampedModel):
         )
 
 
+class StatusQuerySet(models.QuerySet):
+    def current(self, when=None):
+        """
+        Returns only the statuses that are current at the given date (by
+        default, today) - that is the most recent valid status for each
+        concept in each registration authority.
+
+        This is done in a single query with a correlated ``NOT EXISTS``
+        subquery that excludes any status with a newer valid status in
+        the same registration authority, which works on all supported
+        databases.
+        """
+        if when is None:
+            when = timezone.now()
+        if hasattr(when, 'date'):
+            when = when.date()
+
+        registered_before_now = Q(registrationDate__lte=when)
+        registation_still_valid = (
+            Q(until_date__gte=when) |
+            Q(until_date__isnull=True)
+        )
+
+        from django.db import connection
+        qn = connection.ops.quote_name
+        opts = Status._meta
+        table = qn(opts.db_table)
+        columns = dict(
+            (name, qn(opts.get_field(name).column))
+            for name in ['id', 'concept', 'registrationAuthority', 'registrationDate', 'until_date', 'created']
+        )
+        newer_status = """
+            NOT EXISTS (
+                SELECT 1 FROM {table} newer
+                WHERE newer.{concept} = {table}.{concept}
+                AND newer.{registrationAuthority} = {table}.{registrationAuthority}
+                AND newer.{registrationDate} <= %s
+                AND (newer.{until_date} >= %s OR newer.{until_date} IS NULL)
+                AND (
+                    newer.{registrationDate} > {table}.{registrationDate}
+                    OR (
+                        newer.{registrationDate} = {table}.{registrationDate}
+                        AND newer.{created} > {table}.{created}
+                    )
+                    OR (
+                        newer.{registrationDate} = {table}.{registrationDate}
+                        AND newer.{created} = {table}.{created}
+                        AND newer.{id} > {table}.{id}
+                    )
+                )
+            )
+        """.format(table=table, **columns)
+
+        return self.filter(
+            registered_before_now & registation_still_valid
+        ).extra(where=[newer_status], params=[when, when])
+
+
+def prefetch_current_statuses(lookup='statuses'):
+    """
+    Returns a ``Prefetch`` for the current statuses of items, and their
+    registration authorities, which ``_concept.current_statuses`` then
+    returns without querying.
+    """
+    return Prefetch(
+        lookup,
+        queryset=Status.objects.current().select_related('registrationAuthority').order_by(
+            "registrationAuthority", "-registrationDate", "-created"
+        ),
+        to_attr='_prefetched_current_statuses'
+    )
+
+
+def current_statuses_for_concepts(concept_ids, when=None):
+    """
+    Bulk version of ``_concept.current_statuses``, returns a dictionary that
+    maps each of the given concept ids to a list of its current statuses.
+    """
+    concept_ids = list(set(concept_ids))
+    statuses = dict((pk, []) for pk in concept_ids)
+    for i in range(0, len(concept_ids), RECACHE_STATES_CHUNK_SIZE):
+        chunk = concept_ids[i:i + RECACHE_STATES_CHUNK_SIZE]
+        current = Status.objects.filter(concept__in=chunk).current(when).select_related(
+            'registrationAuthority'
+        ).order_by("registrationAuthority", "-registrationDate", "-created")
+        for status in current:
+            statuses[status.concept_id].append(status)
+    return statuses
+
+
 @python_2_unicode_compatible  # Python 2
 class Status(TimeStampedModel):
     """
@@ -964,6 +1100,7 @@ class Status(TimeStampedModel):
     A Registration_State is a collection of information about the Registration (8.1.5.1) of an Administered Item (8.1.2.2).
     The attributes of the Registration_State class are summarized here and specified more formally in 8.1.2.6.2.
     """
+    objects = StatusQuerySet.as_manager()
     concept = models.ForeignKey(_concept, related_name="statuses")
     registrationAuthority = models.ForeignKey(RegistrationAuthority)
     changeDetails = models.TextField(blank=True, null=True)
@@ -1004,11 +1141,192 @@ class Status(TimeStampedModel):
 
 
 def recache_concept_states(sender, instance, *args, **kwargs):
+    # Access is updated first, so it is current when the saved concept is indexed
+    recache_concept_access([instance.concept_id])
     instance.concept.recache_states()
 post_save.connect(recache_concept_states, sender=Status)
 post_delete.connect(recache_concept_states, sender=Status)
 
 
+RECACHE_STATES_CHUNK_SIZE = 500
+
+
+def bulk_recache_states(concept_ids, when):
+    """
+    Set based version of ``_concept.recache_states`` for a list of concept ids.
+    Returns the ids of the concepts whose public or locked flags changed.
+    """
+    flags = dict((pk, [False, False]) for pk in concept_ids)
+
+    statuses = Status.objects.filter(concept__in=concept_ids).current(when).values_list(
+        'concept', 'state',
+        'registrationAuthority__public_state', 'registrationAuthority__locked_state'
+    )
+    for concept_id, state, public_state, locked_state in statuses:
+        if state >= public_state:
+            flags[concept_id][0] = True
+        if state >= locked_state:
+            flags[concept_id][1] = True
+
+    extra_q = settings.ARISTOTLE_SETTINGS.get('EXTRA_CONCEPT_QUERYSETS', {}).get('public', None)
+    if extra_q:
+        q = Q()
+        for func in extra_q:
+            q |= import_string(func)()
+        for pk in _concept.objects.filter(pk__in=concept_ids).filter(q).values_list('pk', flat=True):
+            flags[pk][0] = True
+
+    updates = {}
+    current = _concept.objects.filter(pk__in=concept_ids).values_list('pk', '_is_public', '_is_locked')
+    for pk, is_public, is_locked in current:
+        new_flags = tuple(flags[pk])
+        if new_flags != (is_public, is_locked):
+            updates.setdefault(new_flags, []).append(pk)
+
+    with transaction.atomic():
+        for (is_public, is_locked), pks in updates.items():
+            _concept.objects.filter(pk__in=pks).update(_is_public=is_public, _is_locked=is_locked)
+
+    changed = [pk for pks in updates.values() for pk in pks]
+    perms.bump_generations('concept', changed)
+    return changed
+
+
+class ConceptAccess(models.Model):
+    """
+    A precomputed index of the principals that can view a concept regardless
+    of whether it is public. Principals are short strings that identify a user,
+    workgroup or registration authority, as built by ``user_principals`` and
+    ``recache_concept_access``.
+
+    This table is kept current by the signals below, and lets
+    ``ConceptQuerySet.visible`` filter with a single semi-join instead of
+    joining across workgroups, statuses and review requests.
+    """
+    concept = models.ForeignKey(_concept, related_name="access_principals")
+    principal = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('principal', 'concept')
+
+
+ACCESS_RECACHE_CHUNK_SIZE = 500
+
+# Held by everyone. It is only used in the search index, as public items
+# are found with ``_is_public`` in the database.
+PUBLIC_PRINCIPAL = "public"
+
+
+def user_principal(user_id):
+    return "user_%s" % user_id
+
+
+def workgroup_principal(workgroup_id):
+    return "wg_%s" % workgroup_id
+
+
+def registration_authority_principal(ra_id):
+    return "ra_%s" % ra_id
+
+
+def user_principals(user):
+    """
+    Returns the list of principals a user holds when checking ``ConceptAccess``.
+    """
+    if user.is_anonymous() or not user.is_active:
+        return []
+    # Cached against the users permission generation, which is bumped whenever
+    # their workgroup or registration authority memberships change.
+    key = 'user_principals_%s_%s' % (user.pk, perms.get_generation('user', user.pk))
+    principals = cache.get(key)
+    if principals is None:
+        principals = [user_principal(user.pk)]
+        principals += [
+            workgroup_principal(wg)
+            for wg in user.profile.workgroups.values_list('pk', flat=True)
+        ]
+        principals += [
+            registration_authority_principal(ra)
+            for ra in user.registrar_in.values_list('pk', flat=True)
+        ]
+        cache.set(key, principals, perms.VIEW_CACHE_SECONDS)
+    return principals
+
+
+def recache_concept_access(concept_ids):
+    """
+    Recomputes the ``ConceptAccess`` rows for the concepts with the given ids.
+
+    The principals that grant access to a concept are:
+
+    * its submitter
+    * its workgroup
+    * any registration authority that has registered it
+    * any registration authority it has an uncancelled review request with
+    """
+    concept_ids = list(set(concept_ids))
+    for i in range(0, len(concept_ids), ACCESS_RECACHE_CHUNK_SIZE):
+        chunk = concept_ids[i:i + ACCESS_RECACHE_CHUNK_SIZE]
+        access = set()
+
+        for pk, submitter, workgroup in _concept.objects.filter(pk__in=chunk).values_list('pk', 'submitter', 'workgroup'):
+            if submitter is not None:
+                access.add((pk, user_principal(submitter)))
+            if workgroup is not None:
+                access.add((pk, workgroup_principal(workgroup)))
+
+        statuses = Status.objects.filter(concept__in=chunk).values_list(
+            'concept', 'registrationAuthority'
+        ).distinct()
+        reviews = ReviewRequest.concepts.through.objects.filter(
+            _concept__in=chunk
+        ).exclude(
+            reviewrequest__status=REVIEW_STATES.cancelled
+        ).values_list(
+            '_concept', 'reviewrequest__registration_authority'
+        ).distinct()
+        for pk, ra in list(statuses) + list(reviews):
+            access.add((pk, registration_authority_principal(ra)))
+
+        with transaction.atomic():
+            ConceptAccess.objects.filter(concept__in=chunk).delete()
+            ConceptAccess.objects.bulk_create([
+                ConceptAccess(concept_id=pk, principal=principal)
+                for pk, principal in access
+            ])
+        perms.bump_generations('concept', chunk)
+
+
+@receiver(post_save)
+def concept_access_on_concept_save(sender, instance, created, **kwargs):
+    if not issubclass(sender, _concept):
+        return
+    if created or set(['submitter_id', 'workgroup_id']) & set(instance.changed_fields):
+        recache_concept_access([instance.pk])
+
+
+@receiver(post_save, sender=ReviewRequest)
+def concept_access_on_review_change(sender, instance, **kwargs):
+    recache_concept_access(instance.concepts.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=ReviewRequest.concepts.through)
+def concept_access_on_review_concepts_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Remember what was attached, as the ids are gone after the clear.
+        if reverse:
+            instance._access_cleared_ids = [instance.pk]
+        else:
+            instance._access_cleared_ids = list(instance.concepts.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        recache_concept_access(getattr(instance, '_access_cleared_ids', []))
+    elif action in ['post_add', 'post_remove']:
+        if reverse:
+            recache_concept_access([instance.pk])
+        else:
+            recache_concept_access(pk_set or [])
+
+
 class ObjectClass(concept):
     """
     Set of ideas, abstractions or things in the real world that are
@@ -1016,6 +1334,7 @@ class ObjectClass(concept):
     behaviour follow the same rules (3.2.88)
     """
     template = "aristotle_mdr/concepts/objectClass.html"
+    detail_prefetch_related = concept.detail_prefetch_related + ['dataelementconcept_set']
 
     class Meta:
         verbose_name_plural = "Object Classes"
@@ -1027,6 +1346,7 @@ class Property(concept):
     (3.2.100)
     """
     template = "aristotle_mdr/concepts/property.html"
+    detail_prefetch_related = concept.detail_prefetch_related + ['dataelementconcept_set']
 
     class Meta:
         verbose_name_plural = "Properties"
@@ -1054,6 +1374,8 @@ class UnitOfMeasure(concept):
         verbose_name_plural = "Units Of Measure"
 
     template = "aristotle_mdr/concepts/unitOfMeasure.html"
+    detail_select_related = concept.detail_select_related + ['measure']
+    detail_prefetch_related = concept.detail_prefetch_related + ['valuedomain_set']
     measure = models.ForeignKey(Measure, blank=True, null=True)
     symbol = models.CharField(max_length=20, blank=True)
 
@@ -1064,6 +1386,7 @@ class DataType(concept):
     by operations on those values (3.1.9)
     """
     template = "aristotle_mdr/concepts/dataType.html"
+    detail_prefetch_related = concept.detail_prefetch_related + ['valuedomain_set']
 
 
 class ConceptualDomain(concept):
@@ -1076,6 +1399,9 @@ class ConceptualDomain(concept):
     # no reason to model them separately.
 
     template = "aristotle_mdr/concepts/conceptualDomain.html"
+    detail_prefetch_related = concept.detail_prefetch_related + [
+        'dataelementconcept_set', 'valuedomain_set'
+    ]
     description = models.TextField(
         _('description'),
         blank=True,
@@ -1134,6 +1460,12 @@ class ValueDomain(concept):
     # no reason to model them separately.
 
     template = "aristotle_mdr/concepts/valueDomain.html"
+    detail_select_related = concept.detail_select_related + [
+        'data_type', 'unit_of_measure', 'conceptual_domain'
+    ]
+    detail_prefetch_related = concept.detail_prefetch_related + [
+        'permissiblevalue_set', 'supplementaryvalue_set', 'dataelement_set'
+    ]
 
     data_type = models.ForeignKey(  # 11.3.2.5.2.1
         DataType,
@@ -1170,6 +1502,7 @@ class ValueDomain(concept):
         help_text=('Description or specification of a rule, reference, or '
                    'range for a set of all values for a Value Domain.')
     )
+    tracker = FieldTracker()
 
     # Below is a dirty, dirty hack that came from re-designing permissible
     # values
@@ -1264,6 +1597,10 @@ class DataElementConcept(concept):
     # Redefine in this context as we need 'property' for the 11179 terminology.
     property_ = property
     template = "aristotle_mdr/concepts/dataElementConcept.html"
+    detail_select_related = concept.detail_select_related + [
+        'objectClass', 'property', 'conceptualDomain'
+    ]
+    detail_prefetch_related = concept.detail_prefetch_related + ['dataelement_set']
     objectClass = models.ForeignKey(  # 11.2.3.3
         ObjectClass, blank=True, null=True,
         help_text=_('references an Object_Class that is part of the specification of the Data_Element_Concept')
@@ -1276,6 +1613,7 @@ class DataElementConcept(concept):
         ConceptualDomain, blank=True, null=True,
         help_text=_('references a Conceptual_Domain that is part of the specification of the Data_Element_Concept')
     )
+    tracker = FieldTracker()
 
     @property_
     def registry_cascade_items(self):
@@ -1292,6 +1630,13 @@ class DataElementConcept(concept):
             (Property, Property.objects.filter(dataelementconcept=self)),
         ]
 
+    @classmethod
+    def get_bulk_download_items(cls, items):
+        return [
+            (ObjectClass, ObjectClass.objects.filter(dataelementconcept__in=items)),
+            (Property, Property.objects.filter(dataelementconcept__in=items)),
+        ]
+
 
 # Yes this name looks bad - blame 11179:3:2013 for renaming "administered item"
 # to "concept".
@@ -1300,6 +1645,18 @@ class DataElement(concept):
     Unit of data that is considered in context to be indivisible (3.2.28)"""
 
     template = "aristotle_mdr/concepts/dataElement.html"
+    detail_select_related = concept.detail_select_related + [
+        'dataElementConcept__objectClass', 'dataElementConcept__property',
+        'valueDomain__data_type', 'valueDomain__unit_of_measure',
+    ]
+    detail_prefetch_related = concept.detail_prefetch_related + [
+        'valueDomain__permissiblevalue_set', 'valueDomain__supplementaryvalue_set',
+        'input_to_derivation', 'derived_from',
+    ]
+    detail_related_statuses = [
+        'dataElementConcept', 'dataElementConcept__objectClass', 'dataElementConcept__property',
+        'valueDomain', 'input_to_derivation', 'derived_from',
+    ]
     dataElementConcept = models.ForeignKey(  # 11.5.3.2
         DataElementConcept,
         verbose_name="Data Element Concept",
@@ -1314,6 +1671,7 @@ class DataElement(concept):
         null=True,
         help_text=_("binds with a Data_Element_Concept that provides the meaning for the Data_Element")
     )
+    tracker = FieldTracker()
 
     @property
     def registry_cascade_items(self):
@@ -1333,6 +1691,15 @@ class DataElement(concept):
             (ValueDomain, ValueDomain.objects.filter(dataelement=self)),
         ]
 
+    @classmethod
+    def get_bulk_download_items(cls, items):
+        return [
+            (ObjectClass, ObjectClass.objects.filter(dataelementconcept__dataelement__in=items)),
+            (Property, Property.objects.filter(dataelementconcept__dataelement__in=items)),
+            (DataElementConcept, DataElementConcept.objects.filter(dataelement__in=items)),
+            (ValueDomain, ValueDomain.objects.filter(dataelement__in=items)),
+        ]
+
 
 class DataElementDerivation(concept):
     """
@@ -1341,6 +1708,10 @@ class DataElementDerivation(concept):
     output :model:`aristotle_mdr.DataElement`\s (3.2.33)
     """
 
+    detail_select_related = concept.detail_select_related + ['derives']
+    detail_prefetch_related = concept.detail_prefetch_related + ['inputs']
+    detail_related_statuses = ['derives', 'inputs']
+
     derives = models.ForeignKey(  # 11.5.3.5
         DataElement,
         related_name="derived_from",
@@ -1358,6 +1729,84 @@ class DataElementDerivation(concept):
         blank=True,
         help_text=_("text of a specification of a data element Derivation_Rule")
     )
+    tracker = FieldTracker()
+
+
+DOWNLOAD_JOB_STATES = Choices(
+    (0, 'queued', _('Queued')),
+    (5, 'running', _('Running')),
+    (10, 'complete', _('Complete')),
+    (15, 'failed', _('Failed')),
+)
+
+
+def download_job_path(instance, filename):
+    # A random directory, so a download can't be found from its title
+    return "aristotle_mdr/bulk_downloads/%s/%s" % (uuid.uuid4().hex, filename)
+
+
+@python_2_unicode_compatible  # Python 2
+class DownloadJob(TimeStampedModel):
+    """
+    A bulk download that is too large to build during a request. Jobs are built
+    in the background by ``aristotle_mdr.downloader.build_download_job``, and
+    the finished file is kept until the job is cleared by the
+    ``process_download_jobs`` management command.
+    """
+    user = models.ForeignKey(User, related_name='download_jobs')
+    download_type = models.CharField(max_length=32)
+    title = models.CharField(max_length=512, blank=True)
+    items = models.ManyToManyField(_concept, related_name='+', blank=True)
+    status = models.IntegerField(
+        choices=DOWNLOAD_JOB_STATES,
+        default=DOWNLOAD_JOB_STATES.queued,
+    )
+    progress = models.IntegerField(
+        default=0,
+        help_text=_("How much of the download has been built, as a percentage")
+    )
+    output = models.FileField(upload_to=download_job_path, storage=private_storage, blank=True, null=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return "{download_type} download of {title}".format(
+            download_type=self.download_type,
+            title=self.title or self.pk,
+        )
+
+    def get_absolute_url(self):
+        return reverse("aristotle:download_job", kwargs={'job_id': self.pk})
+
+    @property
+    def is_finished(self):
+        return self.status in [DOWNLOAD_JOB_STATES.complete, DOWNLOAD_JOB_STATES.failed]
+
+    def set_progress(self, progress, status=None):
+        self.progress = progress
+        fields = ['progress', 'modified']
+        if status is not None:
+            self.status = status
+            fields.append('status')
+        self.save(update_fields=fields)
+
+    def start(self):
+        """
+        Queues the job. Jobs in the database queue are left for the
+        ``process_download_jobs`` command, others are sent to the signal dispatcher.
+        """
+        if bulk_download_queue() != 'database':
+            fire("downloads.run_download_job", obj=self)
+
+
+def bulk_download_queue():
+    """
+    Returns how background downloads are run, or ``None`` if nothing is set up
+    to run them outside the request, so downloads are built during it.
+    """
+    queue = settings.ARISTOTLE_SETTINGS.get('BULK_DOWNLOAD_QUEUE', None)
+    if queue is None and not isinstance(get_dispatcher(), InlineDispatcher):
+        queue = 'dispatch'
+    return queue
 
 
 # Create a 1-1 user profile so we don't need to extend user
@@ -1455,6 +1904,156 @@ def create_user_profile(sender, instance, created, **kwargs):
 post_save.connect(create_user_profile, sender=User)
 
 
+def user_permissions_changed(sender, instance, **kwargs):
+    # Catches changes to is_superuser and is_active
+    perms.bump_generations('user', [instance.pk])
+post_save.connect(user_permissions_changed, sender=User)
+
+
+def membership_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Adding or removing users from workgroups or registration authorities
+    changes what they can view and edit, so invalidate their cached permissions.
+    """
+    if action not in ['post_add', 'post_remove', 'pre_clear']:
+        return
+    group_field = [f.name for f in sender._meta.fields if f.rel and f.rel.to is not User][0]
+    if reverse:
+        # Called from the user side, eg. ``user.viewer_in.add(workgroup)``
+        user_ids = [instance.pk]
+        group_model = model
+        if action == 'pre_clear':
+            pk_set = sender.objects.filter(user=instance).values_list(group_field, flat=True)
+        group_ids = pk_set
+    else:
+        group_ids = [instance.pk]
+        group_model = instance.__class__
+        if action == 'pre_clear':
+            pk_set = sender.objects.filter(**{group_field: instance.pk}).values_list('user', flat=True)
+        user_ids = pk_set
+
+    perms.bump_generations('user', user_ids)
+    if issubclass(group_model, Workgroup):
+        perms.bump_generations('workgroup', group_ids)
+
+for membership in [
+    Workgroup.viewers, Workgroup.submitters, Workgroup.stewards, Workgroup.managers,
+    RegistrationAuthority.registrars, RegistrationAuthority.managers,
+]:
+    m2m_changed.connect(membership_changed, sender=membership.through)
+
+
+@receiver(post_delete, sender=Workgroup)
+def workgroup_deleted(sender, instance, **kwargs):
+    perms.bump_generations('workgroup', [instance.pk])
+
+
+@receiver(post_save, sender=Workgroup)
+def workgroup_saved(sender, instance, created, **kwargs):
+    # Archiving or renaming a workgroup changes the pages of all of its items
+    if created:
+        return
+    perms.bump_generations('workgroup', [instance.pk])
+
+
+def concept_reference_fields(model):
+    """
+    Returns the foreign keys from a concept type to other concepts. Pages for
+    the referenced concepts list the items that refer to them.
+
+    The ``tracker`` of ``_concept`` only tracks its own fields, so types with
+    these foreign keys declare their own, which is used to find the concepts
+    they referred to before they were changed.
+    """
+    return [
+        field for field in model._meta.fields
+        if field.rel and not getattr(field.rel, 'parent_link', False) and
+        issubclass(field.rel.to, _concept)
+    ]
+
+
+def referenced_concept_ids(instance):
+    return [
+        getattr(instance, field.attname)
+        for field in concept_reference_fields(instance.__class__)
+        if getattr(instance, field.attname) is not None
+    ]
+
+
+def concept_dependencies_key(concept_id):
+    return 'concept_page_dependencies_%s' % concept_id
+
+
+def previous_concept_references(instance):
+    changed = instance.tracker.changed()
+    return [
+        changed[field.attname] for field in concept_reference_fields(instance.__class__)
+        if changed.get(field.attname) is not None
+    ]
+
+
+def page_dependencies(instance):
+    dependencies = [('concept', pk) for pk in referenced_concept_ids(instance)]
+    if instance.workgroup_id:
+        dependencies.append(('workgroup', instance.workgroup_id))
+    return dependencies
+
+
+def concept_page_dependencies(concept_id):
+    """
+    Returns the generation counters, as ``(kind, pk)`` tuples, that pages about
+    a concept depend on besides its own, which are those of its workgroup and
+    the concepts it refers to, as its pages show details of them. They are kept
+    in the cache when the concept is saved, so building a page cache key needs
+    no queries.
+    """
+    key = concept_dependencies_key(concept_id)
+    dependencies = cache.get(key)
+    if dependencies is None:
+        item = _concept.objects.filter(pk=concept_id).select_subclasses().first()
+        if item is None:
+            return []
+        dependencies = page_dependencies(item)
+        cache.set(key, dependencies, None)
+    return dependencies
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def concept_permissions_changed(sender, instance, **kwargs):
+    if not issubclass(sender, _concept):
+        return
+    # Pages of the items it refers to, or used to, list the items that refer to them
+    related = referenced_concept_ids(instance)
+    if kwargs.get('signal') is post_delete:
+        cache.delete(concept_dependencies_key(instance.pk))
+    else:
+        related += previous_concept_references(instance)
+        cache.set(concept_dependencies_key(instance.pk), page_dependencies(instance), None)
+    perms.bump_generations('concept', [instance.pk] + related)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def component_changed(sender, instance, **kwargs):
+    # Values and value meanings are shown on the page of their parent item
+    if not issubclass(sender, aristotleComponent) or kwargs.get('raw'):
+        return
+    perms.bump_generations('concept', referenced_concept_ids(instance))
+
+
+def favourites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Favourites are shown on item pages, which are cached against the user
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    if reverse:
+        user_ids = PossumProfile.objects.filter(pk__in=pk_set or []).values_list('user', flat=True)
+    else:
+        user_ids = [instance.user_id]
+    perms.bump_generations('user', user_ids)
+m2m_changed.connect(favourites_changed, sender=PossumProfile.favourites.through)
+
+
 @receiver(post_save)
 def concept_saved(sender, instance, **kwargs):
     if not issubclass(sender, _concept):
@@ -1495,6 +2094,34 @@ def new_post_created(sender, **kwargs):
     fire("concept_changes.new_post_created", obj=post, **kwargs)
 
 
+@receiver(concept_visibility_updated)
+def prerender_public_pdf(sender, concept, **kwargs):
+    if not concept.is_public():
+        return
+    if settings.ARISTOTLE_SETTINGS.get('PDF_PRERENDER_ON_PUBLISH', False):
+        fire("downloads.prerender_pdf", obj=concept)
+
+
+@receiver(concept_visibility_updated)
+def refresh_sitemap_for_visibility(sender, concept, **kwargs):
+    # Items are added to or removed from the sitemap when they become public or stop being public
+    fire("sitemaps.refresh_sitemap", concept_id=concept.pk)
+
+
+@receiver(post_save)
+def refresh_sitemap_for_concept(sender, instance, **kwargs):
+    if not issubclass(sender, _concept) or kwargs.get('raw'):
+        return
+    if instance._is_public and instance.non_cached_fields_changed:
+        fire("sitemaps.refresh_sitemap", concept_id=instance.pk)
+
+
+@receiver(post_delete)
+def refresh_sitemap_for_deleted_concept(sender, instance, **kwargs):
+    if issubclass(sender, _concept) and instance._is_public:
+        fire("sitemaps.refresh_sitemap", concept_id=instance.pk)
+
+
 @receiver(post_save, sender=Status)
 def states_changed(sender, instance, *args, **kwargs):
     fire("concept_changes.status_changed", obj=instance, **kwargs)
@@ -1506,3 +2133,9 @@ def review_request_changed(sender, instance, *args, **kwargs):
         fire("action_signals.review_request_created", obj=instance, **kwargs)
     else:
         fire("action_signals.review_request_updated", obj=instance, **kwargs)
+
+
+@receiver(post_delete, sender=DownloadJob)
+def remove_download_job_output(sender, instance, **kwargs):
+    if instance.output:
+        instance.output.delete(save=False)
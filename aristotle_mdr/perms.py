@@ -1,9 +1,20 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
-VIEW_CACHE_SECONDS=60
-EDIT_CACHE_SECONDS=60
+import datetime
+import time
+
+# Permission results are cached against generation counters that are bumped
+# whenever a user, workgroup or concept changes in a way that could alter the
+# result, so they can be kept for a long time without going stale. Results for
+# concepts with a status or publication that starts or ends in the future are
+# only kept until that date, as nothing is saved when it arrives.
+VIEW_CACHE_SECONDS=60 * 60 * 6
+EDIT_CACHE_SECONDS=60 * 60 * 6
 
 
 def user_can_alter_comment(user, comment):
@@ -14,33 +25,170 @@ def user_can_alter_post(user, post):
     return user.is_superuser or user == post.author or user_is_workgroup_manager(user, post.workgroup)
 
 
-def user_can_view(user, item):
-    """Can the user view the item?"""
-    if user.is_superuser:
-        return True
-    if item.__class__ == User:              # -- Sometimes duck-typing fails --
-        return user == item                 # A user can edit their own details
-
+def _generation_key(kind, pk):
+    return 'perm_generation_%s_%s' % (kind, pk)
+
+
+def _new_generation():
+    # Seed counters from the clock, so a counter that is evicted from the cache
+    # never restarts at a value that existing cache keys were built with.
+    return int(time.time() * 1000)
+
+
+def get_generations(keys):
+    """
+    Takes a list of ``(kind, pk)`` tuples, where kind is one of ``'user'``,
+    ``'workgroup'`` or ``'concept'``, and returns a dictionary mapping each tuple
+    to its current generation counter.
+    """
+    cache_keys = dict((_generation_key(kind, pk), (kind, pk)) for kind, pk in keys)
+    found = cache.get_many(list(cache_keys.keys()))
+    for key in cache_keys.keys():
+        if key not in found:
+            cache.add(key, _new_generation(), None)
+            found[key] = cache.get(key)
+    return dict((cache_keys[key], generation) for key, generation in found.items())
+
+
+def get_generation(kind, pk):
+    return get_generations([(kind, pk)])[(kind, pk)]
+
+
+def bump_generations(kind, pks):
+    """
+    Invalidates all cached permissions that depend on the given objects.
+    """
+    for pk in set(pks):
+        key = _generation_key(kind, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), None)
+
+
+def next_visibility_changes(concept_ids):
+    """
+    Returns a dictionary mapping the ids of concepts whose visibility will
+    change on a future date, without them being saved, to the earliest of
+    those dates. This covers statuses that start or end in the future, and the
+    ``next_change`` functions in ``EXTRA_CONCEPT_QUERYSETS``, which take a list
+    of concept ids and return a dictionary like this one.
+    """
+    from aristotle_mdr.models import Status
+    today = timezone.now().date()
+    changes = {}
+
+    def add(concept_id, day):
+        if day > today and (concept_id not in changes or day < changes[concept_id]):
+            changes[concept_id] = day
+
+    statuses = Status.objects.filter(concept__in=concept_ids).filter(
+        Q(registrationDate__gt=today) | Q(until_date__gte=today)
+    ).values_list('concept', 'registrationDate', 'until_date')
+    for concept_id, registration_date, until_date in statuses:
+        add(concept_id, registration_date)
+        if until_date is not None:
+            # Statuses are current up to and including their until date
+            add(concept_id, until_date + datetime.timedelta(days=1))
+
+    extra_changes = settings.ARISTOTLE_SETTINGS.get('EXTRA_CONCEPT_QUERYSETS', {}).get('next_change', None)
+    for func in extra_changes or []:
+        for concept_id, day in import_string(func)(concept_ids).items():
+            add(concept_id, day)
+    return changes
+
+
+def _seconds_until(day):
+    starts = datetime.datetime.combine(day, datetime.time.min)
+    if settings.USE_TZ:
+        starts = timezone.make_aware(starts, timezone.utc)
+    return max(1, int((starts - timezone.now()).total_seconds()) + 1)
+
+
+def _is_concept(item):
+    from aristotle_mdr.models import _concept
+    return isinstance(item, _concept)
+
+
+def _cached_concept_checks(check, user, items):
+    """
+    Resolves a view or edit check for a list of concepts, using one cache
+    lookup for the generation counters, one for the results and at most one
+    query for any uncached results.
+    """
     if user.is_anonymous():
         user_key = "anonymous"
+        user_generations = []
     else:
         user_key = str(user.id)
+        user_generations = [('user', user.id)]
+
+    def item_generations(item):
+        generations = [('concept', item.id)]
+        if getattr(item, 'workgroup_id', None):
+            generations.append(('workgroup', item.workgroup_id))
+        return user_generations + generations
+
+    generations = get_generations(set(
+        generation for item in items for generation in item_generations(item)
+    ))
+    keys = dict(
+        (
+            'user_can_%s_%s|%s|%s' % (
+                check, user_key, str(item.id),
+                ".".join(str(generations[g]) for g in item_generations(item))
+            ),
+            item
+        )
+        for item in items
+    )
+
+    results = {}
+    misses = []
+    cached = cache.get_many(list(keys.keys()))
+    for key, item in keys.items():
+        if key in cached:
+            results[item.id] = cached[key]
+        else:
+            misses.append(item)
+
+    if misses:
+        from aristotle_mdr.models import _concept
+        qs = _concept.objects.filter(pk__in=[item.pk for item in misses]).visible(user)
+        if check == 'edit':
+            # Users can only edit what they can see
+            qs = qs.editable(user)
+        allowed = set(qs.values_list('pk', flat=True))
+
+        if check == 'edit':
+            cache_seconds = EDIT_CACHE_SECONDS
+        else:
+            cache_seconds = VIEW_CACHE_SECONDS
+        changes = next_visibility_changes([item.pk for item in misses])
+
+        # Results are grouped by how long they can be kept for
+        new_values = {}
+        for key, item in keys.items():
+            if key not in cached:
+                results[item.id] = item.pk in allowed
+                timeout = cache_seconds
+                if item.pk in changes:
+                    timeout = min(timeout, _seconds_until(changes[item.pk]))
+                new_values.setdefault(timeout, {})[key] = item.pk in allowed
+        for timeout, values in new_values.items():
+            cache.set_many(values, timeout)
+    return results
 
-    # If the item was modified in the last 15 seconds, don't use cache
-    if hasattr(item, "was_modified_very_recently") and item.was_modified_very_recently():
-        can_use_cache = False
-    else:
-        can_use_cache = True
-
-    cached_can_view = cache.get('user_can_view_%s|%s' % (user_key, str(item.id)))
-    if can_use_cache and cached_can_view is not None:
-        return cached_can_view
 
-    _can_view = False
-
-    _can_view = item.can_view(user)
-    cache.set('user_can_view_%s|%s' % (str(user.id), str(item.id)), _can_view, VIEW_CACHE_SECONDS)
-    return _can_view
+def user_can_view(user, item):
+    """Can the user view the item?"""
+    if user.is_superuser:
+        return True
+    if item.__class__ == User:              # -- Sometimes duck-typing fails --
+        return user == item                 # A user can edit their own details
+    if not _is_concept(item):
+        return item.can_view(user)
+    return _cached_concept_checks('view', user, [item])[item.id]
 
 
 def user_can_edit(user, item):
@@ -54,26 +202,45 @@ def user_can_edit(user, item):
     # A user can edit their own details
     if item.__class__ == User:              # -- Sometimes duck-typing fails --
         return user == item
+    if not _is_concept(item):
+        return user_can_view(user, item) and item.can_edit(user)
+    return _cached_concept_checks('edit', user, [item])[item.id]
+
+
+def user_can_view_many(user, items):
+    """
+    Batched version of ``user_can_view``.
+    Returns a dictionary mapping the id of each item to whether the user can
+    view it, using one cache lookup and at most one query for uncached items.
+    """
+    items = [item for item in items if item is not None]
+    if user.is_superuser:
+        return dict((item.id, True) for item in items)
+
+    concepts = [item for item in items if _is_concept(item)]
+    results = dict((item.id, user_can_view(user, item)) for item in items if not _is_concept(item))
+    if concepts:
+        results.update(_cached_concept_checks('view', user, concepts))
+    return results
+
+
+def user_can_edit_many(user, items):
+    """
+    Batched version of ``user_can_edit``.
+    Returns a dictionary mapping the id of each item to whether the user can
+    edit it, using one cache lookup and at most one query for uncached items.
+    """
+    items = [item for item in items if item is not None]
+    if user.is_superuser:
+        return dict((item.id, True) for item in items)
+    if user.is_anonymous():
+        return dict((item.id, False) for item in items)
 
-    if hasattr(item, "was_modified_very_recently") and item.was_modified_very_recently():
-        # If the item was modified in the last 15 seconds, don't use cache
-        can_use_cache = False
-    else:
-        can_use_cache = True
-
-    cached_can_edit = cache.get('user_can_edit_%s|%s' % (str(user.id), str(item.id)))
-    if can_use_cache and cached_can_edit is not None:
-        return cached_can_edit
-
-    _can_edit = False
-
-    if not user_can_view(user, item):
-        _can_edit = False
-    else:
-        _can_edit = item.can_edit(user)
-    cache.set('user_can_edit_%s|%s' % (str(user.id), str(item.id)), _can_edit, VIEW_CACHE_SECONDS)
-
-    return _can_edit
+    concepts = [item for item in items if _is_concept(item)]
+    results = dict((item.id, user_can_edit(user, item)) for item in items if not _is_concept(item))
+    if concepts:
+        results.update(_cached_concept_checks('edit', user, concepts))
+    return results
 
 
 def user_is_editor(user, workgroup=None):
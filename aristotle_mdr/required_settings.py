@@ -6,6 +6,8 @@ BASE_DIR = os.getenv('aristotlemdr__BASE_DIR', os.path.dirname(os.path.dirname(_
 SECRET_KEY = os.getenv('aristotlemdr__SECRET_KEY', "OVERRIDE_THIS_IN_PRODUCTION")
 STATIC_ROOT = os.getenv('aristotlemdr__STATIC_ROOT', os.path.join(BASE_DIR, "static"))
 MEDIA_ROOT = os.getenv('aristotlemdr__MEDIA_ROOT', os.path.join(BASE_DIR, "media"))
+# Files that are only sent by views that check permissions, this must not be served publicly.
+PRIVATE_MEDIA_ROOT = os.getenv('aristotlemdr__PRIVATE_MEDIA_ROOT', os.path.join(BASE_DIR, "private_media"))
 
 TEMPLATE_DIRS = [os.path.join(BASE_DIR, 'templates')]
 FIXTURES_DIRS = [os.path.join(BASE_DIR, 'fixtures')]
@@ -158,6 +160,11 @@ ARISTOTLE_DOWNLOADS = [
     # (fileType, menu, font-awesome-icon, module)
     ('pdf', 'PDF', 'fa-file-pdf-o', 'aristotle_mdr', 'Downloads for various content types in the PDF format'),
     ('csv-vd', 'CSV list of values', 'fa-file-excel-o', 'aristotle_mdr', 'CSV downloads for value domain codelists'),
+    ('tsv-vd', 'TSV list of values', 'fa-file-text-o', 'aristotle_mdr', 'Tab separated downloads for value domain codelists'),
+    ('jsonl-vd', 'JSON lines list of values', 'fa-file-code-o', 'aristotle_mdr', 'JSON lines downloads for value domain codelists'),
+    ('csv', 'CSV', 'fa-file-excel-o', 'aristotle_mdr', 'CSV listings of metadata items'),
+    ('tsv', 'TSV', 'fa-file-text-o', 'aristotle_mdr', 'Tab separated listings of metadata items'),
+    ('jsonl', 'JSON lines', 'fa-file-code-o', 'aristotle_mdr', 'JSON lines listings of metadata items'),
 ]
 
 CKEDITOR_CONFIGS = {
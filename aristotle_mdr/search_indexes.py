@@ -2,7 +2,8 @@ import datetime
 import haystack.indexes as indexes
 
 import aristotle_mdr.models as models
-from django.db.models import Q
+from django.apps import apps
+from django.db.models import Prefetch
 from django.template import TemplateDoesNotExist
 from django.utils import timezone
 
@@ -41,7 +42,6 @@ class baseObjectIndex(indexes.SearchIndex):
     modified = indexes.DateTimeField(model_attr='modified')
     created = indexes.DateTimeField(model_attr='created')
     name = indexes.CharField(model_attr='name', boost=1)
-    # access = indexes.MultiValueField()
 
     def get_model(self):
         raise NotImplementedError  # pragma: no cover -- This should always be overridden
@@ -52,25 +52,6 @@ class baseObjectIndex(indexes.SearchIndex):
 
         return self.get_model().objects.filter(modified__lte=timezone.now())
 
-    # def have_access(self, obj):
-    #    for user in obj.viewers.users():
-    #        yield user
-
-    #    for group in obj.viewers.groups():
-    #        yield group
-
-    # def prepare_access(self, obj):
-    #    def _access_iter(obj):
-    #        have_access = self.have_access(obj)
-    #
-    #        for obj in have_access:
-    #            if isinstance(obj, User):
-    #                yield 'user_%i' % obj.id
-    #            elif isinstance(obj, Group):
-    #                yield 'group_%i' % obj.id
-    #
-    #    return list(_access_iter(obj))
-
 
 class conceptIndex(baseObjectIndex):
     statuses = indexes.MultiValueField(faceted=True)
@@ -83,34 +64,94 @@ class conceptIndex(baseObjectIndex):
     version = indexes.CharField(model_attr="version")
     submitter_id = indexes.IntegerField(model_attr="submitter_id", null=True)
     facet_model_ct = indexes.IntegerField(faceted=True)
+    # The principals that can see an item, so search permission checks are a single terms filter
+    access = indexes.MultiValueField()
 
     template_name = "search/searchItem.html"
 
+    def index_queryset(self, using=None):
+        """
+        Prefetches the status and review data for each batch of items, so
+        that indexing takes a fixed number of queries per batch.
+        """
+        qs = super(conceptIndex, self).index_queryset(using).select_related(
+            'workgroup'
+        ).prefetch_related(
+            'statuses',
+            'access_principals',
+            Prefetch(
+                'statuses',
+                queryset=models.Status.objects.current().order_by(
+                    "registrationAuthority", "-registrationDate", "-created"
+                ),
+                to_attr='_index_current_statuses'
+            ),
+            Prefetch(
+                'review_requests',
+                queryset=models.ReviewRequest.objects.exclude(status=models.REVIEW_STATES.cancelled),
+                to_attr='_index_active_review_requests'
+            ),
+        )
+        if apps.is_installed('aristotle_mdr.contrib.slots'):
+            # Slots are included in the text template for every item
+            qs = qs.prefetch_related('slots__type')
+        return qs
+
+    def read_queryset(self, using=None):
+        """
+        Loads search results along with the statuses shown in their result
+        template, so a page of results needs no queries while it renders.
+        """
+        return self.get_model().objects.prefetch_related(models.prefetch_current_statuses())
+
+    def full_prepare(self, obj):
+        # Items that weren't fetched through index_queryset (for example, when
+        # a single item is saved) get their status data loaded once here.
+        # It is discarded afterwards so it is never stale on a later update.
+        if not hasattr(obj, '_index_current_statuses'):
+            obj._index_current_statuses = list(obj.current_statuses())
+        if not hasattr(obj, '_index_active_review_requests'):
+            obj._index_active_review_requests = list(
+                obj.review_requests.exclude(status=models.REVIEW_STATES.cancelled)
+            )
+        try:
+            return super(conceptIndex, self).full_prepare(obj)
+        finally:
+            del obj._index_current_statuses
+            del obj._index_active_review_requests
+
     def prepare_registrationAuthorities(self, obj):
-        ras_stats = [str(s.registrationAuthority.id) for s in obj.current_statuses().all()]
-        ras_reqs = [str(rr.registration_authority.id) for rr in obj.review_requests.filter(~Q(status=models.REVIEW_STATES.cancelled)).all()]
+        ras_stats = [str(s.registrationAuthority_id) for s in obj._index_current_statuses]
+        ras_reqs = [str(rr.registration_authority_id) for rr in obj._index_active_review_requests]
 
         return list(set(ras_stats + ras_reqs))
 
     def prepare_is_public(self, obj):
         return obj.is_public()
 
+    def prepare_access(self, obj):
+        # These match the principals from ``models.user_principals``
+        access = [a.principal for a in obj.access_principals.all()]
+        if obj.is_public():
+            access.append(models.PUBLIC_PRINCIPAL)
+        return access
+
     def prepare_workgroup(self, obj):
-        if obj.workgroup:
-            return int(obj.workgroup.id)
+        if obj.workgroup_id:
+            return int(obj.workgroup_id)
         else:
             return -99
 
     def prepare_statuses(self, obj):
         # We don't remove duplicates as it should mean the more standard it is the higher it will rank
-        states = [int(s.state) for s in obj.current_statuses().all()]
+        states = [int(s.state) for s in obj._index_current_statuses]
         if not states:
             states = ['-99']  # This is an unregistered item
         return states
 
     def prepare_highest_state(self, obj):
         # Include -99, so "unregistered" items get a value
-        state = max([int(s.state) for s in obj.current_statuses().all()] + [-99])
+        state = max([int(s.state) for s in obj._index_current_statuses] + [-99])
         """
         We don't want retired or superseded ranking higher than standards during search
         as these are no longer "fit for purpose" so we'll place them below other
@@ -125,12 +166,13 @@ class conceptIndex(baseObjectIndex):
     def prepare_ra_statuses(self, obj):
         # This allows us to check a registration authority and a state simultaneously
         states = [
-            "%s___%s" % (str(s.registrationAuthority.id), str(s.state)) for s in obj.current_statuses().all()
+            "%s___%s" % (str(s.registrationAuthority_id), str(s.state)) for s in obj._index_current_statuses
         ]
         return states
 
     def prepare_facet_model_ct(self, obj):
         # We need to use the content type, as if we use text it gets stemmed wierdly
+        # get_for_model is cached, so this only queries once per model
         from django.contrib.contenttypes.models import ContentType
         ct = ContentType.objects.get_for_model(obj)
         return ct.pk
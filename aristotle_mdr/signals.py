@@ -9,6 +9,20 @@ import haystack.signals as signals  # .RealtimeSignalProcessor as RealtimeSignal
 #    pass
 
 
+def search_index_generation(using='default'):
+    """
+    Returns the generation counter for a search connection, which is bumped
+    whenever its index changes, so cached search results can be discarded.
+    """
+    from aristotle_mdr import perms
+    return perms.get_generation('search_index', using)
+
+
+def bump_search_index_generation(using='default'):
+    from aristotle_mdr import perms
+    perms.bump_generations('search_index', [using])
+
+
 class AristotleSignalProcessor(signals.BaseSignalProcessor):
     def setup(self):
         from aristotle_mdr.models import _concept, Workgroup, ReviewRequest, concept_visibility_updated
@@ -27,6 +41,16 @@ class AristotleSignalProcessor(signals.BaseSignalProcessor):
         pre_delete.disconnect(self.handle_concept_delete, sender=_concept)
         super(AristotleSignalProcessor, self).teardown()
 
+    def handle_save(self, sender, instance, **kwargs):
+        super(AristotleSignalProcessor, self).handle_save(sender, instance, **kwargs)
+        for using in self.connection_router.for_write(instance=instance):
+            bump_search_index_generation(using)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        super(AristotleSignalProcessor, self).handle_delete(sender, instance, **kwargs)
+        for using in self.connection_router.for_write(instance=instance):
+            bump_search_index_generation(using)
+
     def handle_concept_recache(self, concept, **kwargs):
         from aristotle_mdr.models import _concept
         instance = concept.item
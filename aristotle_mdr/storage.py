@@ -0,0 +1,29 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def private_media_root():
+    root = getattr(settings, 'PRIVATE_MEDIA_ROOT', None)
+    return root or os.path.normpath(settings.MEDIA_ROOT) + "_private"
+
+
+@deconstructible
+class PrivateStorage(FileSystemStorage):
+    """
+    Stores files that must only be sent by views that check who can see them,
+    such as downloads of items that aren't public. Files are kept under the
+    ``PRIVATE_MEDIA_ROOT`` setting, which shouldn't be served by the web server.
+    """
+    def __init__(self, location=None, base_url=None, **kwargs):
+        super(PrivateStorage, self).__init__(
+            location=location or private_media_root(), base_url=base_url, **kwargs
+        )
+
+    def url(self, name):
+        raise ValueError("Files in private storage don't have a public URL")
+
+
+private_storage = PrivateStorage()
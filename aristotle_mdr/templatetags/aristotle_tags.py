@@ -108,6 +108,9 @@ def can_view_iter(qs, user):
     user as the argument returns a list (not a ``Queryset`` at this stage) of only
     the items from the ``Queryset`` the user can view.
 
+    If a list of items is passed instead of a ``Queryset``, the permissions for
+    all items are checked together using ``aristotle_mdr.perms.user_can_view_many``.
+
     If calling ``can_view_iter`` throws an exception it safely returns an empty list.
 
     For example::
@@ -117,7 +120,34 @@ def can_view_iter(qs, user):
         {% endfor %}
     """
     try:
-        return qs.visible(user)
+        if hasattr(qs, 'visible'):
+            return qs.visible(user)
+        items = list(qs)
+        can_view = perms.user_can_view_many(user, items)
+        return [item for item in items if can_view[item.id]]
+    except:  # pragma: no cover -- passing a bad queryset is the template authors fault
+        return []
+
+
+@register.filter
+def can_edit_iter(items, user):
+    """
+    A filter that returns a list of only the items from the given ``Queryset``
+    or list that the user can edit. The permissions for all items are checked
+    together using ``aristotle_mdr.perms.user_can_edit_many``.
+
+    If calling ``can_edit_iter`` throws an exception it safely returns an empty list.
+
+    For example::
+
+        {% for item in myItems|can_edit_iter:request.user %}
+          {{ item }}
+        {% endfor %}
+    """
+    try:
+        items = list(items)
+        can_edit = perms.user_can_edit_many(user, items)
+        return [item for item in items if can_edit[item.id]]
     except:  # pragma: no cover -- passing a bad queryset is the template authors fault
         return []
 
@@ -162,10 +192,23 @@ def paginator_get(request, pageNumber, pop=''):
     dict_ = request.GET.copy()
     for p in pop.split(','):
         dict_.pop(p, None)
+    dict_.pop('cursor', None)
     dict_['page'] = pageNumber
     return dict_.urlencode()
 
 
+@register.simple_tag
+def paginator_cursor_get(request, cursor):
+    """
+    Like ``paginator_get``, for pages from a ``CursorPaginator`` that are
+    found with a cursor instead of a page number.
+    """
+    dict_ = request.GET.copy()
+    dict_.pop('page', None)
+    dict_['cursor'] = cursor
+    return dict_.urlencode()
+
+
 @register.simple_tag
 def ifeq(a, b, val):
     return val if a == b else ""
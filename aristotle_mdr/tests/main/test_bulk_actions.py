@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.test import TestCase, override_settings
 import aristotle_mdr.models as models
@@ -6,6 +7,8 @@ import aristotle_mdr.perms as perms
 import aristotle_mdr.tests.utils as utils
 
 import datetime
+import json
+import os
 
 from django.test.utils import setup_test_environment
 setup_test_environment()
@@ -517,3 +520,132 @@ class BulkDownloadTests(BulkActionsTest, TestCase):
         self.assertContains(response, self.item2.definition)  # Will be in as its a component of DEC5
         self.assertContains(response, self.item5.definition)
 
+    @override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS, BULK_DOWNLOAD_ASYNC_THRESHOLD=1, BULK_DOWNLOAD_QUEUE='dispatch'))
+    def test_large_bulk_pdf_download_runs_as_a_job(self):
+        self.login_editor()
+
+        response = self.client.post(
+            reverse('aristotle:bulk_action'),
+            {
+                'bulkaction': 'bulk_download',
+                'items': [self.item1.id, self.item2.id],
+                "title": "The title",
+                "download_type": self.download_type,
+                'confirmed': 'confirmed',
+            }
+        )
+        job = models.DownloadJob.objects.get(user=self.editor)
+        self.assertRedirects(response, reverse('aristotle:download_job', args=[job.pk]))
+        self.assertEqual(sorted(job.items.values_list('pk', flat=True)), sorted([self.item1.pk, self.item2.pk]))
+
+        # Jobs are run inline in tests, so it has already finished
+        response = self.client.get(reverse('aristotle:download_job', args=[job.pk]), {'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertTrue(data['finished'])
+        self.assertEqual(data['progress'], 100)
+
+        response = self.client.get(reverse('aristotle:download_job_file', args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        # The file isn't kept anywhere that is served publicly
+        from aristotle_mdr.storage import private_media_root
+        job = models.DownloadJob.objects.get(pk=job.pk)
+        self.assertTrue(job.output.path.startswith(os.path.abspath(private_media_root())))
+
+        # Only the user who asked for a download can see it
+        self.login_viewer()
+        response = self.client.get(reverse('aristotle:download_job', args=[job.pk]))
+        self.assertEqual(response.status_code, 404)
+        job.delete()
+
+    @override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS, BULK_DOWNLOAD_ASYNC_THRESHOLD=1))
+    def test_large_bulk_pdf_download_is_built_in_the_request_without_a_queue(self):
+        self.login_editor()
+        response = self.client.post(
+            reverse('aristotle:bulk_action'),
+            {
+                'bulkaction': 'bulk_download',
+                'items': [self.item1.id, self.item2.id],
+                "title": "The title",
+                "download_type": self.download_type,
+                'confirmed': 'confirmed',
+            }
+        )
+        self.assertFalse(models.DownloadJob.objects.filter(user=self.editor).exists())
+        self.assertTrue(reverse('aristotle:bulk_download', kwargs={'download_type': self.download_type}) in response['Location'])
+
+    @override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS, BULK_DOWNLOAD_QUEUE='database'))
+    def test_database_queued_download_jobs(self):
+        job = models.DownloadJob.objects.create(user=self.editor, download_type='pdf', title="The title")
+        job.items.add(self.item1, self.item4)
+        # Jobs in the database queue are left for the management command
+        job.start()
+        self.assertEqual(models.DownloadJob.objects.get(pk=job.pk).status, models.DOWNLOAD_JOB_STATES.queued)
+
+        call_command('process_download_jobs', once=True, verbosity=0)
+        job = models.DownloadJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, models.DOWNLOAD_JOB_STATES.complete)
+        self.assertTrue(job.output)
+        job.delete()
+
+    def test_stalled_download_jobs_are_queued_again(self):
+        import datetime
+        from django.utils import timezone
+        job = models.DownloadJob.objects.create(user=self.editor, download_type='pdf', title="The title")
+        job.items.add(self.item1)
+        # Left running by a worker that stopped two hours ago
+        models.DownloadJob.objects.filter(pk=job.pk).update(
+            status=models.DOWNLOAD_JOB_STATES.running,
+            modified=timezone.now() - datetime.timedelta(hours=2)
+        )
+        call_command('process_download_jobs', once=True, verbosity=0)
+        job = models.DownloadJob.objects.get(pk=job.pk)
+        self.assertEqual(job.status, models.DOWNLOAD_JOB_STATES.complete)
+        job.delete()
+
+
+class BulkStreamingDownloadTests(BulkActionsTest, TestCase):
+    def test_bulk_csv_download_only_includes_visible_items(self):
+        self.login_editor()
+        self.item5 = models.DataElementConcept.objects.create(name="DEC1", definition="DEC5 definition", objectClass=self.item2, workgroup=self.wg1)
+
+        response = self.client.get(
+            reverse('aristotle:bulk_download', kwargs={"download_type": "csv"}),
+            {"items": [self.item1.id, self.item4.id, self.item5.id], "title": "The title"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(self.item1.name in content)
+        self.assertTrue(self.item2.name in content)  # Will be in as its a component of DEC5
+        self.assertTrue(self.item5.name in content)
+        self.assertFalse(self.item4.name in content)
+
+
+    def test_bulk_download_queries_do_not_grow_with_items(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.login_editor()
+        decs = [
+            models.DataElementConcept.objects.create(
+                name="DEC %s" % i, definition="DEC definition", objectClass=self.item2, workgroup=self.wg1
+            )
+            for i in range(10)
+        ]
+
+        def download(items):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    reverse('aristotle:bulk_download', kwargs={"download_type": "csv"}),
+                    {"items": [item.id for item in items], "title": "The title"}
+                )
+                content = b''.join(response.streaming_content).decode('utf-8')
+            return len(queries), content
+
+        download(decs[:2])  # Warm up any cached permissions
+        few_queries, content = download(decs[:2])
+        many_queries, content = download(decs)
+        self.assertEqual(few_queries, many_queries)
+        for dec in decs:
+            self.assertTrue(dec.name in content)
@@ -34,6 +34,59 @@ class AnonymousUserViewingThePages(TestCase):
         response = self.client.get("/sitemaps/sitemap_0.xml")
         self.assertEqual(response.status_code,200)
 
+    def test_sitemaps_use_the_request_host_without_a_base_url(self):
+        from django.core.files.storage import default_storage
+        from aristotle_mdr.views import sitemaps
+
+        wg = models.Workgroup.objects.create(name="Setup WG")
+        ra = models.RegistrationAuthority.objects.create(name="Test RA")
+        item = models.ObjectClass.objects.create(name="Sitemap OC", definition="", workgroup=wg)
+        models.Status.objects.create(
+            concept=item, registrationAuthority=ra,
+            registrationDate=datetime.date(2009, 4, 28), state=ra.public_state
+        )
+        page = sitemaps.sitemap_page_for_concept(item.pk)
+        for path in [sitemaps.sitemap_path(), sitemaps.sitemap_path(page)]:
+            if default_storage.exists(path):
+                default_storage.delete(path)
+
+        response = self.client.get("/sitemap.xml", HTTP_HOST='registry.example.com')
+        self.assertContains(response, "http://registry.example.com")
+        response = self.client.get(reverse('aristotle:sitemap_range_xml', args=[page]))
+        self.assertContains(response, "http://testserver%s" % item.get_absolute_url())
+        self.assertFalse(default_storage.exists(sitemaps.sitemap_path()))
+        self.assertFalse(default_storage.exists(sitemaps.sitemap_path(page)))
+
+    @override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS, SITEMAP_BASE_URL='http://testserver/'))
+    def test_sitemaps_are_stored_and_refreshed(self):
+        import gzip
+        from io import BytesIO
+        from django.core.files.storage import default_storage
+        from aristotle_mdr.views import sitemaps
+
+        wg = models.Workgroup.objects.create(name="Setup WG")
+        ra = models.RegistrationAuthority.objects.create(name="Test RA")
+        item = models.ObjectClass.objects.create(name="Sitemap OC", definition="", workgroup=wg)
+        page = sitemaps.sitemap_page_for_concept(item.pk)
+        for path in [sitemaps.sitemap_path(), sitemaps.sitemap_path(page)]:
+            if default_storage.exists(path):
+                default_storage.delete(path)
+        url = reverse('aristotle:sitemap_range_xml', args=[page])
+
+        self.assertNotContains(self.client.get(url), item.get_absolute_url())
+        self.assertTrue(default_storage.exists(sitemaps.sitemap_path(page)))
+
+        models.Status.objects.create(
+            concept=item, registrationAuthority=ra,
+            registrationDate=datetime.date(2009, 4, 28), state=ra.public_state
+        )
+        self.assertContains(self.client.get(url), item.get_absolute_url())
+
+        response = self.client.get("/sitemap.xml", HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        index = gzip.GzipFile(fileobj=BytesIO(response.content)).read().decode('utf-8')
+        self.assertTrue(url in index)
+
     def test_visible_item(self):
         wg = models.Workgroup.objects.create(name="Setup WG")
         ra = models.RegistrationAuthority.objects.create(name="Test RA")
@@ -1019,6 +1072,34 @@ class LoggedInViewConceptPages(utils.LoggedInViewPages):
 class ObjectClassViewPage(LoggedInViewConceptPages,TestCase):
     url_name='objectClass'
     itemType=models.ObjectClass
+
+    def test_pdf_downloads_are_cached_until_item_changes(self):
+        from aristotle_mdr.storage import private_storage
+        from aristotle_mdr import downloader
+        from aristotle_mdr.utils import get_download_template_path_for_item
+        self.login_viewer()
+
+        def cache_path():
+            item = self.itemType.objects.get(pk=self.item1.pk)
+            template = get_download_template_path_for_item(item, 'pdf')
+            return downloader.item_pdf_cache_path(item, template, 'A4')
+
+        first_path = cache_path()
+        response = self.client.get(reverse('aristotle:download',args=['pdf',self.item1.id]), {'pagesize': 'A4'})
+        self.assertEqual(response.status_code,200)
+        self.assertTrue(private_storage.exists(first_path))
+        with private_storage.open(first_path) as f:
+            self.assertEqual(f.read(), response.content)
+
+        self.item1.definition = "A changed definition"
+        self.item1.save()
+        second_path = cache_path()
+        self.assertNotEqual(first_path, second_path)
+        response = self.client.get(reverse('aristotle:download',args=['pdf',self.item1.id]), {'pagesize': 'A4'})
+        self.assertTrue(private_storage.exists(second_path))
+        self.assertFalse(private_storage.exists(first_path))
+        private_storage.delete(second_path)
+
 class PropertyViewPage(LoggedInViewConceptPages,TestCase):
     url_name='property'
     itemType=models.Property
@@ -1165,6 +1246,37 @@ class ValueDomainViewPage(LoggedInViewConceptPages,TestCase):
         response = self.client.get(reverse('aristotle:download',args=['csv-vd',self.item2.id]))
         self.assertEqual(response.status_code,403)
 
+    def test_value_downloads_are_only_for_value_domains(self):
+        self.login_viewer()
+        item = models.ObjectClass.objects.create(name="Not a value domain", definition=" ", workgroup=self.wg1)
+        for download_type in ['csv-vd', 'tsv-vd', 'jsonl-vd']:
+            response = self.client.get(reverse('aristotle:download', args=[download_type, item.id]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_value_downloads_are_streamed_in_order(self):
+        import json
+        from aristotle_mdr import downloader
+        self.login_viewer()
+        response = self.client.get(reverse('aristotle:download',args=['csv-vd',self.item1.id]))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'value,meaning,start date,end date,role')
+        self.assertEqual(len(lines), 9)
+        self.assertEqual(lines[1], '0,test permissible meaning 0,,,permissible')
+        self.assertEqual(lines[8], '3,test supplementary meaning 3,,,supplementary')
+
+        # Read in small chunks, to check values aren't skipped or repeated between them
+        chunk_size, downloader.DOWNLOAD_CHUNK_SIZE = downloader.DOWNLOAD_CHUNK_SIZE, 3
+        try:
+            response = self.client.get(reverse('aristotle:download',args=['jsonl-vd',self.item1.id]))
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        finally:
+            downloader.DOWNLOAD_CHUNK_SIZE = chunk_size
+        self.assertEqual(
+            [(row['value'], row['role']) for row in rows],
+            [(str(i), 'permissible') for i in range(4)] + [(str(i), 'supplementary') for i in range(4)]
+        )
+
     def test_values_shown_on_page(self):
         self.login_viewer()
 
@@ -1330,6 +1442,40 @@ class DataElementViewPage(LoggedInViewConceptPages,TestCase):
         response = self.client.get(check_url)
         self.assertTrue(response.status_code,200)
 
+    def test_item_page_queries_do_not_grow_with_related_items(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.login_editor()
+        vd = models.ValueDomain.objects.create(name="VD", definition="", workgroup=self.wg1)
+        self.item1.valueDomain = vd
+        self.item1.dataElementConcept = models.DataElementConcept.objects.create(
+            name="DEC", definition="", workgroup=self.wg1,
+            objectClass=models.ObjectClass.objects.create(name="OC", definition="", workgroup=self.wg1),
+            property=models.Property.objects.create(name="Prop", definition="", workgroup=self.wg1),
+        )
+        self.item1.save()
+        url = self.get_page(self.item1) + '?nocache=1'
+
+        def count_queries():
+            self.client.get(url)  # So cached permission checks are the same for each count
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        queries = count_queries()
+        for i in range(5):
+            models.PermissibleValue.objects.create(value=str(i), meaning="Value %s" % i, value_domain=vd, order=i)
+            ded = models.DataElementDerivation.objects.create(
+                name="DED %s" % i, definition="", workgroup=self.wg1, derives=self.item1
+            )
+            ded.inputs.add(self.item1)
+            models.Status.objects.create(
+                concept=self.item1, registrationAuthority=self.ra,
+                registrationDate=datetime.date(2010 + i, 1, 1), state=self.ra.public_state
+            )
+        self.assertEqual(count_queries(), queries)
+
 class DataElementDerivationViewPage(LoggedInViewConceptPages,TestCase):
     url_name='dataelementderivation'
     # @property
@@ -1,6 +1,6 @@
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.test.utils import setup_test_environment
 from django.utils import timezone
 from django.contrib.auth.models import User
@@ -77,3 +77,93 @@ class TestNotifications(utils.LoggedInViewPages, TestCase):
 
         self.assertEqual(user1.notifications.all().count(), 2)
         self.assertTrue('item registered by your registration authority has changed status' in user1.notifications.first().verb )
+
+    def test_user_is_only_notified_once_per_change(self):
+        self.viewer.profile.favourites.add(self.item1)
+        self.viewer.notifications.all().delete()
+
+        self.item1.definition = "a new definition"
+        self.item1.save()
+        self.assertEqual(self.viewer.notifications.all().count(), 1)
+        self.assertTrue('favourited item has been changed' in self.viewer.notifications.first().verb)
+
+
+class TestBulkNotifications(TestCase):
+    def save_with_viewers(self, count):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        wg = models.Workgroup.objects.create(name="Big workgroup %s" % count)
+        viewers = [User.objects.create_user('viewer_%s_%s' % (count, i), '', 'viewer') for i in range(count)]
+        wg.viewers.add(*viewers)
+        item = models.ObjectClass.objects.create(name="Test Item",definition=" ",workgroup=wg)
+
+        item.definition = "changed"
+        with CaptureQueriesContext(connection) as queries:
+            item.save()
+        for viewer in viewers:
+            self.assertEqual(viewer.notifications.filter(verb="was modified in the workgroup").count(), 2)
+        return len(queries)
+
+    def test_workgroup_notifications_use_fixed_queries(self):
+        self.assertEqual(self.save_with_viewers(2), self.save_with_viewers(20))
+
+
+class TestSignalDispatch(TestCase):
+    def test_messages_refer_to_objects_by_key(self):
+        from aristotle_mdr.contrib.channels.utils import build_message
+        item = models.ObjectClass.objects.create(name="Test Item",definition=" ")
+        message = build_message(item, created=True, changed_fields=['name'], sender=models.ObjectClass, signal=object())
+        self.assertEqual(message, {
+            'created': True,
+            'changed_fields': ['name'],
+            '__object__': {'pk': item.pk, 'app_label': 'aristotle_mdr', 'model_name': 'objectclass'},
+        })
+
+
+class TestBackgroundDispatch(TransactionTestCase):
+    # Not wrapped in a transaction, so messages are only held inside the atomic blocks below
+    message = {'__object__': {'pk': 1, 'app_label': 'aristotle_mdr', 'model_name': 'objectclass'}}
+
+    def test_queue_dispatcher_drops_waiting_duplicates(self):
+        from aristotle_mdr.contrib.channels.utils import QueueDispatcher
+        # Without a worker running, messages wait in the queue
+        dispatcher = QueueDispatcher(start_worker=False)
+        for i in range(5):
+            dispatcher.dispatch("concept_changes.concept_saved", dict(self.message))
+        dispatcher.dispatch("concept_changes.status_changed", dict(self.message))
+        self.assertEqual(dispatcher.queue.qsize(), 2)
+
+    def test_messages_wait_for_the_transaction(self):
+        from django.db import transaction
+        from aristotle_mdr.contrib.channels.utils import QueueDispatcher
+        dispatcher = QueueDispatcher(start_worker=False)
+
+        with transaction.atomic():
+            dispatcher.dispatch("concept_changes.concept_saved", dict(self.message))
+            with transaction.atomic():
+                dispatcher.dispatch("concept_changes.status_changed", dict(self.message))
+            self.assertEqual(dispatcher.queue.qsize(), 0)
+        # Sent as soon as the outermost block commits
+        self.assertEqual(dispatcher.queue.qsize(), 2)
+
+        with transaction.atomic():
+            dispatcher.dispatch("concept_changes.concept_deleted", dict(self.message))
+            try:
+                with transaction.atomic():
+                    dispatcher.dispatch("concept_changes.status_changed_again", dict(self.message))
+                    raise ValueError
+            except ValueError:
+                pass
+        # Only the message from the savepoint that was rolled back is dropped
+        self.assertEqual(dispatcher.queue.qsize(), 3)
+
+        try:
+            with transaction.atomic():
+                dispatcher.dispatch("concept_changes.concept_saved_again", dict(self.message))
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(dispatcher.queue.qsize(), 3)
+
+        dispatcher.dispatch("concept_changes.concept_deleted_again", dict(self.message))
+        self.assertEqual(dispatcher.queue.qsize(), 4)
@@ -216,6 +216,141 @@ class CustomConceptQuerySetTest(TestCase):
         self.assertTrue(oc1 not in models.ValueDomain.objects.all().public())
         self.assertEqual(len(models.ValueDomain.objects.all().public()),0)
 
+
+class BulkRecacheStatesTest(TestCase):
+    def test_recache_states_matches_single_recache(self):
+        ra = models.RegistrationAuthority.objects.create(
+            name="Test RA",
+            public_state=models.STATES.standard,
+            locked_state=models.STATES.candidate
+        )
+        items = [models.ValueDomain.objects.create(name="Test VD%s"%i) for i in range(4)]
+        for item, state in zip(items, [models.STATES.incomplete, models.STATES.candidate, models.STATES.standard]):
+            models.Status.objects.create(
+                concept=item,
+                registrationAuthority=ra,
+                registrationDate=datetime.date(2010,1,1),
+                state=state
+            )
+
+        ra.public_state = models.STATES.candidate
+        ra.locked_state = models.STATES.incomplete
+        ra.save()
+
+        changed = models.ValueDomain.objects.all().recache_states()
+        self.assertEqual(sorted(changed), sorted([items[0].pk, items[1].pk]))
+
+        for item in items:
+            bulk = models._concept.objects.get(pk=item.pk)
+            self.assertEqual(bulk._is_public, bulk.check_is_public(when=datetime.date.today()))
+            self.assertEqual(bulk._is_locked, bulk.check_is_locked(when=datetime.date.today()))
+
+        # Nothing has changed, so nothing is updated
+        self.assertEqual(models.ValueDomain.objects.all().recache_states(), [])
+
+
+class CurrentStatusesTest(TestCase):
+    def test_current_statuses_latest_per_authority(self):
+        ra1 = models.RegistrationAuthority.objects.create(name="Test RA 1")
+        ra2 = models.RegistrationAuthority.objects.create(name="Test RA 2")
+        item = models.ValueDomain.objects.create(name="Test VD")
+        other = models.ValueDomain.objects.create(name="Other VD")
+
+        def register(concept, ra, state, date, until=None):
+            return models.Status.objects.create(
+                concept=concept, registrationAuthority=ra, state=state,
+                registrationDate=date, until_date=until
+            )
+
+        register(item, ra1, models.STATES.incomplete, datetime.date(2000,1,1))
+        s1 = register(item, ra1, models.STATES.candidate, datetime.date(2005,1,1))
+        register(item, ra1, models.STATES.standard, datetime.date(2010,1,1))
+        register(item, ra2, models.STATES.standard, datetime.date(2000,1,1), until=datetime.date(2003,1,1))
+        s2 = register(item, ra2, models.STATES.retired, datetime.date(2001,1,1))
+        s3 = register(other, ra1, models.STATES.standard, datetime.date(2001,1,1))
+
+        when = datetime.date(2006,1,1)
+        self.assertEqual(list(item.current_statuses(when=when)), [s1, s2])
+        self.assertEqual(
+            models.current_statuses_for_concepts([item.pk, other.pk], when=when),
+            {item.pk: [s1, s2], other.pk: [s3]}
+        )
+        self.assertEqual(
+            models.current_statuses_for_concepts([item.pk], when=datetime.date(1999,1,1)),
+            {item.pk: []}
+        )
+
+
+class ConceptAccessIndexTest(TestCase):
+    def setUp(self):
+        self.ra = models.RegistrationAuthority.objects.create(name="Test RA",public_state=models.STATES.standard)
+        self.wg = models.Workgroup.objects.create(name="Test WG")
+        self.submitter = User.objects.create_user('suzie','','submitter')
+        self.viewer = User.objects.create_user('vicky','','viewer')
+        self.registrar = User.objects.create_user('reggie','','registrar')
+        self.other = User.objects.create_user('otto','','other')
+        self.wg.submitters.add(self.submitter)
+        self.wg.viewers.add(self.viewer)
+        self.ra.registrars.add(self.registrar)
+        self.item = models.ObjectClass.objects.create(name="Test OC",workgroup=self.wg,submitter=self.submitter)
+
+    def visible(self, user):
+        return models.ObjectClass.objects.visible(user).filter(pk=self.item.pk).exists()
+
+    def test_workgroup_and_submitter_access(self):
+        self.assertTrue(self.visible(self.submitter))
+        self.assertTrue(self.visible(self.viewer))
+        self.assertFalse(self.visible(self.registrar))
+        self.assertFalse(self.visible(self.other))
+
+        self.item.workgroup = models.Workgroup.objects.create(name="Other WG")
+        self.item.save()
+        self.assertTrue(self.visible(self.submitter))
+        self.assertFalse(self.visible(self.viewer))
+
+        self.wg.viewers.remove(self.viewer)
+        self.item.workgroup.viewers.add(self.viewer)
+        self.assertTrue(self.visible(self.viewer))
+
+    def test_registrar_access_through_statuses(self):
+        self.assertFalse(self.visible(self.registrar))
+        status = models.Status.objects.create(
+            concept=self.item,
+            registrationAuthority=self.ra,
+            registrationDate=datetime.date(2010,1,1),
+            state=models.STATES.incomplete
+        )
+        self.assertTrue(self.visible(self.registrar))
+        self.assertFalse(self.visible(self.other))
+        status.delete()
+        self.assertFalse(self.visible(self.registrar))
+
+    def test_registrar_access_through_reviews(self):
+        review = models.ReviewRequest.objects.create(
+            requester=self.submitter,
+            registration_authority=self.ra,
+            state=models.STATES.standard,
+            registration_date=datetime.date(2010,1,1)
+        )
+        self.assertFalse(self.visible(self.registrar))
+        review.concepts.add(self.item)
+        self.assertTrue(self.visible(self.registrar))
+
+        review.status = models.REVIEW_STATES.cancelled
+        review.save()
+        self.assertFalse(self.visible(self.registrar))
+
+        review.status = models.REVIEW_STATES.submitted
+        review.save()
+        self.assertTrue(self.visible(self.registrar))
+        review.concepts.clear()
+        self.assertFalse(self.visible(self.registrar))
+
+    def test_inactive_users_only_see_public(self):
+        self.submitter.is_active = False
+        self.submitter.save()
+        self.assertFalse(self.visible(self.submitter))
+
 class RegistryCascadeTest(TestCase):
     def test_superuser_DataElementConceptCascade(self):
         user = User.objects.create_superuser('super','','user')
@@ -3,6 +3,7 @@ from django.test import TestCase
 import aristotle_mdr.models as models
 import aristotle_mdr.perms as perms
 import aristotle_mdr.tests.utils as utils
+from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.core.management import call_command
@@ -14,6 +15,8 @@ setup_test_environment()
 
 from time import sleep
 import datetime
+import json
+import os
 from django.utils import timezone
 
 
@@ -181,6 +184,96 @@ class TestSearch(utils.LoggedInViewPages,TestCase):
         self.assertEqual(response.context['page'].object_list[0].object.item,steve_rogers)
         self.assertTrue(perms.user_can_view(self.registrar,response.context['page'].object_list[0].object))
 
+    def test_search_result_queries_do_not_grow_with_results(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.login_superuser()
+        self.su.profile.favourites.add(self.item_xmen[0])
+
+        def search(query):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('aristotle:search')+"?q="+query)
+            return len(response.context['page'].object_list), len(queries)
+
+        results, queries = search("wolverine")
+        self.assertEqual(results, 1)
+        results, more_queries = search("xman")
+        self.assertEqual(results, len(self.item_xmen))
+        self.assertEqual(queries, more_queries)
+
+    def test_faceted_search_is_one_backend_search(self):
+        from haystack import connections
+        self.login_superuser()
+        backend = connections['default'].get_backend()
+        searches = []
+
+        def search(*args, **kwargs):
+            searches.append(kwargs)
+            return backend_search(*args, **kwargs)
+
+        backend_search = backend.search
+        backend.search = search
+        try:
+            response = self.client.get(reverse('aristotle:search')+"?q=xman")
+        finally:
+            del backend.search
+        self.assertEqual(len(response.context['page'].object_list), len(self.item_xmen))
+        self.assertEqual(len(searches), 1)
+        for counts in response.context['form'].facets.get('fields', {}).values():
+            self.assertTrue(len(counts) <= 10)
+
+    def test_search_results_are_cached_until_the_index_changes(self):
+        from aristotle_mdr.forms.search import search_cache_stats
+        self.logout()
+
+        def search(query):
+            before = search_cache_stats()
+            response = self.client.get(reverse('aristotle:search')+"?q="+query)
+            after = search_cache_stats()
+            hit = after['hits'] - before['hits'] == 1 and after['misses'] == before['misses']
+            return len(response.context['page'].object_list), hit
+
+        self.assertEqual(search("xman"), (len(self.item_xmen), False))
+        self.assertEqual(search("++xman+"), (len(self.item_xmen), True))
+
+        self.item_xmen[0].save()
+        self.assertEqual(search("xman"), (len(self.item_xmen), False))
+
+    def test_users_with_the_same_memberships_share_search_results(self):
+        from aristotle_mdr.forms.search import search_cache_stats
+        self.logout()
+        usernames = ['jean.grey', 'scott.summers']
+        for username in usernames:
+            user = User.objects.create_user(username, '%s@schoolforgiftedyoungsters.edu' % username, 'phoenixForce')
+            self.xmen_wg.viewers.add(user)
+
+        hits = []
+        for username in usernames:
+            self.client.post(reverse('friendly_login'), {'username': username, 'password': 'phoenixForce'})
+            before = search_cache_stats()['hits']
+            response = self.client.get(reverse('aristotle:search')+"?q=xman")
+            hits.append(search_cache_stats()['hits'] - before)
+            self.assertEqual(len(response.context['page'].object_list), len(self.item_xmen))
+            self.logout()
+        self.assertEqual(hits, [0, 1])
+
+    def test_search_filters_on_indexed_access_principals(self):
+        from aristotle_mdr.forms.search import PermissionSearchQuerySet
+        result = PermissionSearchQuerySet().filter(name="wolverine")[0]
+        self.assertEqual(
+            sorted(result.access),
+            sorted([models.PUBLIC_PRINCIPAL, "wg_%s" % self.xmen_wg.pk, "ra_%s" % self.ra.pk])
+        )
+
+        self.logout()
+        User.objects.create_user('jean.grey', 'jean@schoolforgiftedyoungsters.edu', 'phoenixForce')
+        self.client.post(reverse('friendly_login'), {'username': 'jean.grey', 'password': 'phoenixForce'})
+        # Without any workgroups, only public items are found
+        response = self.client.get(reverse('aristotle:search')+"?q=xman")
+        self.assertEqual(len(response.context['page'].object_list), len(self.item_xmen))
+        response = self.client.get(reverse('aristotle:search')+"?q=captainAmerica")
+        self.assertEqual(len(response.context['page'].object_list), 0)
+
     def test_workgroup_member_search(self):
         self.logout()
         self.viewer = User.objects.create_user('charles.xavier','charles@schoolforgiftedyoungsters.edu','equalRightsForAll')
@@ -502,6 +595,247 @@ class TestTokenSearch(TestCase):
         self.assertTrue(objs[0].object.name,"Power")
 
 
+class TestConceptIndexPreparation(TestCase):
+    def setUp(self):
+        self.su = User.objects.create_superuser('super','','user')
+        self.ra = models.RegistrationAuthority.objects.create(name="Kelly Act")
+        self.wg = models.Workgroup.objects.create(name="X Men")
+        from haystack import connections
+        self.index = connections['default'].get_unified_index().get_index(models.ObjectClass)
+
+    def make_items(self, names):
+        for name in names:
+            item = models.ObjectClass.objects.create(name=name,definition="known xman",workgroup=self.wg)
+            self.ra.register(item,models.STATES.candidate,self.su,registrationDate=datetime.date(2000,1,1))
+            self.ra.register(item,models.STATES.standard,self.su,registrationDate=datetime.date(2010,1,1))
+            review = models.ReviewRequest.objects.create(
+                requester=self.su,registration_authority=self.ra,state=self.ra.public_state
+            )
+            review.concepts.add(item)
+
+    def prepare_batch(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            prepared = dict((obj.pk, self.index.full_prepare(obj)) for obj in self.index.index_queryset())
+        return prepared, len(queries)
+
+    def test_batch_prepare_matches_single_prepare(self):
+        self.make_items(["cyclops", "iceman"])
+        batch, _ = self.prepare_batch()
+        for item in models.ObjectClass.objects.all():
+            single = self.index.full_prepare(item)
+            for field in ['statuses', 'highest_state', 'ra_statuses', 'registrationAuthorities', 'workgroup']:
+                self.assertEqual(batch[item.pk][field], single[field])
+            self.assertEqual(single['statuses'], [models.STATES.standard])
+
+    def test_batch_prepare_uses_fixed_queries(self):
+        self.make_items(["cyclops", "iceman"])
+        self.prepare_batch()  # Warm any per-model caches
+        _, small_batch = self.prepare_batch()
+        self.make_items(["angel", "beast", "phoenix", "storm"])
+        _, large_batch = self.prepare_batch()
+        self.assertEqual(small_batch, large_batch)
+
+
+class TestRebuildConceptIndex(TestCase):
+    def setUp(self):
+        import haystack
+        import tempfile
+        haystack.connections.reload('default')
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+        self.wg = models.Workgroup.objects.create(name="X Men")
+        self.items = [
+            models.ObjectClass.objects.create(name=name,definition="known xman",workgroup=self.wg)
+            for name in ["cyclops", "iceman", "angel"]
+        ]
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def indexed_names(self):
+        from haystack.query import SearchQuerySet
+        return sorted(r.name for r in SearchQuerySet().models(models.ObjectClass))
+
+    def test_rebuild_indexes_all_items(self):
+        call_command('rebuild_concept_index', checkpoint=self.checkpoint, batch_size=2, verbosity=0)
+        self.assertEqual(self.indexed_names(), ["angel", "cyclops", "iceman"])
+        # A finished rebuild leaves nothing to resume
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_rebuild_resumes_from_checkpoint(self):
+        # Mark the range holding just the first item as already done
+        pk = self.items[0].pk
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'index': None, 'started': 0, 'done': ['aristotle_mdr.objectclass:%s:%s' % (pk, pk + 1)]}, f)
+
+        call_command('rebuild_concept_index', checkpoint=self.checkpoint, batch_size=1, verbosity=0)
+        self.assertEqual(self.indexed_names(), ["angel", "iceman"])
+
+        call_command('rebuild_concept_index', checkpoint=self.checkpoint, batch_size=1, restart=True, verbosity=0)
+        self.assertEqual(self.indexed_names(), ["angel", "cyclops", "iceman"])
+
+
+class TestIndexUpdateQueue(TestCase):
+    def setUp(self):
+        import haystack
+        haystack.connections.reload('default')
+        self.wg = models.Workgroup.objects.create(name="X Men")
+        self.items = [
+            models.ObjectClass.objects.create(name=name,definition="known xman",workgroup=self.wg)
+            for name in ["cyclops", "iceman"]
+        ]
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def tearDown(self):
+        call_command('clear_index', interactive=False, verbosity=0)
+
+    def indexed_names(self):
+        from haystack.query import SearchQuerySet
+        return sorted(r.name for r in SearchQuerySet().models(models.ObjectClass))
+
+    def test_queue_coalesces_updates(self):
+        from aristotle_mdr.contrib.channels.index_queue import IndexUpdateQueue
+        queue = IndexUpdateQueue(delay=60)
+        for item in self.items:
+            queue.add(models.ObjectClass, item.pk)
+            queue.add(models._concept, item.pk)
+        self.assertEqual(len(queue.pending['_concept']), 2)
+        self.assertEqual(self.indexed_names(), [])
+
+        queue.flush()
+        self.assertEqual(queue.pending, {})
+        self.assertTrue(queue.timer is None)
+        self.assertEqual(self.indexed_names(), ["cyclops", "iceman"])
+
+        queue.add(models.ObjectClass, self.items[0].pk)
+        queue.add(models.ObjectClass, self.items[0].pk, action='remove')
+        queue.flush()
+        self.assertEqual(self.indexed_names(), ["iceman"])
+
+
+    def test_channels_processor_queues_saves_and_deletes(self):
+        from haystack import connections, connection_router
+        from aristotle_mdr.contrib.channels import signals
+        from aristotle_mdr.contrib.channels.index_queue import IndexUpdateQueue
+
+        queue = IndexUpdateQueue(delay=60)
+        live_queue, signals.index_update_queue = signals.index_update_queue, queue
+        processor = signals.AristotleChannelsSignalProcessor(connections, connection_router)
+        try:
+            for item in self.items:
+                item.save()
+                item.save()
+            self.assertEqual(
+                queue.pending,
+                {'_concept': dict((item.pk, 'update') for item in self.items)}
+            )
+
+            self.items[0].delete()
+            self.assertEqual(queue.pending['aristotle_mdr.objectclass'], {self.items[0].pk: 'remove'})
+            queue.flush()
+            self.assertEqual(self.indexed_names(), ["iceman"])
+        finally:
+            processor.teardown()
+            signals.index_update_queue = live_queue
+
+
+class TestElasticsearchRebuild(TestCase):
+    def setUp(self):
+        import mock
+        from haystack.exceptions import MissingDependency
+        try:
+            from aristotle_mdr.contrib.search_backends.elasticsearch2 import Elasticsearch2SearchBackend
+        except MissingDependency:
+            self.skipTest("The elasticsearch package isn't installed")
+        self.backend = Elasticsearch2SearchBackend('default', URL='http://127.0.0.1:9200/', INDEX_NAME='haystack')
+        self.backend.conn = mock.Mock()
+        self.indices = self.backend.conn.indices
+        self.backend.resume_rebuild('haystack_new')
+
+    def test_finish_rebuild_moves_the_alias(self):
+        self.indices.get_alias.return_value = {'haystack_old': {}}
+        self.indices.get_settings.return_value = {
+            'haystack_old': {'settings': {'index': {'number_of_replicas': '2'}}}
+        }
+        self.backend.finish_rebuild()
+
+        self.indices.put_settings.assert_called_once_with(
+            index='haystack_new', body={'index': {'number_of_replicas': '2', 'refresh_interval': '1s'}}
+        )
+        self.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'remove': {'index': 'haystack_old', 'alias': 'haystack'}},
+            {'add': {'index': 'haystack_new', 'alias': 'haystack'}},
+        ]})
+        self.indices.delete.assert_called_once_with(index='haystack_old', ignore=404)
+        calls = [name for name, args, kwargs in self.indices.mock_calls]
+        self.assertTrue(calls.index('update_aliases') < calls.index('delete'))
+        self.assertEqual(self.backend.rebuild_index_name, None)
+
+    def test_finish_rebuild_replaces_an_index_without_an_alias(self):
+        from elasticsearch.exceptions import NotFoundError
+        self.indices.get_alias.side_effect = NotFoundError(404, 'alias missing')
+        self.indices.exists.return_value = True
+        self.backend.finish_rebuild()
+
+        self.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'add': {'index': 'haystack_new', 'alias': 'haystack'}},
+        ]})
+        self.indices.delete.assert_called_once_with(index='haystack')
+        calls = [name for name, args, kwargs in self.indices.mock_calls]
+        self.assertTrue(calls.index('delete') < calls.index('update_aliases'))
+
+
+    def test_remove_deletes_from_indices_being_rebuilt(self):
+        # Another process is loading haystack_20170201000000000000
+        self.backend.resume_rebuild(None)
+        self.backend.setup_complete = True
+        self.indices.get_alias.return_value = {'haystack_20170101000000000000': {}}
+        self.indices.get_settings.return_value = {
+            'haystack_20170101000000000000': {},
+            'haystack_20170201000000000000': {},
+            'haystack_other_20170201000000000000': {},
+        }
+        self.backend.remove('aristotle_mdr.objectclass.1', commit=False)
+
+        deleted = sorted(kwargs['index'] for name, args, kwargs in self.backend.conn.delete.mock_calls)
+        self.assertEqual(deleted, ['haystack', 'haystack_20170201000000000000'])
+
+class TestSpellingDictionary(TestCase):
+    def test_suggestions_come_from_the_search_index(self):
+        import tempfile
+        from aristotle_mdr.utils.spelling import SpellingDictionary
+
+        path = os.path.join(tempfile.mkdtemp(), 'spelling.dict')
+        with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS, SPELLING_DICTIONARY_PATH=path)):
+            spelling = SpellingDictionary(path)
+            item = models.ObjectClass.objects.create(name="Zanzibar", definition="quokka and xylophones")
+            self.assertTrue(spelling.refresh())
+            self.assertEqual(spelling.suggest("zanzibr"), "zanzibar")
+
+            # Other processes read the words from the shared file
+            other = SpellingDictionary(path)
+            self.assertEqual(other.suggest("Zanzibra"), "zanzibar")
+            self.assertEqual(other.suggest("xylophone"), "xylophones")
+            self.assertEqual(other.suggest("quokka"), None)
+            self.assertEqual(other.suggest("marmalade"), None)
+
+            # Nothing is done as items are indexed, the file is built again
+            # once the index has changed
+            item.definition = "marmalades"
+            item.save()
+            self.assertEqual(other.suggest("marmalade"), None)
+            self.assertFalse(other.is_stale(other.dictionary()))
+            with override_settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS, SPELLING_REFRESH_SECONDS=0)):
+                self.assertTrue(other.is_stale(other.dictionary()))
+                self.assertTrue(spelling.refresh(force=False))
+                self.assertFalse(other.is_stale(other.dictionary()))
+                self.assertFalse(spelling.refresh(force=False))
+            self.assertEqual(other.suggest("xylophone"), None)
+            self.assertEqual(other.suggest("marmalade"), "marmalades")
+
+
 class TestSearchDescriptions(TestCase):
     """
     Test the 'form to plain text' description generator
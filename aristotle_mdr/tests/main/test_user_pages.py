@@ -50,6 +50,35 @@ class UserHomePages(utils.LoggedInViewPages, TestCase):
         self.assertTrue(self.item1.concept in response.context['page'])
         self.assertTrue(self.item2.concept not in response.context['page'])
 
+    def test_sandbox_pages_with_cursors(self):
+        self.login_viewer()
+        items = [
+            models.ObjectClass.objects.create(name="Item %s" % (i // 2), definition=" ", submitter=self.viewer).concept
+            for i in range(7)
+        ]
+        url = reverse('aristotle:userSandbox')
+
+        seen = []
+        response = self.client.get(url, {'pp': 2})
+        while True:
+            page = response.context['page']
+            self.assertTrue(len(page) <= 2)
+            seen.extend(page)
+            if not page.has_next():
+                break
+            response = self.client.get(url, {'pp': 2, 'cursor': page.next_cursor})
+        # Items with the same name are ordered by their id, so none are skipped or repeated
+        self.assertEqual(seen, sorted(items, key=lambda i: (i.name.lower(), i.pk)))
+
+        previous = self.client.get(url, {'pp': 2, 'cursor': page.previous_cursor}).context['page']
+        self.assertEqual(list(previous), seen[-3:-1])
+        self.assertTrue(previous.has_next())
+
+        from django.conf import settings
+        with self.settings(ARISTOTLE_SETTINGS=dict(settings.ARISTOTLE_SETTINGS, PAGINATION_MAX_PAGE_SIZE=5)):
+            response = self.client.get(url, {'pp': 1000})
+        self.assertEqual(len(response.context['page']), 5)
+
     def test_user_cannot_view_registered_published_in_sandbox(self):
         self.login_viewer()
         self.item1 = models._concept.objects.create(
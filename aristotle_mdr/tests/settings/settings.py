@@ -15,6 +15,7 @@ SECRET_KEY = 'inara+vtkprm7@0(fsc$+grbz9-s+tmo9d)e#k(9uf8m281&$7xhdkjr'
 SOUTH_TESTS_MIGRATE = True
 
 MEDIA_ROOT = os.path.join(BASE, "media")
+PRIVATE_MEDIA_ROOT = os.path.join(BASE, "private_media")
 MEDIA_URL = '/media/'
 CKEDITOR_UPLOAD_PATH = 'uploads/'
 
@@ -91,6 +91,8 @@ urlpatterns = patterns(
     url(r'^create/(?P<model_name>.+)/?$', views.wizards.create_item, name='createItem'),
 
     url(r'^download/bulk/(?P<download_type>[a-zA-Z0-9\-\.]+)/?$', views.downloads.bulk_download, name='bulk_download'),
+    url(r'^download/job/(?P<job_id>\d+)/?$', views.downloads.download_job, name='download_job'),
+    url(r'^download/job/(?P<job_id>\d+)/file/?$', views.downloads.download_job_file, name='download_job_file'),
     url(r'^download/(?P<download_type>[a-zA-Z0-9\-\.]+)/(?P<iid>\d+)/?$', views.downloads.download, name='download'),
 
     url(r'^action/supersede/(?P<iid>\d+)$', views.supersede, name='supersede'),
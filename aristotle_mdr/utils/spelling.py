@@ -0,0 +1,375 @@
+"""
+A dictionary of indexed words used for "did you mean" suggestions on the
+search page, so suggestions don't need a request to the search backend.
+
+The dictionary is built from the terms in the search index and the number of
+documents each is in, which the search backend already keeps, so nothing extra
+is done as items are indexed. It is stored in a file of sorted words and their
+frequencies, which each process memory maps, so all workers share the one copy.
+
+The file records the generation of the search index it was built from. Once
+the index has changed and the file is older than ``SPELLING_REFRESH_SECONDS``,
+the first process to notice builds it again in a background thread, so
+searches never wait for it and no scheduled job is needed.
+
+The sorted words are walked as a trie. The edit distance rows for the prefix
+a word shares with the word before it are reused, and every word under a
+prefix that is already too far from the query is skipped with a binary search.
+"""
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django import db
+from django.conf import settings
+from django.utils.encoding import force_text
+
+from aristotle_mdr.storage import private_media_root
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover -- Not available on Windows
+    fcntl = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ARSPELL3'
+HEADER = struct.Struct('<8sIdQ')
+UINT = struct.Struct('<I')
+UINT_PAIR = struct.Struct('<II')
+MAX_FREQUENCY = 0xffffffff
+
+# Words made of at least three letters
+WORD_RE = re.compile(r'[^\W\d_]{3,}', re.UNICODE)
+
+# How often, in seconds, a process checks whether the search index has changed
+CHECK_SECONDS = 10
+
+
+def dictionary_path():
+    path = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('SPELLING_DICTIONARY_PATH')
+    return path or os.path.join(private_media_root(), 'aristotle_mdr', 'spelling.dict')
+
+
+def refresh_seconds():
+    return getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('SPELLING_REFRESH_SECONDS', 300)
+
+
+def words(text):
+    return WORD_RE.findall(force_text(text or "").lower())
+
+
+def following(prefix):
+    """
+    Returns the first string that sorts after every word starting with ``prefix``.
+    """
+    return prefix[:-1] + (u'%c' % (ord(prefix[-1]) + 1))
+
+
+def max_distance(word):
+    return 1 if len(word) <= 4 else 2
+
+
+def next_row(row, letter, word, distance):
+    """
+    Returns the next row of the Levenshtein matrix between ``word`` and a prefix,
+    given the row for the prefix without its last ``letter``. Only the cells
+    within ``distance`` of the diagonal are worked out, the rest are too far.
+    """
+    depth = row[0] + 1
+    too_far = distance + 1
+    new_row = [depth] + [too_far] * len(word)
+    for i in range(max(1, depth - distance), min(len(word), depth + distance) + 1):
+        new_row[i] = min(
+            new_row[i - 1] + 1,
+            row[i] + 1,
+            row[i - 1] + (word[i - 1] != letter),
+        )
+    return new_row
+
+
+def index_frequencies(using='default'):
+    """
+    Returns the number of documents each word in the search index is in.
+    Backends without a ``spelling_frequencies`` method have their stored
+    text read back and counted.
+    """
+    from haystack import connections
+    from haystack.query import SearchQuerySet
+    backend = connections[using].get_backend()
+    if hasattr(backend, 'spelling_frequencies'):
+        found = backend.spelling_frequencies()
+    else:
+        found = Counter()
+        for text in SearchQuerySet(using=using).values_list('text', flat=True):
+            found.update(set(words(text)))
+    # Only whole words are suggested, not numbers or parts of identifiers
+    return dict(
+        (word, count) for word, count in found.items()
+        if words(word) == [word]
+    )
+
+
+def write_dictionary(path, counts, generation):
+    """
+    Writes a dictionary file: a header with the number of words, when it was
+    built and the search index generation it was built from, then the
+    offsets of each word, their frequencies and the utf-8 encoded words,
+    in order.
+    """
+    items = sorted((word, count) for word, count in counts.items() if count > 0)
+    encoded = [word.encode('utf-8') for word, count in items]
+    offsets = [0]
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(items), time.time(), generation))
+        f.write(struct.pack('<%dI' % len(offsets), *offsets))
+        f.write(struct.pack('<%dI' % len(items), *[min(count, MAX_FREQUENCY) for word, count in items]))
+        f.write(b''.join(encoded))
+    # Renamed into place, so processes that have the old file mapped keep
+    # reading it until they notice the new one.
+    os.rename(temp_path, path)
+
+
+class MappedDictionary(object):
+    """
+    A read only view of a dictionary file.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime, stat.st_size)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.built, self.generation = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a spelling dictionary" % path)
+        self.offsets_at = HEADER.size
+        self.frequencies_at = self.offsets_at + UINT.size * (self.count + 1)
+        self.words_at = self.frequencies_at + UINT.size * self.count
+
+    def word(self, i):
+        start, end = UINT_PAIR.unpack_from(self.map, self.offsets_at + UINT.size * i)
+        return self.map[self.words_at + start:self.words_at + end].decode('utf-8')
+
+    def frequency(self, i):
+        return UINT.unpack_from(self.map, self.frequencies_at + UINT.size * i)[0]
+
+    def bisect(self, word, lo=0, hi=None):
+        """
+        Returns the index of the first word that sorts at or after ``word``.
+        """
+        if hi is None:
+            hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.word(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def skip(self, word, lo, hi):
+        """
+        Like ``bisect``, but searches outwards from ``lo``, as the word is
+        usually close by.
+        """
+        step = 1
+        while lo < hi and self.word(lo) < word:
+            lo, step = lo + step, step * 2
+            if lo >= hi or self.word(lo) >= word:
+                return self.bisect(word, lo - step // 2 + 1, min(lo, hi))
+        return lo
+
+    def __contains__(self, word):
+        i = self.bisect(word)
+        return i < self.count and self.word(i) == word
+
+    def candidates(self, word, distance):
+        """
+        Yields ``(distance, frequency, candidate)`` for each word within
+        ``distance`` edits of ``word`` that starts with the same letter.
+        Like the term suggester in Elasticsearch, the first letter is taken to
+        be right, which leaves a small part of the dictionary to walk.
+        """
+        i = self.bisect(word[0])
+        end = self.bisect(following(word[0]), i)
+        rows = [list(range(len(word) + 1))]
+        previous = ""
+        while i < end:
+            candidate = self.word(i)
+            shared = 0
+            limit = min(len(previous), len(candidate))
+            while shared < limit and previous[shared] == candidate[shared]:
+                shared += 1
+            del rows[shared + 1:]
+
+            pruned = False
+            for letter in candidate[shared:]:
+                rows.append(next_row(rows[-1], letter, word, distance))
+                if min(rows[-1]) > distance:
+                    pruned = True
+                    break
+            if pruned:
+                # No word starting with this prefix can be close enough
+                previous = candidate[:len(rows) - 1]
+                i = self.skip(following(previous), i + 1, end)
+                continue
+
+            if rows[-1][-1] <= distance:
+                yield rows[-1][-1], self.frequency(i), candidate
+            previous = candidate
+            i += 1
+
+
+class SpellingDictionary(object):
+    def __init__(self, path=None, using='default'):
+        self._path = path
+        self.using = using
+        self.lock = threading.Lock()
+        self.mapped = None
+        # Suggestions already looked up in the mapped file
+        self.suggestions = {}
+        self.checked = 0
+        self.refreshing = False
+
+    @property
+    def path(self):
+        return self._path or dictionary_path()
+
+    @contextmanager
+    def locked(self, wait=True):
+        """
+        Holds the lock taken by every process that builds the dictionary file.
+        Yields ``None`` instead of the path if ``wait`` is not set and another
+        process holds it.
+        """
+        path = self.path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        with open(path + '.lock', 'a') as lock_file:
+            held = True
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+                except (IOError, OSError):
+                    held = False
+            yield path if held else None
+
+    def dictionary(self):
+        """
+        Returns the mapped dictionary file, mapping it again if another
+        process has replaced it since it was last read.
+        """
+        path = self.path
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime, stat.st_size)
+        with self.lock:
+            if self.mapped is None or self.mapped.identity != identity:
+                # The old file is unmapped once nothing is reading it
+                self.mapped = MappedDictionary(path)
+                self.suggestions = {}
+            return self.mapped
+
+    def is_stale(self, dictionary):
+        """
+        Returns whether the search index has changed since ``dictionary`` was
+        built, and it is old enough to be built again.
+        """
+        from aristotle_mdr.signals import search_index_generation
+        if dictionary is None:
+            return True
+        if time.time() - dictionary.built < refresh_seconds():
+            return False
+        return dictionary.generation != search_index_generation(self.using)
+
+    def refresh(self, force=True, wait=True):
+        """
+        Builds the dictionary file from the words in the search index. Unless
+        ``force`` is set, nothing is done if it isn't stale. Returns whether
+        the file was written.
+        """
+        from aristotle_mdr.signals import search_index_generation
+        with self.locked(wait) as path:
+            if path is None:
+                return False
+            if not force and not self.is_stale(self.dictionary()):
+                # Another process built it while this one waited
+                return False
+            # Read first, so changes made while counting are picked up next time
+            generation = search_index_generation(self.using)
+            write_dictionary(path, index_frequencies(self.using), generation or 0)
+        return True
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        thread = threading.Thread(target=self.refresh_from_thread)
+        thread.daemon = True
+        thread.start()
+
+    def refresh_from_thread(self):
+        try:
+            self.refresh(force=False, wait=False)
+        except Exception:
+            logger.exception("Could not build the spelling dictionary")
+        finally:
+            self.refreshing = False
+            db.connection.close()
+
+    def check_for_changes(self, dictionary):
+        """
+        Starts building the dictionary again if it is stale, checking at most
+        once every ``CHECK_SECONDS``.
+        """
+        now = time.time()
+        if now - self.checked < CHECK_SECONDS:
+            return
+        self.checked = now
+        if self.is_stale(dictionary):
+            self.refresh_in_background()
+
+    def suggest(self, word):
+        """
+        Returns the most frequent indexed word with the fewest edits from
+        ``word``, or ``None`` if ``word`` was indexed or nothing is close to it.
+        """
+        word = force_text(word).lower()
+        if words(word) != [word]:
+            return None
+        dictionary = self.dictionary()
+        self.check_for_changes(dictionary)
+        if dictionary is None:
+            return None
+        if word in self.suggestions:
+            return self.suggestions[word]
+
+        found = list(dictionary.candidates(word, max_distance(word)))
+        suggestion = None
+        if found:
+            best_distance, frequency, best = min(found, key=lambda x: (x[0], -x[1], x[2]))
+            if best_distance > 0:
+                suggestion = best
+        self.suggestions[word] = suggestion
+        return suggestion
+
+
+spelling_dictionary = SpellingDictionary()
@@ -1,5 +1,9 @@
+from functools import wraps
+import hashlib
+
 from django.core.urlresolvers import reverse
 from django.core.cache import cache
+from django.http import HttpResponse
 from django.forms import model_to_dict
 from django.template.defaultfilters import slugify
 from django.utils.text import get_text_list
@@ -139,52 +143,69 @@ def get_concepts_for_apps(app_labels):
 
 
 # "There are only two hard problems in Computer Science: cache invalidation, naming things and off-by-one errors"
-def cache_per_item_user(ttl=None, prefix=None, cache_post=False):
-    '''
-    Modified from: https://djangosnippets.org/snippets/2524/
-    '''
+def item_page_cache_key(request, iid, prefix='view_cache'):
+    """
+    Returns the cache key for a page about an item, as seen by the requesting
+    user. The key includes the permission generation counters of the item, the
+    items it refers to and the user, so pages are invalidated by the signals
+    that bump those counters whenever any of those items, their statuses or
+    the users memberships change.
+    """
+    from aristotle_mdr import perms
+    from aristotle_mdr.models import concept_page_dependencies
+    from django.utils import translation
+
+    generation_keys = [('concept', iid)] + concept_page_dependencies(iid)
+    if request.user.is_anonymous():
+        user = 'anonymous'
+    else:
+        user = request.user.id
+        generation_keys.append(('user', user))
+    generations = perms.get_generations(generation_keys)
+    path = hashlib.md5(request.path.encode('utf-8')).hexdigest()
+    return '%s_%s_%s_%s_%s_%s' % (
+        prefix, user, iid, translation.get_language(),
+        '_'.join(str(generations[key]) for key in generation_keys),
+        path,
+    )
+
+
+def cache_per_item_user(ttl=None, prefix=None):
+    """
+    Caches the rendered page for an item per user, without touching the database.
+
+    Only successful ``GET`` requests are cached, and the cache is skipped when
+    ``nocache`` is in the query string, when the user has messages waiting to be
+    shown or when the page uses a CSRF token. The ``ttl`` limits how long
+    changes to related items, which don't invalidate the page, can go unseen.
+    """
 
     def decorator(function):
+        @wraps(function)
         def apply_cache(request, *args, **kwargs):
-            # Gera a parte do usuario que ficara na chave do cache
-            if request.user.is_anonymous():
-                user = 'anonymous'
-            else:
-                user = request.user.id
-
-            iid = kwargs['iid']
-
-            if prefix:  # pragma no cover - we don't use this
-                CACHE_KEY = '%s_%s_%s' % (prefix, user, iid)
-            else:
-                CACHE_KEY = 'view_cache_%s_%s_%s' % (function.__name__, user, iid)
-
-            if not cache_post and request.method == 'POST':
-                can_cache = False
-            else:
-                can_cache = True
-
-            from aristotle_mdr.models import _concept
-            import datetime
-            from django.utils import timezone
-
-            if 'nocache' not in request.GET.keys():
-                can_cache = False
-
-            # If the item was modified in the last 15 seconds, don't use cache
-            recently = timezone.now() - datetime.timedelta(seconds=15)
-            if _concept.objects.filter(id=iid, modified__gte=recently).exists():
-                can_cache = False
-
-            if can_cache:
-                response = cache.get(CACHE_KEY, None)
-            else:
-                response = None
-
-            if not response:
-                response = function(request, *args, **kwargs)
-                if can_cache:
-                    cache.set(CACHE_KEY, response, ttl)
+            from django.contrib import messages
+
+            can_cache = (
+                request.method == 'GET' and
+                'nocache' not in request.GET.keys() and
+                len(messages.get_messages(request)) == 0
+            )
+            if not can_cache:
+                return function(request, *args, **kwargs)
+
+            cache_key = item_page_cache_key(request, kwargs['iid'], prefix or 'view_cache_%s' % function.__name__)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = function(request, *args, **kwargs)
+            if (
+                response.status_code == 200 and
+                not getattr(response, 'streaming', False) and
+                not request.META.get('CSRF_COOKIE_USED', False)
+            ):
+                cache.set(cache_key, (response.content, response['Content-Type']), ttl)
             return response
         return apply_cache
     return decorator
@@ -4,12 +4,13 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.core.exceptions import PermissionDenied, ImproperlyConfigured
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, Http404, HttpResponseRedirect
+from django.http import FileResponse, HttpResponse, Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template import RequestContext, TemplateDoesNotExist
 from django.template.defaultfilters import slugify
 from django.template.loader import select_template
 from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.http import condition
 import re
 
 from aristotle_mdr.perms import user_can_view
@@ -18,6 +19,7 @@ from aristotle_mdr.utils import cache_per_item_user
 from aristotle_mdr import forms as MDRForms
 from aristotle_mdr import models as MDR
 from aristotle_mdr.views import get_if_user_can_view
+from aristotle_mdr.views.utils import download_etag
 from aristotle_mdr.utils.downloads import get_download_module
 
 import logging
@@ -28,6 +30,7 @@ logger.debug("Logging started for " + __name__)
 PAGES_PER_RELATED_ITEM = 15
 
 
+@condition(etag_func=download_etag)
 def download(request, download_type, iid=None):
     """
     By default, ``aristotle_mdr.views.download`` is called whenever a URL matches
@@ -97,6 +100,23 @@ def download(request, download_type, iid=None):
     raise Http404
 
 
+def visible_items_in_order(user, iids):
+    """
+    Returns the items with the given ids that a user can view, in the order
+    they were given, as their subclasses. This uses a single query however many
+    ids are given.
+    """
+    iids = [int(iid) for iid in iids if str(iid).isdigit()]
+    visible = MDR._concept.objects.filter(pk__in=iids).visible(user).select_subclasses()
+    items_by_id = dict((item.pk, item) for item in visible)
+    items = []
+    for iid in iids:
+        item = items_by_id.pop(iid, None)  # Each item is only included once
+        if item is not None:
+            items.append(item)
+    return items
+
+
 def bulk_download(request, download_type, items=None):
     """
     By default, ``aristotle_mdr.views.bulk_download`` is called whenever a URL matches
@@ -113,12 +133,7 @@ def bulk_download(request, download_type, items=None):
     is imported, this file **MUST** have a ``bulk_download`` function defined which returns
     a Django ``HttpResponse`` object of some form.
     """
-    items=[]
-
-    for iid in request.GET.getlist('items'):
-        item = MDR._concept.objects.get_subclass(pk=iid)
-        item = get_if_user_can_view(item.__class__, request.user, iid)
-        items.append(item)
+    items = visible_items_in_order(request.user, request.GET.getlist('items'))
 
     downloadOpts = getattr(settings, 'ARISTOTLE_DOWNLOADS', "")
     module_name = ""
@@ -140,3 +155,36 @@ def bulk_download(request, download_type, items=None):
             raise Http404
 
     raise Http404
+
+
+@login_required
+def download_job(request, job_id):
+    """
+    Shows the progress of a background bulk download. The page polls this view
+    with ``?format=json`` until the download is finished.
+    """
+    job = get_object_or_404(MDR.DownloadJob, pk=job_id, user=request.user)
+    if request.GET.get('format', None) == 'json':
+        return JsonResponse({
+            'status': job.get_status_display(),
+            'progress': job.progress,
+            'finished': job.is_finished,
+            'error': job.error,
+            'url': reverse('aristotle:download_job_file', args=[job.pk]) if job.output else None,
+        })
+    return render(
+        request,
+        "aristotle_mdr/downloads/job.html",
+        {'job': job, 'job_states': MDR.DOWNLOAD_JOB_STATES}
+    )
+
+
+@login_required
+def download_job_file(request, job_id):
+    job = get_object_or_404(MDR.DownloadJob, pk=job_id, user=request.user)
+    if job.status != MDR.DOWNLOAD_JOB_STATES.complete or not job.output:
+        return redirect(job.get_absolute_url())
+    job.output.open('rb')
+    response = FileResponse(job.output, content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % job.output.name.rsplit('/', 1)[-1]
+    return response
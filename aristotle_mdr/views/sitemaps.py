@@ -1,15 +1,161 @@
+"""
+Sitemaps are generated into ``default_storage`` as gzipped files and served
+from there, so crawlers don't query the database on every request.
+
+Each sitemap page lists the public items in one block of ids, in id order, so
+a page always holds the same items and only the pages with changed items need
+to be rebuilt. When an item changes the ``sitemaps.refresh_sitemap`` handler
+rebuilds its page and the index.
+
+Sitemaps are only stored if ``SITEMAP_BASE_URL`` is set. Otherwise they are
+built for each request using the request's host, as a host from one request
+shouldn't be handed to everyone else.
+"""
 from __future__ import division
-from django.shortcuts import render
+import gzip
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.urlresolvers import reverse
+from django.db.models import F, Max
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+
 from aristotle_mdr import models as MDR
 
+SITEMAP_PAGE_SIZE = 1000
+SITEMAP_STORAGE_DIR = "aristotle_mdr/sitemaps"
+
+
+def sitemap_path(page=None):
+    if page is None:
+        return "%s/sitemap.xml.gz" % SITEMAP_STORAGE_DIR
+    return "%s/sitemap_%s.xml.gz" % (SITEMAP_STORAGE_DIR, page)
+
+
+def sitemap_page_for_concept(concept_id):
+    return int(concept_id) // SITEMAP_PAGE_SIZE
+
+
+def sitemap_base_url():
+    base_url = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('SITEMAP_BASE_URL', None)
+    if base_url is not None:
+        base_url = base_url.rstrip('/')
+    return base_url
+
+
+def last_sitemap_page():
+    max_pk = MDR._concept.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+    return sitemap_page_for_concept(max_pk)
+
+
+def sitemap_page_items(page):
+    return MDR._concept.objects.public().filter(
+        pk__gte=page * SITEMAP_PAGE_SIZE,
+        pk__lt=(page + 1) * SITEMAP_PAGE_SIZE,
+    ).order_by('pk')
+
+
+def store_sitemap(path, content):
+    compressed = BytesIO()
+    # A fixed mtime means unchanged sitemaps give identical files
+    with gzip.GzipFile(fileobj=compressed, mode='wb', mtime=0) as f:
+        f.write(content.encode('utf-8'))
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    name = default_storage.save(path, ContentFile(compressed.getvalue()))
+    if name != path:
+        # Another process wrote this sitemap first
+        default_storage.delete(name)
+
+
+def render_sitemap_page(page, base_url):
+    return render_to_string(
+        "aristotle_mdr/sitemaps/page.xml",
+        {'items': sitemap_page_items(page).select_subclasses(), 'base_url': base_url}
+    )
+
+
+def render_sitemap_index(base_url):
+    # The first id of each page is grouped on, rather than the page number,
+    # as dividing integers gives a decimal in MySQL.
+    page_starts = MDR._concept.objects.public().annotate(
+        page_start=F('pk') - F('pk') % SITEMAP_PAGE_SIZE
+    ).values('page_start').annotate(lastmod=Max('modified')).order_by('page_start')
+    pages = [
+        {
+            'url': reverse(
+                'aristotle:sitemap_range_xml',
+                kwargs={'page': int(row['page_start']) // SITEMAP_PAGE_SIZE}
+            ),
+            'lastmod': row['lastmod'],
+        }
+        for row in page_starts
+    ]
+    return render_to_string(
+        "aristotle_mdr/sitemaps/main.xml",
+        {'pages': pages, 'base_url': base_url}
+    )
+
+
+def generate_sitemap_page(page, base_url):
+    store_sitemap(sitemap_path(page), render_sitemap_page(page, base_url))
+
+
+def generate_sitemap_index(base_url):
+    store_sitemap(sitemap_path(), render_sitemap_index(base_url))
+
+
+def generate_sitemaps(base_url):
+    for page in range(last_sitemap_page() + 1):
+        generate_sitemap_page(page, base_url)
+    generate_sitemap_index(base_url)
+
+
+def refresh_sitemap_page(page):
+    base_url = sitemap_base_url()
+    if base_url is not None:
+        generate_sitemap_page(page, base_url)
+        generate_sitemap_index(base_url)
+
+
+def serve_sitemap(request, path, render):
+    base_url = sitemap_base_url()
+    if base_url is None:
+        return HttpResponse(
+            render("%s://%s" % (request.scheme, request.get_host())),
+            content_type='text/xml'
+        )
+
+    if not default_storage.exists(path):
+        store_sitemap(path, render(base_url))
+    with default_storage.open(path) as f:
+        content = f.read()
+
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(content, content_type='text/xml')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(
+            gzip.GzipFile(fileobj=BytesIO(content)).read(),
+            content_type='text/xml'
+        )
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
 
 def main(request):
-    count = MDR._concept.objects.public().count()
-    list_range = range(1 + count // 1000)
-    return render(request, "aristotle_mdr/sitemaps/main.xml", {'range_list': list_range}, content_type='text/xml')
+    return serve_sitemap(request, sitemap_path(), render_sitemap_index)
 
 
 def page_range(request, page):
-    i = int(page)
-    items = MDR._concept.objects.public()[i * 1000:(i + 1) * 1000]
-    return render(request, "aristotle_mdr/sitemaps/page.xml", {'items': items}, content_type='text/xml')
+    page = int(page)
+    if page > last_sitemap_page():
+        raise Http404
+    return serve_sitemap(
+        request, sitemap_path(page),
+        lambda base_url: render_sitemap_page(page, base_url)
+    )
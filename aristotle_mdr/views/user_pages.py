@@ -15,7 +15,7 @@ from django.views.generic import DetailView, ListView
 
 from aristotle_mdr import forms as MDRForms
 from aristotle_mdr import models as MDR
-from aristotle_mdr.views.utils import paginated_list, paginated_workgroup_list
+from aristotle_mdr.views.utils import CursorPaginationMixin, paginated_list, paginated_workgroup_list
 
 
 def friendly_redirect_login(request):
@@ -264,7 +264,7 @@ class ReviewDetailsView(DetailView):
         return MDR.ReviewRequest.objects.visible(self.request.user)
 
 
-class CreatedItemsListView(ListView):
+class CreatedItemsListView(CursorPaginationMixin, ListView):
     paginate_by = 25
     template_name = "aristotle_mdr/user/sandbox.html"
 
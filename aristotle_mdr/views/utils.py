@@ -1,13 +1,23 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
-from django.db.models import Count, Q
+from django.db.models import Count, Max, Q
 from django.shortcuts import render
-from django.utils import timezone
+from django.utils import six, timezone, translation
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from django.db.models.functions import Lower
 
+import base64
+import collections
+import hashlib
+import json
+
+from aristotle_mdr import perms
+from aristotle_mdr.utils import item_page_cache_key
+
 
 paginate_sort_opts = {
     "mod_asc": ["modified"],
@@ -19,6 +29,164 @@ paginate_sort_opts = {
 }
 
 
+# The (sort key, descending) that a CursorPaginator seeks on for each of
+# the orderings in paginate_sort_opts.
+paginate_cursor_keys = {
+    "mod_asc": ("modified", False),
+    "mod_desc": ("modified", True),
+    "cre_asc": ("created", False),
+    "cre_desc": ("created", True),
+    "name_asc": (Lower("name"), False),
+    "name_desc": (Lower("name"), True),
+}
+
+
+def get_page_size(request, default=20):
+    """
+    Returns the number of items per page asked for in the ``pp`` parameter,
+    limited to the ``PAGINATION_MAX_PAGE_SIZE`` setting.
+    """
+    max_size = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('PAGINATION_MAX_PAGE_SIZE', 100)
+    try:
+        size = int(request.GET.get('pp', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, max_size))
+
+
+class CursorPage(collections.Sequence):
+    """
+    A page of items from a ``CursorPaginator``. It can be used in place of a
+    Django ``Page``, but links to other pages with ``next_cursor`` and
+    ``previous_cursor`` rather than page numbers.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page of %s items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.encode_cursor('n', self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.encode_cursor('p', self.object_list[0])
+
+
+class CursorPaginator(object):
+    """
+    Paginates a queryset by seeking past the sort key and primary key of the
+    item at the edge of the current page, instead of skipping over an offset,
+    so every page costs the same to load however deep it is.
+
+    Counting every item can cost more than loading a page, so ``count`` stops
+    at ``count_limit`` items (the ``PAGINATION_COUNT_LIMIT`` setting by
+    default) and ``count_is_exact`` says whether there may be more.
+    """
+    def __init__(self, queryset, sort_key, descending, per_page, count_limit=0):
+        if not isinstance(sort_key, six.string_types):
+            # Expressions are annotated so they can be filtered on and read back
+            queryset = queryset.annotate(_cursor_key=sort_key)
+            sort_key = '_cursor_key'
+        if count_limit == 0:
+            count_limit = getattr(settings, 'ARISTOTLE_SETTINGS', {}).get('PAGINATION_COUNT_LIMIT', 1000)
+        self.queryset = queryset
+        self.sort_key = sort_key
+        self.descending = descending
+        self.per_page = per_page
+        self.count_limit = count_limit
+
+    @cached_property
+    def count(self):
+        if self.count_limit is None:
+            return self.queryset.count()
+        return self.queryset.order_by()[:self.count_limit].count()
+
+    @property
+    def count_is_exact(self):
+        return self.count_limit is None or self.count < self.count_limit
+
+    def encode_cursor(self, direction, item):
+        value = getattr(item, self.sort_key)
+        data = json.dumps([direction, value, item.pk], default=lambda o: o.isoformat())
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, value, pk = json.loads(base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+            if self.sort_key != '_cursor_key':
+                value = self.queryset.model._meta.get_field(self.sort_key).to_python(value)
+        except Exception:
+            # Missing or mangled cursors start at the first page
+            return 'n', None
+        return direction, (value, pk)
+
+    def page(self, cursor=None):
+        direction, position = self.decode_cursor(cursor)
+        backwards = direction == 'p'
+        descending = self.descending != backwards
+
+        queryset = self.queryset
+        if position is not None:
+            value, pk = position
+            seek = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{'%s__%s' % (self.sort_key, seek): value}) |
+                Q(**{self.sort_key: value, 'pk__%s' % seek: pk})
+            )
+        order = '-' if descending else ''
+        queryset = queryset.order_by(order + self.sort_key, order + 'pk')
+
+        # Fetch one extra item to find out if there is another page after this one
+        items = list(queryset[:self.per_page + 1])
+        more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backwards:
+            items.reverse()
+            return CursorPage(items, self, has_next=True, has_previous=more)
+        return CursorPage(items, self, has_next=more, has_previous=position is not None)
+
+
+class CursorPaginationMixin(object):
+    """
+    Paginates a ``ListView`` ordered by one of ``paginate_sort_opts`` with a
+    ``CursorPaginator``. Views must set ``self.order`` in ``get_ordering``.
+    """
+    def get_paginate_by(self, queryset):
+        return get_page_size(self.request, self.paginate_by)
+
+    def paginate_queryset(self, queryset, page_size):
+        self.get_ordering()
+        sort_key, descending = paginate_cursor_keys.get(self.order, paginate_cursor_keys['name_asc'])
+        paginator = CursorPaginator(queryset, sort_key, descending, page_size)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
 @login_required
 def paginated_list(request, items, template, extra_context={}):
     if hasattr(items, 'select_subclasses'):
@@ -27,23 +195,11 @@ def paginated_list(request, items, template, extra_context={}):
     if sort_by not in paginate_sort_opts.keys():
         sort_by="mod_desc"
 
-    paginator = Paginator(
-        items.order_by(*paginate_sort_opts.get(sort_by)),
-        request.GET.get('pp', 20)  # per page
-    )
-
-    page = request.GET.get('page')
-    try:
-        items = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page.
-        items = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range (e.g. 9999), deliver last page of results.
-        items = paginator.page(paginator.num_pages)
+    sort_key, descending = paginate_cursor_keys[sort_by]
+    paginator = CursorPaginator(items, sort_key, descending, get_page_size(request))
     context = {
         'sort': sort_by,
-        'page': items,
+        'page': paginator.page(request.GET.get('cursor')),
         }
     context.update(extra_context)
     return render(request, template, context)
@@ -51,23 +207,9 @@ def paginated_list(request, items, template, extra_context={}):
 
 @login_required
 def paginated_reversion_list(request, items, template, extra_context={}):
-
-    paginator = Paginator(
-        items,
-        request.GET.get('pp', 20)  # per page
-    )
-
-    page = request.GET.get('page')
-    try:
-        items = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page.
-        items = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range (e.g. 9999), deliver last page of results.
-        items = paginator.page(paginator.num_pages)
+    paginator = CursorPaginator(items, 'date_created', True, get_page_size(request))
     context = {
-        'page': items,
+        'page': paginator.page(request.GET.get('cursor')),
         }
     context.update(extra_context)
     return render(request, template, context)
@@ -102,10 +244,7 @@ def paginated_workgroup_list(request, workgroups, template, extra_context={}):
         sort_field = opts
 
     qs = qs.order_by(direction + sort_field)
-    paginator = Paginator(
-        qs,
-        request.GET.get('pp', 20)  # per page
-    )
+    paginator = Paginator(qs, get_page_size(request))
 
     page = request.GET.get('page')
     try:
@@ -175,3 +314,60 @@ def generate_visibility_matrix(user):
                 ra_matrix['states'][s] = "hidden"
         matrix[ra.id] = ra_matrix
     return matrix
+
+
+def conditional_etag(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+
+def item_page_etag(request, *args, **kwargs):
+    """
+    ETag for pages about an item. It is built from the same generation counters
+    as the item page cache, so it costs no queries and changes whenever the
+    item, its statuses or the users permissions do.
+    """
+    iid = kwargs.get('iid', None)
+    if iid is None:
+        return None
+    return conditional_etag(item_page_cache_key(request, iid, 'etag'), request.get_full_path())
+
+
+def workgroup_etag(request, iid, *args, **kwargs):
+    from aristotle_mdr.models import _concept
+    state = _concept.objects.filter(workgroup=iid).aggregate(
+        modified=Max('modified'),
+        statuses=Max('statuses__modified'),
+        count=Count('pk', distinct=True),
+    )
+    keys = [('workgroup', iid)]
+    if request.user.is_authenticated():
+        keys.append(('user', request.user.pk))
+    generations = perms.get_generations(keys)
+    return conditional_etag(
+        request.user.pk, translation.get_language(), request.get_full_path(),
+        [generations[key] for key in keys], state
+    )
+
+
+def download_etag(request, download_type, iid=None):
+    """
+    ETag for item downloads, built from the generation counters of the item and
+    the items it refers to, and of the items they refer to in turn, as downloads
+    include details of both. Values and other parts of an item have no
+    timestamps, so downloads have no Last-Modified date. No ETag is given if
+    the user can't see the item, so a hidden item can't be found from a 304 response.
+    """
+    from aristotle_mdr.models import _concept, concept_page_dependencies
+    item = _concept.objects.filter(pk=iid).only('workgroup').first()
+    if item is None or not perms.user_can_view(request.user, item):
+        return None
+    included = [
+        key
+        for kind, pk in concept_page_dependencies(iid) if kind == 'concept'
+        for key in concept_page_dependencies(pk)
+    ]
+    generations = perms.get_generations(included)
+    return conditional_etag(
+        item_page_cache_key(request, iid, 'download'), request.get_full_path(),
+        sorted(generations.items())
+    )
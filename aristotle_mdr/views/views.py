@@ -13,6 +13,7 @@ from django.template.loader import select_template
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic import TemplateView
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 import reversion
 from reversion_compare.views import HistoryCompareDetailView
@@ -26,7 +27,7 @@ from aristotle_mdr.utils import cache_per_item_user, url_slugify_concept
 from aristotle_mdr import forms as MDRForms
 from aristotle_mdr import models as MDR
 from aristotle_mdr.utils import get_concepts_for_apps
-from aristotle_mdr.views.utils import generate_visibility_matrix
+from aristotle_mdr.views.utils import generate_visibility_matrix, item_page_etag
 
 from haystack.views import FacetedSearchView
 
@@ -104,9 +105,10 @@ def measure(request, iid, model_slug, name_slug):
     # return render_if_user_can_view(MDR.Measure, *args, **kwargs)
 
 
-@cache_per_item_user(ttl=300, cache_post=False)
+@condition(etag_func=item_page_etag)
+@cache_per_item_user(ttl=300)
 def render_if_condition_met(request, condition, objtype, iid, model_slug=None, name_slug=None, subpage=None):
-    item = get_object_or_404(objtype, pk=iid).item
+    item = get_object_or_404(objtype.objects.select_subclasses(), pk=iid)
     if item._meta.model_name != model_slug or not slugify(item.name).startswith(str(name_slug)):
         return redirect(url_slugify_concept(item))
     if not condition(request.user, item):
@@ -117,11 +119,14 @@ def render_if_condition_met(request, condition, objtype, iid, model_slug=None, n
         else:
             raise PermissionDenied
 
+    # Reload the item along with everything shown on its page
+    item = item.__class__.get_detail_queryset().get(pk=item.pk)
+
     # We add a user_can_edit flag in addition
     # to others as we have odd rules around who can edit objects.
     isFavourite = request.user.is_authenticated() and request.user.profile.is_favourite(item)
     from reversion.models import Version
-    last_edit = Version.objects.get_for_object(item).first()
+    last_edit = Version.objects.get_for_object(item).select_related('revision__user').first()
 
     default_template = "%s/concepts/%s.html" % (item.__class__._meta.app_label, item.__class__._meta.model_name)
     template = select_template([default_template, item.template])
@@ -138,6 +143,7 @@ def render_if_condition_met(request, condition, objtype, iid, model_slug=None, n
     return HttpResponse(template.render(context))
 
 
+@condition(etag_func=item_page_etag)
 def registrationHistory(request, iid):
     item = get_if_user_can_view(MDR._concept, request.user, iid)
     if not item:
@@ -324,13 +330,16 @@ def deprecate(request, iid):
             #  Everything that was in the returned set, but isn't already superseded
             #  Everything left over can stay the same, as its already superseded
             #    or wasn't superseded and is staying that way.
+            superseded = list(item.supersedes.all())
+            older_items = list(form.cleaned_data['olderItems'])
+            can_edit = perms.user_can_edit_many(request.user, superseded + older_items)
             with transaction.atomic(), reversion.revisions.create_revision():
                 reversion.revisions.set_user(request.user)
-                for i in item.supersedes.all():
-                    if i not in form.cleaned_data['olderItems'] and user_can_edit(request.user, i):
+                for i in superseded:
+                    if i not in older_items and can_edit[i.id]:
                         item.supersedes.remove(i)
-                for i in form.cleaned_data['olderItems']:
-                    if user_can_edit(request.user, i):  # Would check item.supersedes but its a set
+                for i in older_items:
+                    if can_edit[i.id]:  # Would check item.supersedes but its a set
                         item.supersedes.add(i)
             return HttpResponseRedirect(url_slugify_concept(item))
     else:
@@ -382,3 +391,12 @@ class PermissionSearchView(FacetedSearchView):
         form = super(self.__class__, self).build_form()
         form.request = self.request
         return form
+
+    def extra_context(self):
+        context = super(PermissionSearchView, self).extra_context()
+        # Fetched once, rather than checking each result against the users favourites
+        favourite_ids = set()
+        if self.request.user.is_authenticated():
+            favourite_ids = set(self.request.user.profile.favourites.values_list('pk', flat=True))
+        context['favourite_ids'] = favourite_ids
+        return context
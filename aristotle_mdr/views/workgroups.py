@@ -5,14 +5,16 @@ from django.core.urlresolvers import reverse
 from django.http import HttpResponseRedirect
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template.defaultfilters import slugify
+from django.views.decorators.http import condition
 
 from aristotle_mdr import models as MDR
 from aristotle_mdr import forms as MDRForms
-from aristotle_mdr.views.utils import paginated_list, workgroup_item_statuses
+from aristotle_mdr.views.utils import paginated_list, workgroup_etag, workgroup_item_statuses
 from aristotle_mdr.perms import user_in_workgroup, user_is_workgroup_manager
 
 
 @login_required
+@condition(etag_func=workgroup_etag)
 def workgroup(request, iid, name_slug):
     wg = get_object_or_404(MDR.Workgroup, pk=iid)
     if not slugify(wg.name).startswith(str(name_slug)):
@@ -31,6 +33,7 @@ def workgroup(request, iid, name_slug):
 
 
 @login_required
+@condition(etag_func=workgroup_etag)
 def items(request, iid):
     wg = get_object_or_404(MDR.Workgroup, pk=iid)
     if not user_in_workgroup(request.user, wg):
@@ -46,6 +49,7 @@ def items(request, iid):
 
 
 @login_required
+@condition(etag_func=workgroup_etag)
 def members(request, iid):
     wg = get_object_or_404(MDR.Workgroup, pk=iid)
     renderDict = {"item": wg, "workgroup": wg, "user_is_admin": user_is_workgroup_manager(request.user, wg)}